@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_snippet(snippet: Optional[str]) -> str:
+    """Collapse whitespace so formatting-only differences share a cache entry"""
+    return re.sub(r'\s+', ' ', snippet or '').strip()
+
+
+class TTLCache:
+    """Small in-process LRU with per-entry expiry"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SingleFlight:
+    """Concurrent calls for the same key share one running computation"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._tasks
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        self._tasks.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter gave up
+            task.exception()
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Await compute() for key, or join the call already running for it.
+
+        Exceptions propagate to every caller waiting on the key and are not
+        remembered once the call is done.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        # Shield so one caller timing out does not cancel the shared computation
+        return await asyncio.shield(task)
+
+
+class AnalysisCache:
+    """Two-tier, content-addressed cache for AI vulnerability analyses.
+
+    Tier one is an in-process TTL/LRU, tier two a Mongo collection. Concurrent
+    lookups for the same key share one in-flight computation.
+    """
+
+    def __init__(self, collection=None, maxsize: int = 1024, ttl: float = 7 * 24 * 3600):
+        self.memory = TTLCache(maxsize, ttl)
+        self.collection = collection
+        self.ttl = ttl
+        self._inflight = SingleFlight()
+        self.counters = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'coalesced': 0}
+
+    @staticmethod
+    def make_key(vuln_type: str, snippet: Optional[str], context: str, model: str, prompt_version: str) -> str:
+        payload = json.dumps([vuln_type, normalize_snippet(snippet), context, model, prompt_version])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        await self.collection.create_index('key', unique=True)
+        await self.collection.create_index('expires_at', expireAfterSeconds=0)
+
+    async def _db_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.collection is None:
+            return None
+        try:
+            doc = await self.collection.find_one({'key': key}, {'_id': 0, 'value': 1, 'expires_at': 1})
+        except Exception as e:
+            logger.warning(f"AI cache read failed: {e}")
+            return None
+        if not doc:
+            return None
+        expires_at = doc.get('expires_at')
+        if expires_at is not None:
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            if expires_at < datetime.now(timezone.utc):
+                return None
+        return doc['value']
+
+    async def _db_set(self, key: str, value: Dict[str, Any]):
+        if self.collection is None:
+            return
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.update_one(
+                {'key': key},
+                {'$set': {'value': value, 'created_at': now, 'expires_at': now + timedelta(seconds=self.ttl)}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"AI cache write failed: {e}")
+
+    async def _load(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]], count: bool) -> Dict[str, Any]:
+        value = await self._db_get(key)
+        if value is not None:
+            if count:
+                self.counters['db_hits'] += 1
+        else:
+            if count:
+                self.counters['misses'] += 1
+            value = await compute()
+            await self._db_set(key, value)
+        self.memory.set(key, value)
+        return value
+
+    async def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached value from either tier without computing anything"""
+        value = self.memory.get(key)
+        if value is not None:
+            self.counters['memory_hits'] += 1
+            return value
+        value = await self._db_get(key)
+        if value is not None:
+            self.counters['db_hits'] += 1
+            self.memory.set(key, value)
+            return value
+        self.counters['misses'] += 1
+        return None
+
+    async def store(self, key: str, value: Dict[str, Any]):
+        """Write a computed value to both tiers"""
+        self.memory.set(key, value)
+        await self._db_set(key, value)
+
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]], count: bool = True
+    ) -> Dict[str, Any]:
+        """Return the cached value for key, computing and storing it on a miss.
+
+        Exceptions from compute are not cached and propagate to every caller
+        waiting on the same key. count=False leaves the counters alone, for
+        a retry of a key that lookup already counted.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            if count:
+                self.counters['memory_hits'] += 1
+            return value
+
+        if count and key in self._inflight:
+            self.counters['coalesced'] += 1
+        return await self._inflight.run(key, lambda: self._load(key, compute, count))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = sum(self.counters.values())
+        hits = self.counters['memory_hits'] + self.counters['db_hits'] + self.counters['coalesced']
+        return {
+            **self.counters,
+            'memory_entries': len(self.memory),
+            'inflight': len(self._inflight),
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0
+        }
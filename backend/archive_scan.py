@@ -0,0 +1,212 @@
+import logging
+import tarfile
+import zipfile
+from concurrent.futures import Executor
+from pathlib import PurePosixPath
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from scan_executor import worker_engine
+
+logger = logging.getLogger(__name__)
+
+LANGUAGE_BY_EXTENSION = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.jsx': 'javascript',
+    '.mjs': 'javascript',
+    '.cjs': 'javascript',
+    '.ts': 'typescript',
+    '.tsx': 'typescript',
+    '.java': 'java',
+    '.go': 'go',
+    '.rb': 'ruby',
+    '.php': 'php',
+    '.cs': 'csharp',
+    '.c': 'c',
+    '.h': 'c',
+    '.cpp': 'cpp',
+    '.cc': 'cpp',
+    '.hpp': 'cpp',
+    '.kt': 'kotlin',
+    '.rs': 'rust',
+    '.swift': 'swift',
+    '.scala': 'scala',
+    '.sh': 'shell',
+    '.sql': 'sql',
+    '.html': 'html',
+    '.vue': 'javascript',
+    '.yml': 'yaml',
+    '.yaml': 'yaml',
+}
+
+# Files are handed to workers in chunks of roughly this many bytes
+CHUNK_BYTES = 1024 * 1024
+
+
+class ArchiveError(ValueError):
+    """Raised for archives that can't be read"""
+
+
+class ArchiveLimitError(ArchiveError):
+    """Raised when an archive exceeds a configured limit"""
+
+
+def detect_language(filename: str) -> Optional[str]:
+    """Guess the language from the file extension; None if unsupported"""
+    return LANGUAGE_BY_EXTENSION.get(PurePosixPath(filename).suffix.lower())
+
+
+def scan_files(
+    files: List[Tuple[str, str, str]],
+    deadline: Optional[float] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Scan (filename, language, text) tuples inside a scan_executor worker process.
+
+    Returns the findings and the engine's scan_info, merged over the files.
+    """
+    findings = []
+    scan_info: Dict[str, Any] = {'truncated_lines': 0, 'timed_out': False}
+    for filename, language, text in files:
+        file_info: Dict[str, Any] = {}
+        for finding in worker_engine().scan(text, scan_info=file_info, language=language, deadline=deadline):
+            finding['filename'] = filename
+            finding['language'] = language
+            findings.append(finding)
+        scan_info['truncated_lines'] += file_info.get('truncated_lines', 0)
+        scan_info['timed_out'] = scan_info['timed_out'] or file_info.get('timed_out', False)
+    return findings, scan_info
+
+
+def _read_limited(stream: BinaryIO, max_bytes: int) -> Optional[bytes]:
+    """Read at most max_bytes; None if the entry is larger than that"""
+    data = stream.read(max_bytes + 1)
+    return None if len(data) > max_bytes else data
+
+
+def iter_archive(
+    fileobj: BinaryIO,
+    archive_name: str,
+    max_file_bytes: int,
+    include: Callable[[str], bool] = lambda path: True,
+    max_entries: int = 0
+) -> Iterator[Tuple[str, Optional[bytes]]]:
+    """Yield (path, content) for each included regular file, one entry at a time.
+
+    Content is None for entries larger than max_file_bytes. Entry sizes
+    declared in the archive headers are not trusted; reads are capped.
+    Every regular file counts toward max_entries (0 for no limit), included
+    or not, so an archive of skipped entries can't be walked without end.
+    """
+    entries = 0
+
+    def count_entry():
+        nonlocal entries
+        entries += 1
+        if max_entries and entries > max_entries:
+            raise ArchiveLimitError(f"Archive contains more than {max_entries} files")
+
+    if archive_name.lower().endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                count_entry()
+                if not include(info.filename):
+                    continue
+                if info.file_size > max_file_bytes:
+                    yield info.filename, None
+                    continue
+                with archive.open(info) as member:
+                    yield info.filename, _read_limited(member, max_file_bytes)
+        return
+
+    # 'r|*' reads the tar as a forward-only stream, whatever the compression
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            count_entry()
+            if not include(member.name):
+                continue
+            if member.size > max_file_bytes:
+                yield member.name, None
+                continue
+            member_file = archive.extractfile(member)
+            if member_file is not None:
+                yield member.name, _read_limited(member_file, max_file_bytes)
+
+
+def scan_archive(
+    fileobj: BinaryIO,
+    archive_name: str,
+    executor: Executor,
+    max_files: int,
+    max_file_bytes: int,
+    max_total_bytes: int,
+    context_chars: int = 500,
+    scan_info: Optional[Dict[str, Any]] = None,
+    deadline: Optional[float] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, str], Dict[str, Any]]:
+    """Stream an archive and fan its source files out to executor.
+
+    Blocking; call it from a thread. Returns the findings in archive order,
+    the first context_chars of each scanned file (for AI context) and a
+    summary of scanned and skipped files. max_files counts every file in
+    the archive. All files share deadline (see RuleEngine.new_deadline);
+    their scan_info is merged into scan_info.
+    """
+    futures = []
+    chunk: List[Tuple[str, str, str]] = []
+    chunk_bytes = 0
+    scanned: Dict[str, str] = {}
+    contexts: Dict[str, str] = {}
+    skipped: List[Dict[str, str]] = []
+    total_bytes = 0
+
+    try:
+        for path, data in iter_archive(
+            fileobj, archive_name, max_file_bytes, include=lambda p: detect_language(p) is not None, max_entries=max_files
+        ):
+            language = detect_language(path)
+            if data is None:
+                skipped.append({'filename': path, 'reason': 'file too large'})
+                continue
+            if b'\0' in data[:8192]:
+                skipped.append({'filename': path, 'reason': 'binary file'})
+                continue
+            total_bytes += len(data)
+            if total_bytes > max_total_bytes:
+                raise ArchiveLimitError(f"Archive source files exceed {max_total_bytes} bytes")
+
+            text = data.decode('utf-8', errors='replace')
+            scanned[path] = language
+            contexts[path] = text[:context_chars]
+            chunk.append((path, language, text))
+            chunk_bytes += len(data)
+            if chunk_bytes >= CHUNK_BYTES:
+                futures.append(executor.submit(scan_files, chunk, deadline))
+                chunk, chunk_bytes = [], 0
+
+        if chunk:
+            futures.append(executor.submit(scan_files, chunk, deadline))
+
+        findings = []
+        for future in futures:
+            chunk_findings, chunk_info = future.result()
+            findings.extend(chunk_findings)
+            if scan_info is not None:
+                scan_info['truncated_lines'] = scan_info.get('truncated_lines', 0) + chunk_info['truncated_lines']
+                scan_info['timed_out'] = scan_info.get('timed_out', False) or chunk_info['timed_out']
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise ArchiveError(f"Unreadable archive: {e}")
+    finally:
+        for future in futures:
+            future.cancel()
+
+    summary = {
+        'files_scanned': len(scanned),
+        'bytes_scanned': total_bytes,
+        'languages': sorted(set(scanned.values())),
+        'skipped_files': skipped
+    }
+    return findings, contexts, summary
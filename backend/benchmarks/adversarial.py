@@ -0,0 +1,104 @@
+"""Matching time on adversarial single-line inputs, per pattern and backend.
+
+    python -m benchmarks.adversarial [--sizes 1000,10000,100000,500000]
+                                     [--max-re-bytes 20000] [--backends re,re2]
+                                     [--output results.json]
+
+For every pattern in SECURITY_RULES, builds one long line that makes a
+backtracking matcher work hard (see corpora.pathological_input) at each
+size and times the pattern on it alone with each backend, plus a full
+engine scan of a minified bundle. Python's re is only run up to
+--max-re-bytes, since quadratic patterns take minutes beyond that.
+
+A pattern whose time per byte grows more than --growth-limit times from
+the smallest to the largest size is reported as superlinear; the run exits
+with status 1 if any re2 pattern is, so this can gate CI.
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.common import configure_environment, run_metadata
+from benchmarks.corpora import generate_source, minify, pathological_input
+
+configure_environment()
+
+import server  # noqa: E402
+from rule_engine import RuleEngine, load_re2  # noqa: E402
+
+
+def time_search(compiled, text: str, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        compiled.search(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1000,10000,100000,500000')
+    parser.add_argument('--max-re-bytes', type=int, default=20000)
+    parser.add_argument('--backends', default='re,re2')
+    parser.add_argument('--growth-limit', type=float, default=4.0)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    backends = args.backends.split(',')
+    if 're2' in backends and load_re2() is None:
+        print("google-re2 is not installed; skipping the re2 backend")
+        backends.remove('re2')
+
+    samples = [line for code in server.SAMPLE_CODE.values() for line in code.split('\n')]
+    results = []
+    superlinear = []
+    for backend in backends:
+        # No line limit or budget: this measures the matcher itself
+        engine = RuleEngine(server.SECURITY_RULES, backend=backend, samples=samples)
+        for (rule_name, _, pattern, compiled), used in zip(engine.entries, engine.entry_backends):
+            per_byte = []
+            for size in sizes:
+                if backend == 're' and size > args.max_re_bytes:
+                    continue
+                text = pathological_input(pattern, size)
+                seconds = time_search(compiled, text)
+                per_byte.append(seconds / len(text))
+                results.append({
+                    'name': f'{backend}:{rule_name}:{pattern}:{size}',
+                    'backend': used,
+                    'bytes': len(text),
+                    'ms': round(seconds * 1000, 4)
+                })
+            growth = per_byte[-1] / per_byte[0] if len(per_byte) > 1 and per_byte[0] else 1.0
+            flag = ''
+            if growth > args.growth_limit:
+                flag = '  SUPERLINEAR'
+                if used == 're2':
+                    superlinear.append(f'{rule_name}:{pattern}')
+            print(f"{backend:4s} ({used:3s}) {rule_name + ':' + pattern:60s} "
+                  f"{results[-1]['ms']:10.3f} ms at {results[-1]['bytes']} bytes  growth x{growth:.1f}{flag}")
+
+        bundle = minify('javascript', generate_source('javascript', 15000))
+        started = time.perf_counter()
+        findings = engine.scan(bundle)
+        seconds = time.perf_counter() - started
+        results.append({'name': f'{backend}:minified-bundle', 'bytes': len(bundle), 'findings': len(findings), 'ms': round(seconds * 1000, 3)})
+        print(f"{backend:4s} minified bundle of {len(bundle)} bytes: {seconds * 1000:.1f} ms, {len(findings)} findings")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'benchmark': 'adversarial',
+                'metadata': run_metadata(),
+                'parameters': vars(args),
+                'results': results,
+                'superlinear_re2_patterns': superlinear
+            }, f, indent=2)
+    sys.exit(1 if superlinear else 0)
+
+
+if __name__ == '__main__':
+    main()
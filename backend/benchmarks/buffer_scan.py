@@ -0,0 +1,107 @@
+"""Memory and time of scanning a large upload as a string versus memory-mapped.
+
+    python -m benchmarks.buffer_scan [--sizes-mb 1,10,100] [--repeat 1]
+                                     [--output results.json]
+
+Writes a synthetic Python file of each size (the benchmark corpus plus
+Flask routes with and without an auth decorator) to a temporary file, then
+scans it with RuleEngine.scan on the decoded string and with
+RuleEngine.scan_buffer on an mmap of the file. Reports the best time and
+the peak memory allocated during the scan (tracemalloc, measured in a
+separate run since tracing slows matching), and the findings of the
+line-spanning MISSING_AUTH route pattern. tests/test_rule_engine.py checks
+that both scans find the same issues.
+"""
+import argparse
+import json
+import mmap
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import configure_environment, run_metadata
+from benchmarks.corpora import generate_source
+
+configure_environment()
+
+import server  # noqa: E402
+from rule_engine import RuleEngine  # noqa: E402
+
+
+def route_source(size_bytes: int) -> bytes:
+    """Benchmark corpus with a route every 100 lines, every third one behind login_required"""
+    block = generate_source('python', 100).split('\n')
+    parts = []
+    total = 0
+    n = 0
+    while total < size_bytes:
+        decorators = f"@app.route('/r{n}')\n" + ('@login_required\n' if n % 3 == 0 else '')
+        part = decorators + f'def route_{n}():\n' + '\n'.join(block) + '\n'
+        parts.append(part)
+        total += len(part)
+        n += 1
+    return ''.join(parts).encode('utf-8')
+
+
+def run(scan, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        scan_info = {}
+        started = time.perf_counter()
+        findings = scan(scan_info)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    scan({})
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes-mb', default='1,10,100')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    # No time budget: tracemalloc slows the scans down several times
+    engine = RuleEngine(server.SECURITY_RULES, **{**server.RULE_ENGINE.options(), 'time_budget': 0})
+    results = []
+    for size_mb in [float(size) for size in args.sizes_mb.split(',')]:
+        with tempfile.TemporaryFile() as f:
+            f.write(route_source(int(size_mb * 1024 * 1024)))
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                code = buffer[:].decode('utf-8')
+                string_seconds, string_peak, _ = run(
+                    lambda scan_info: engine.scan(code, scan_info=scan_info, language='python'), args.repeat
+                )
+                del code
+                seconds, peak, findings = run(
+                    lambda scan_info: engine.scan_buffer(buffer, scan_info=scan_info, language='python'), args.repeat
+                )
+        routes = sum(1 for finding in findings if finding['type'] == 'MISSING_AUTH')
+        results.append({
+            'size_mb': size_mb,
+            'findings': len(findings),
+            'missing_auth': routes,
+            'string': {'ms': round(string_seconds * 1000, 1), 'peak_mb': round(string_peak / 2 ** 20, 1)},
+            'buffer': {'ms': round(seconds * 1000, 1), 'peak_mb': round(peak / 2 ** 20, 1)}
+        })
+        print(f"{size_mb:7.1f} MB  {len(findings):7d} findings ({routes} MISSING_AUTH)  "
+              f"string {string_seconds * 1000:9.1f} ms {string_peak / 2 ** 20:8.1f} MB peak  "
+              f"mmap {seconds * 1000:9.1f} ms {peak / 2 ** 20:8.1f} MB peak")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'benchmark': 'buffer_scan',
+                'metadata': run_metadata(),
+                'parameters': vars(args),
+                'results': results
+            }, f, indent=2)
+    server.scan_executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks run from the backend directory, e.g.
+    python -m benchmarks.event_loop_latency
+and never talk to a real LLM or Mongo server (see memory_db).
+"""
+import os
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+
+def configure_environment():
+    """Point the app at the fake LLM before server is imported"""
+    os.environ.setdefault('LLM_BACKEND', 'fake')
+    os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    os.environ.setdefault('DB_NAME', 'benchmark')
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summary statistics in milliseconds"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+    return {
+        'count': len(ordered),
+        'mean': round(statistics.mean(ordered) * 1000, 3),
+        'p50': pick(0.50),
+        'p99': pick(0.99),
+        'max': round(ordered[-1] * 1000, 3)
+    }
+
+
+def run_metadata() -> Dict[str, Any]:
+    """Where and on what commit a benchmark ran, stored with its JSON results"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
@@ -0,0 +1,63 @@
+"""Compare two benchmark JSON files and flag slowdowns.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 1.2]
+
+Matches timings (ms, p50, p99, mean) by their path in the results and
+prints the candidate/baseline ratio of each. Exits with status 1 if any
+timing got slower by more than threshold, so it can gate CI.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict
+
+# Result fields that are durations, where larger is worse
+TIMING_FIELDS = {'ms', 'p50', 'p99', 'mean'}
+
+
+def flatten(results: Any, prefix: str = '') -> Dict[str, float]:
+    """{'detection/python-1000/ms': 1.2, ...}; list items are keyed by their name"""
+    timings = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            if key in TIMING_FIELDS and isinstance(value, (int, float)):
+                timings[f'{prefix}{key}'] = value
+            else:
+                timings.update(flatten(value, f'{prefix}{key}/'))
+    elif isinstance(results, list):
+        for index, item in enumerate(results):
+            name = item.get('name', item.get('mode', index)) if isinstance(item, dict) else index
+            timings.update(flatten(item, f'{prefix}{name}/'))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = flatten(json.load(f)['results'])
+    with open(args.candidate) as f:
+        candidate = flatten(json.load(f)['results'])
+
+    regressions = 0
+    for path in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[path], candidate[path]
+        ratio = after / before if before else float('inf') if after else 1.0
+        flag = ''
+        if ratio > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{path:60s} {before:10.3f} -> {after:10.3f}  x{ratio:.2f}{flag}")
+    for path in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{path:60s} only in {'baseline' if path in baseline else 'candidate'}")
+
+    print(f"{regressions} timing(s) slower than x{args.threshold}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Synthetic source files for the benchmarks.
+
+Everything is generated from a fixed seed, so the same arguments always
+give the same corpus and results stay comparable between commits.
+"""
+import random
+from typing import Dict, Iterator, List, Tuple
+
+# Ordinary lines that should not match any rule
+BENIGN_LINES = {
+    'python': [
+        'def handle_{n}(request):',
+        '    items = [item for item in request.items if item.active]',
+        '    total = sum(item.price * item.quantity for item in items)',
+        '    logger.info("processed %d items", len(items))',
+        '    if not items:',
+        '        return None',
+        '    return {{"total": total, "count": len(items)}}',
+        'class Service{n}(BaseService):',
+        '    timeout = 30',
+        '# Helper for batch {n}',
+        '',
+    ],
+    'javascript': [
+        'function handle{n}(req, res) {{',
+        '  const items = req.body.items.filter((item) => item.active);',
+        '  const total = items.reduce((sum, item) => sum + item.price, 0);',
+        '  console.log(`processed ${{items.length}} items`);',
+        '  if (!items.length) {{ return res.status(204).end(); }}',
+        '  res.json({{ total, count: items.length }});',
+        '}}',
+        'export const config{n} = {{ retries: 3, timeoutMs: 3000 }};',
+        '// helper for batch {n}',
+        '',
+    ],
+    'java': [
+        'public class Service{n} extends BaseService {{',
+        '    private final Repository repository;',
+        '    public List<Item> activeItems(Request request) {{',
+        '        return request.getItems().stream().filter(Item::isActive).collect(Collectors.toList());',
+        '    }}',
+        '    @Override',
+        '    public int timeout() {{ return 30; }}',
+        '}}',
+        '// helper for batch {n}',
+        '',
+    ],
+}
+
+# Lines that trigger rules, as found in real code
+VULNERABLE_LINES = {
+    'python': [
+        '    cursor.execute("SELECT * FROM users WHERE id = " + user_id)',
+        '    API_KEY = "sk-live-{n:08d}"',
+        '    data = pickle.loads(payload)',
+        '    digest = hashlib.md5(password.encode()).hexdigest()',
+        '    os.system("ping -c 1 " + host)',
+        '    with open("/srv/files/" + name) as f:',
+    ],
+    'javascript': [
+        '  element.innerHTML = req.query.name;',
+        '  const apiKey = "pk-live-{n:08d}";',
+        '  const result = eval(req.body.payload);',
+        '  fs.readFile("/srv/files/" + req.params.name, cb);',
+        "  app.get('/admin/users', (req, res) => res.json(db.all()));",
+    ],
+    'java': [
+        '        String query = "SELECT * FROM users WHERE id = \'" + userId + "\'";',
+        '        private static final String password = "hunter{n}";',
+        '        MessageDigest md = MessageDigest.getInstance("MD5");',
+        '        Runtime.getRuntime().exec(cmd + " --shell");',
+    ],
+}
+
+LANGUAGES = list(BENIGN_LINES)
+SIZES = [100, 1000, 10000, 100000]
+
+
+def generate_source(language: str, lines: int, vulnerable_every: int = 50, seed: int = 0) -> str:
+    """A file of the given length with a vulnerable line roughly every vulnerable_every lines"""
+    rng = random.Random(f'{language}-{lines}-{seed}')
+    benign = BENIGN_LINES[language]
+    vulnerable = VULNERABLE_LINES[language]
+    out = []
+    for n in range(lines):
+        if vulnerable_every and rng.randrange(vulnerable_every) == 0:
+            out.append(rng.choice(vulnerable).format(n=n))
+        else:
+            out.append(rng.choice(benign).format(n=n))
+    return '\n'.join(out)
+
+
+def minify(language: str, code: str) -> str:
+    """Collapse a file onto one line, as bundlers do for JavaScript"""
+    separator = ' ' if language == 'python' else ''
+    return separator.join(line.strip() for line in code.split('\n') if line.strip())
+
+
+def literal_prefix(pattern: str) -> str:
+    """Leading literal text of a regex, e.g. 'cursor.execute(' for r'cursor\\.execute\\(.*%'"""
+    prefix = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern):
+            if pattern[i + 1].isalnum():
+                break
+            prefix.append(pattern[i + 1])
+            i += 2
+            continue
+        if char in '.^$*+?{}[]()|':
+            break
+        prefix.append(char)
+        i += 1
+    # A quantifier after the last literal makes that character optional
+    if i < len(pattern) and pattern[i] in '*?{' and prefix:
+        prefix.pop()
+    return ''.join(prefix)
+
+
+def pathological_input(pattern: str, size: int) -> str:
+    """One long line that makes a backtracking engine work hard for pattern.
+
+    Repeats the pattern's literal prefix with padding and never supplies the
+    rest of the match, so every occurrence starts a match attempt that runs
+    to the end of the line and fails.
+    """
+    unit = (literal_prefix(pattern) or 'x') + ' ' * 8
+    return unit * max(1, size // len(unit))
+
+
+def pathological_inputs(rules: Dict[str, Dict], size: int) -> Iterator[Tuple[str, str, str]]:
+    """(rule name, pattern, input) for every pattern in rules"""
+    for rule_name, rule_data in rules.items():
+        for pattern in rule_data['patterns']:
+            yield rule_name, pattern, pathological_input(pattern, size)
+
+
+def standard_corpora(sizes: List[int] = SIZES) -> Iterator[Tuple[str, str, str]]:
+    """(name, language, code) for every language and size, plus a minified variant of each"""
+    for language in LANGUAGES:
+        for lines in sizes:
+            code = generate_source(language, lines)
+            yield f'{language}-{lines}', language, code
+            yield f'{language}-{lines}-minified', language, minify(language, code)
@@ -0,0 +1,88 @@
+"""Latency of cheap read endpoints while a large scan is running.
+
+    python -m benchmarks.event_loop_latency [--lines 50000] [--modes inline,thread,process,auto]
+
+For each scan executor mode, posts one large scan to /api/scan/analyze and
+polls /api/education/lessons and /api/ on a fixed schedule until it
+finishes, then reports p50/p99 of the read latencies. Latency is measured
+from when each read was due, so reads delayed by a blocked event loop are
+counted. With "inline" the scan blocks the loop and the reads queue behind it.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import configure_environment, percentiles
+
+configure_environment()
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+from memory_db import use_memory_database  # noqa: E402
+
+
+def build_code(lines: int) -> str:
+    sample = asyncio.run(server.get_sample_code())['python'].split('\n')
+    return '\n'.join(sample[i % len(sample)] for i in range(lines))
+
+
+async def measure(mode: str, code: str, read_paths):
+    server.scan_executor.mode = mode
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        # Warm up pools and caches so the first scan doesn't pay pool start-up
+        await client.post('/api/scan/analyze', json={
+            'code': code[:1000], 'language': 'python', 'project_context': 'bench', 'scan_profile': 'demo', 'use_cache': False
+        })
+
+        latencies = []
+        done = asyncio.Event()
+
+        async def reader(path):
+            due = time.perf_counter()
+            while not done.is_set():
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - due)
+                due += interval
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+
+        interval = 0.005
+        readers = [asyncio.create_task(reader(path)) for path in read_paths for _ in range(2)]
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        response = await client.post('/api/scan/analyze', json={
+            'code': code, 'language': 'python', 'project_context': 'bench', 'scan_profile': 'demo', 'use_cache': False
+        })
+        scan_seconds = time.perf_counter() - started
+        done.set()
+        await asyncio.gather(*readers)
+        response.raise_for_status()
+
+    return {'mode': mode, 'scan_ms': round(scan_seconds * 1000, 1), 'reads': percentiles(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--lines', type=int, default=50000)
+    parser.add_argument('--modes', default='inline,thread,process,auto')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    use_memory_database(server)
+    code = build_code(args.lines)
+    results = []
+    for mode in args.modes.split(','):
+        result = asyncio.run(measure(mode, code, ['/api/education/lessons', '/api/']))
+        print(f"{mode:8s} scan {result['scan_ms']:8.1f} ms  reads p50 {result['reads'].get('p50')} ms  p99 {result['reads'].get('p99')} ms  (n={result['reads']['count']})")
+        results.append(result)
+    server.scan_executor.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'lines': args.lines, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Cold-start cost of importing the API, with a budget that can gate CI.
+
+    python -m benchmarks.import_time [--module server] [--budget-ms 800]
+                                     [--repeat 5] [--top 15]
+                                     [--forbid emergentintegrations,motor,...]
+                                     [--output results.json]
+
+Imports --module in fresh interpreters under python -X importtime, with
+the real LLM backend selected, and reports the median cumulative import
+time, the wall-clock time of the whole interpreter run and the heaviest
+imports. The LLM stack and the Mongo driver must load lazily (on the first
+AI call and in the app's lifespan hook), so importing any --forbid module
+is a failure. Exits with status 1 if the median import time exceeds
+--budget-ms or a forbidden module was imported.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.common import run_metadata
+
+# Heavy dependencies that must not be loaded by importing the app
+FORBIDDEN = [
+    'emergentintegrations', 'litellm', 'openai', 'google.genai', 'google.generativeai',
+    'boto3', 'huggingface_hub', 'motor', 'pymongo'
+]
+
+
+def import_once(module: str) -> Tuple[float, Dict[str, Tuple[int, int]]]:
+    """Wall-clock seconds of one interpreter run, and {module: (self us, cumulative us)}"""
+    env = {
+        **os.environ,
+        'LLM_BACKEND': 'emergent',
+        'MONGO_URL': os.environ.get('MONGO_URL', 'mongodb://localhost:27017'),
+        'DB_NAME': os.environ.get('DB_NAME', 'benchmark')
+    }
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+
+    imports = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports[name.strip()] = (int(self_us), int(cumulative_us))
+    return elapsed, imports
+
+
+def forbidden_imports(imports: Dict[str, Tuple[int, int]], forbid: List[str]) -> List[str]:
+    return sorted(name for name in imports if any(name == f or name.startswith(f + '.') for f in forbid))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--module', default='server')
+    parser.add_argument('--budget-ms', type=float, default=800)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--forbid', default=','.join(FORBIDDEN))
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    forbid = [name for name in args.forbid.split(',') if name]
+    runs = [import_once(args.module) for _ in range(args.repeat)]
+    module_ms = [imports[args.module][1] / 1000 for _, imports in runs]
+    wall_ms = [elapsed * 1000 for elapsed, _ in runs]
+    imports = runs[-1][1]
+    loaded = forbidden_imports(imports, forbid)
+
+    print(f"import {args.module}: median {statistics.median(module_ms):.1f} ms "
+          f"(min {min(module_ms):.1f}, max {max(module_ms):.1f}), interpreter wall {statistics.median(wall_ms):.1f} ms")
+    heaviest = sorted(imports.items(), key=lambda item: item[1][1], reverse=True)
+    top_level = [(name, times) for name, times in heaviest if '.' not in name and name != args.module][:args.top]
+    for name, (self_us, cumulative_us) in top_level:
+        print(f"  {name:40s} {cumulative_us / 1000:8.1f} ms cumulative  {self_us / 1000:8.1f} ms self")
+    for name in loaded:
+        print(f"FORBIDDEN import: {name}")
+
+    over_budget = statistics.median(module_ms) > args.budget_ms
+    if over_budget:
+        print(f"Import time over budget: {statistics.median(module_ms):.1f} ms > {args.budget_ms} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'benchmark': 'import_time',
+                'metadata': run_metadata(),
+                'parameters': vars(args),
+                'results': {
+                    'import': {'ms': round(statistics.median(module_ms), 2)},
+                    'interpreter': {'ms': round(statistics.median(wall_ms), 2)},
+                    'top_imports': [
+                        {'name': name, 'ms': round(cumulative_us / 1000, 2)} for name, (_, cumulative_us) in top_level
+                    ]
+                },
+                'forbidden_imports': loaded
+            }, f, indent=2)
+    sys.exit(1 if over_budget or loaded else 0)
+
+
+if __name__ == '__main__':
+    main()
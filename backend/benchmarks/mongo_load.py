@@ -0,0 +1,157 @@
+"""Read latency of scan lookups against a local mongod with many stored scans.
+
+    python -m benchmarks.mongo_load [--docs 1000000] [--layout embedded|split]
+                                    [--requests 5000] [--concurrency 50]
+                                    [--no-indexes] [--output results.json]
+
+Needs a running mongod at MONGO_URL (default mongodb://localhost:27017).
+Seeds BENCH_DB_NAME (default secure_review_bench_<layout>) once with
+synthetic scans shaped like real ones, then times the three read paths the
+API uses: the full scan, the compliance projection and the attack
+simulation projection. --no-indexes drops the scan indexes first to show
+the unindexed baseline; expect it to be orders of magnitude slower.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from benchmarks.common import percentiles
+from scan_store import ScanStore
+
+TYPES = [
+    ('SQL_INJECTION', 'Critical'), ('XSS', 'High'), ('HARDCODED_SECRET', 'Critical'),
+    ('WEAK_CRYPTO', 'Medium'), ('PATH_TRAVERSAL', 'High'), ('MISSING_AUTH', 'High')
+]
+EXPLANATION = ('This code builds a query from untrusted input, which lets an attacker change its meaning. ' * 6).strip()
+
+
+def make_scan(i: int, started: datetime):
+    rng = random.Random(i)
+    vulnerabilities = []
+    for n in range(rng.randint(0, 12)):
+        vuln_type, severity = rng.choice(TYPES)
+        vulnerabilities.append({
+            'id': f'bench-{i}-{n}',
+            'type': vuln_type,
+            'severity': severity,
+            'title': vuln_type.replace('_', ' ').title(),
+            'description': 'A03:2021 - Injection',
+            'filename': 'app.py',
+            'line_number': rng.randint(1, 2000),
+            'code_snippet': 'cursor.execute("SELECT * FROM users WHERE id = " + user_id)',
+            'ai_explanation': EXPLANATION,
+            'confidence_score': 0.88,
+            'policy_mappings': ['A03:2021 - Injection'],
+            'recommendation': 'Use parameterized queries.'
+        })
+    counts = {s: sum(1 for v in vulnerabilities if v['severity'] == s) for s in ('Critical', 'High', 'Medium', 'Low')}
+    timestamp = started - timedelta(seconds=i)
+    return {
+        'id': f'bench-{i}',
+        'scan_id': f'bench-{i:07d}',
+        'timestamp': timestamp.isoformat(),
+        'created_at': timestamp,
+        'language': rng.choice(['python', 'javascript', 'java']),
+        'project_context': rng.choice(['banking', 'healthcare', 'government', 'retail']),
+        'scan_profile': rng.choice(['full', 'quick', 'demo']),
+        'total_issues': len(vulnerabilities),
+        'critical_count': counts['Critical'],
+        'high_count': counts['High'],
+        'medium_count': counts['Medium'],
+        'low_count': counts['Low'],
+        'risk_score': min(100, counts['Critical'] * 10 + counts['High'] * 5 + counts['Medium'] * 2),
+        'deployment_ready': counts['Critical'] == 0 and counts['High'] <= 2,
+        'status': 'complete',
+        'vulnerabilities': vulnerabilities
+    }
+
+
+async def seed(db, docs: int, layout: str, batch: int = 5000):
+    existing = await db.scans.estimated_document_count()
+    if existing >= docs:
+        print(f"Using {existing} existing scans")
+        return
+    started = datetime.now(timezone.utc)
+    print(f"Seeding {docs - existing} scans ({layout} layout)...")
+    for offset in range(existing, docs, batch):
+        scans = [make_scan(i, started) for i in range(offset, min(docs, offset + batch))]
+        if layout == 'split':
+            vulnerabilities = [
+                {**vuln, 'scan_id': scan['scan_id'], 'position': n}
+                for scan in scans
+                for n, vuln in enumerate(scan.pop('vulnerabilities'))
+            ]
+            for scan in scans:
+                scan['storage_layout'] = 'split'
+            if vulnerabilities:
+                await db.vulnerabilities.insert_many(vulnerabilities, ordered=False)
+        await db.scans.insert_many(scans, ordered=False)
+
+
+async def time_reads(store: ScanStore, docs: int, requests: int, concurrency: int, fields):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        scan_id = f'bench-{random.randrange(docs):07d}'
+        async with semaphore:
+            started = time.perf_counter()
+            doc = await store.get_scan(scan_id, fields)
+            latencies.append(time.perf_counter() - started)
+            assert doc is not None, scan_id
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {**percentiles(latencies), 'throughput_rps': round(requests / elapsed, 1)}
+
+
+async def run(args):
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('BENCH_DB_NAME', f'secure_review_bench_{args.layout}')]
+    store = ScanStore(db, layout=args.layout)
+
+    await seed(db, args.docs, args.layout)
+    if args.no_indexes:
+        await db.scans.drop_indexes()
+        await db.vulnerabilities.drop_indexes()
+    else:
+        await store.ensure_indexes()
+
+    paths = {
+        'full_scan': None,
+        'compliance_projection': ['critical_count', 'high_count', 'vulnerabilities.type'],
+        'attack_projection': ['vulnerabilities.type']
+    }
+    results = {}
+    for name, fields in paths.items():
+        results[name] = await time_reads(store, args.docs, args.requests, args.concurrency, fields)
+        print(f"{name:24s} p50 {results[name]['p50']:8.3f} ms  p99 {results[name]['p99']:8.3f} ms  {results[name]['throughput_rps']} req/s")
+    client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--docs', type=int, default=1_000_000)
+    parser.add_argument('--layout', choices=['embedded', 'split'], default='embedded')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--no-indexes', action='store_true')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'docs': args.docs, 'layout': args.layout, 'indexes': not args.no_indexes, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
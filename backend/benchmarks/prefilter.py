@@ -0,0 +1,99 @@
+"""How much faster the literal prefilter makes scans than the unfiltered engine.
+
+    python -m benchmarks.prefilter [--sizes 100,1000,10000,100000]
+                                   [--pathological-size 5000] [--repeat 3]
+                                   [--backends re,re2] [--output results.json]
+
+Scans the shared corpora (standard_corpora, an adversarial line for every
+pattern, and the demo samples) with a RuleEngine built with and without
+literal_prefilter, for each backend, and reports the share of lines the
+prefilter hands to a regex. tests/test_rule_engine.py checks that both
+engines find the same issues.
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import configure_environment, run_metadata
+from benchmarks.corpora import SIZES, pathological_inputs, standard_corpora
+
+configure_environment()
+
+import server  # noqa: E402
+from rule_engine import RuleEngine, load_re2  # noqa: E402
+
+
+def shared_corpus(sizes, pathological_size: int):
+    """(name, language, code) tuples every engine variant is timed on"""
+    corpus = list(standard_corpora(sizes))
+    corpus.extend((f'pathological-{rule_name}:{pattern}', None, code)
+                  for rule_name, pattern, code in pathological_inputs(server.SECURITY_RULES, pathological_size))
+    corpus.extend((f'sample-{language}', language, code) for language, code in server.SAMPLE_CODE.items())
+    return corpus
+
+
+def timed_scan(engine: RuleEngine, code: str, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        scan_info = {}
+        started = time.perf_counter()
+        findings = engine.scan(code, scan_info=scan_info)
+        best = min(best, time.perf_counter() - started)
+    return best, findings, scan_info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES))
+    parser.add_argument('--pathological-size', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--backends', default='re,re2')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    backends = args.backends.split(',')
+    if 're2' in backends and load_re2() is None:
+        print("google-re2 is not installed; skipping the re2 backend")
+        backends.remove('re2')
+
+    corpus = shared_corpus(sizes, args.pathological_size)
+    options = server.RULE_ENGINE.options()
+    results = []
+    for backend in backends:
+        engines = {
+            prefilter: RuleEngine(server.SECURITY_RULES, **{**options, 'backend': backend, 'time_budget': 0, 'literal_prefilter': prefilter})
+            for prefilter in (False, True)
+        }
+        filtered = engines[True]
+        print(f"{backend}: {len(filtered.entries) - len(filtered.unfiltered)} of {len(filtered.entries)} patterns "
+              f"prefiltered on {len(filtered.literals)} literals")
+        for name, language, code in corpus:
+            lines = code.split('\n')
+            plain_seconds, _, _ = timed_scan(engines[False], code, args.repeat)
+            seconds, findings, _ = timed_scan(filtered, code, args.repeat)
+            candidates = len(filtered._candidates(lines, filtered.select()))
+            results.append({
+                'name': f'{backend}:{name}',
+                'lines': len(lines),
+                'candidate_lines': candidates,
+                'findings': len(findings),
+                'unfiltered_ms': round(plain_seconds * 1000, 3),
+                'ms': round(seconds * 1000, 3)
+            })
+            print(f"{backend:4s} {name[:40]:40s} {candidates:7d}/{len(lines):<7d} lines  "
+                  f"{plain_seconds * 1000:10.2f} -> {seconds * 1000:8.2f} ms  x{plain_seconds / seconds if seconds else 0:.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'benchmark': 'prefilter',
+                'metadata': run_metadata(),
+                'parameters': vars(args),
+                'results': results
+            }, f, indent=2)
+    server.scan_executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
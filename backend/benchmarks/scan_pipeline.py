@@ -0,0 +1,151 @@
+"""Throughput of rule detection and latency of /api/scan/analyze on synthetic corpora.
+
+    python -m benchmarks.scan_pipeline [--sizes 100,1000,10000,100000]
+                                       [--pathological-size 20000] [--repeat 3]
+                                       [--requests 20] [--concurrency 4]
+                                       [--llm-latency 0.05] [--e2e-lines 1000]
+                                       [--skip-e2e] [--output results.json]
+
+Three sections:
+  detection     detect_vulnerabilities on python/javascript/java files of
+                each size, plus a minified single-line variant of each
+  pathological  detect_vulnerabilities on an adversarial line for every
+                pattern in SECURITY_RULES
+  end_to_end    /api/scan/analyze through the ASGI app, with the fake LLM
+                client (--llm-latency seconds per call) and the in-memory
+                Mongo stand-in; "cold" sends different code every request,
+                "warm" repeats one file so the AI analysis cache answers
+
+Compare two runs with python -m benchmarks.compare old.json new.json.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import configure_environment, percentiles, run_metadata
+from benchmarks.corpora import LANGUAGES, SIZES, generate_source, pathological_inputs, standard_corpora
+
+configure_environment()
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+from memory_db import use_memory_database  # noqa: E402
+
+
+def best_of(repeat: int, fn, *args):
+    """Fastest of repeat runs in seconds, and the last result"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def bench_detection(sizes, repeat: int):
+    results = []
+    for name, language, code in standard_corpora(sizes):
+        seconds, findings = best_of(repeat, server.detect_vulnerabilities, code, language)
+        size = len(code.encode('utf-8'))
+        results.append({
+            'name': name,
+            'lines': code.count('\n') + 1,
+            'bytes': size,
+            'findings': len(findings),
+            'ms': round(seconds * 1000, 3),
+            'mb_per_s': round(size / seconds / 1e6, 2) if seconds else None
+        })
+        print(f"detection     {name:28s} {results[-1]['ms']:10.2f} ms  {results[-1]['mb_per_s']} MB/s  {len(findings)} findings")
+    return results
+
+
+def bench_pathological(size: int, repeat: int):
+    results = []
+    for rule_name, pattern, code in pathological_inputs(server.SECURITY_RULES, size):
+        seconds, findings = best_of(repeat, server.detect_vulnerabilities, code, 'python')
+        results.append({
+            'name': f'{rule_name}:{pattern}',
+            'bytes': len(code),
+            'findings': len(findings),
+            'ms': round(seconds * 1000, 3)
+        })
+        print(f"pathological  {results[-1]['name'][:40]:40s} {results[-1]['ms']:10.2f} ms")
+    return results
+
+
+async def bench_end_to_end(requests: int, concurrency: int, lines: int):
+    transport = httpx.ASGITransport(app=server.app)
+    semaphore = asyncio.Semaphore(concurrency)
+    warm_code = generate_source('python', lines, vulnerable_every=20)
+    results = {}
+
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        async def post(code):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post('/api/scan/analyze', json={
+                    'code': code, 'language': 'python', 'project_context': 'bench',
+                    'scan_profile': 'full', 'use_cache': False
+                })
+                response.raise_for_status()
+                return time.perf_counter() - started
+
+        for scenario in ('cold', 'warm'):
+            calls_before = server.llm_client.calls
+            if scenario == 'cold':
+                codes = [generate_source('python', lines, vulnerable_every=20, seed=i + 1) for i in range(requests)]
+            else:
+                await post(warm_code)
+                calls_before = server.llm_client.calls
+                codes = [warm_code] * requests
+            started = time.perf_counter()
+            latencies = await asyncio.gather(*(post(code) for code in codes))
+            elapsed = time.perf_counter() - started
+            results[scenario] = {
+                **percentiles(latencies),
+                'throughput_rps': round(requests / elapsed, 2),
+                'llm_calls': server.llm_client.calls - calls_before
+            }
+            print(f"end_to_end    {scenario:28s} p50 {results[scenario]['p50']:8.1f} ms  p99 {results[scenario]['p99']:8.1f} ms  "
+                  f"{results[scenario]['throughput_rps']} req/s  {results[scenario]['llm_calls']} LLM calls")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES))
+    parser.add_argument('--pathological-size', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--llm-latency', type=float, default=0.05)
+    parser.add_argument('--e2e-lines', type=int, default=1000)
+    parser.add_argument('--skip-e2e', action='store_true')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = {
+        'detection': bench_detection(sizes, args.repeat),
+        'pathological': bench_pathological(args.pathological_size, args.repeat)
+    }
+    if not args.skip_e2e:
+        use_memory_database(server)
+        server.llm_client.latency = args.llm_latency
+        results['end_to_end'] = asyncio.run(bench_end_to_end(args.requests, args.concurrency, args.e2e_lines))
+    server.scan_executor.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'benchmark': 'scan_pipeline',
+                'metadata': run_metadata(),
+                'parameters': {**vars(args), 'languages': LANGUAGES},
+                'results': results
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""LLM calls and latency of /api/secure-fix under repeated and concurrent page loads.
+
+    python -m benchmarks.secure_fix [--findings 20] [--loads 10]
+                                    [--concurrency 5] [--llm-latency 0.5]
+                                    [--output results.json]
+
+Stores one scan with --findings findings (half of them sharing a snippet
+with another finding), then loads the fix of every finding --loads times,
+--concurrency loads of the same finding at once, through the ASGI app with
+the fake LLM client and the in-memory Mongo stand-in:
+  uncached  one LLM call per load, as generating each fix on request would
+  cold      empty caches: concurrent loads share a call, later ones hit the cache
+  restart   in-process cache cleared, fixes read back from Mongo
+  open      in-process cache cleared, circuit breaker open: cached fixes
+            are still served, nothing falls back to a template
+Reports LLM calls, template fallbacks and load latency for each phase;
+tests/test_secure_fix.py checks the caching behaviour itself.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import configure_environment, percentiles, run_metadata
+
+configure_environment()
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+from memory_db import use_memory_database  # noqa: E402
+from secure_fix import FIX_FIELDS, FIX_SCAN_FIELDS  # noqa: E402
+
+
+async def store_scan(findings: int) -> list:
+    vulnerabilities = [
+        server.to_vulnerability(
+            {
+                'type': 'SQL_INJECTION',
+                'severity': 'Critical',
+                'title': 'SQL Injection',
+                'line_number': n + 1,
+                # Pairs of findings share a snippet
+                'code_snippet': f'query = "SELECT * FROM t{n // 2} WHERE id = " + request.args["id"]',
+                'owasp': 'A03:2021 - Injection'
+            },
+            server.fallback_analysis({'title': 'SQL Injection'}),
+            'bench.py'
+        )
+        for n in range(findings)
+    ]
+    result = server.scan_result('bench', 'python', 'bench', 'full', vulnerabilities)
+    await server.scan_store.insert_scan(server.scan_document(result))
+    return [v['id'] for v in result['vulnerabilities']]
+
+
+async def uncached_fix(vulnerability_id: str):
+    """Load the finding and generate its fix on every request"""
+    vuln, scan = await server.scan_store.find_vulnerability(vulnerability_id, FIX_FIELDS, FIX_SCAN_FIELDS)
+    return await server.secure_fixes._generate(vuln, scan)
+
+
+async def load_all(ids, loads: int, concurrency: int, fetch):
+    latencies = []
+    fallbacks = 0
+
+    async def one(vulnerability_id):
+        nonlocal fallbacks
+        started = time.perf_counter()
+        fix = await fetch(vulnerability_id)
+        latencies.append(time.perf_counter() - started)
+        fallbacks += bool(fix.get('fallback'))
+
+    calls_before = server.llm_client.calls
+    started = time.perf_counter()
+    for _ in range(loads // concurrency or 1):
+        for vulnerability_id in ids:
+            await asyncio.gather(*(one(vulnerability_id) for _ in range(concurrency)))
+    return {
+        'seconds': round(time.perf_counter() - started, 3),
+        'llm_calls': server.llm_client.calls - calls_before,
+        'fallbacks': fallbacks,
+        'latency_ms': percentiles(latencies)
+    }
+
+
+async def run(args):
+    use_memory_database(server)
+    server.llm_client.latency = args.llm_latency
+    ids = await store_scan(args.findings)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        async def fetch(vulnerability_id):
+            response = await client.get(f'/api/secure-fix/{vulnerability_id}')
+            response.raise_for_status()
+            return response.json()
+
+        results = {'uncached': await load_all(ids, args.loads, args.concurrency, uncached_fix)}
+        results['cold'] = await load_all(ids, args.loads, args.concurrency, fetch)
+        server.fix_cache.memory._data.clear()
+        results['restart'] = await load_all(ids, args.loads, args.concurrency, fetch)
+        server.fix_cache.memory._data.clear()
+        allow = server.llm_scheduler.breaker.allow
+        server.llm_scheduler.breaker.allow = lambda: False
+        try:
+            results['open'] = await load_all(ids, args.loads, args.concurrency, fetch)
+        finally:
+            server.llm_scheduler.breaker.allow = allow
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--findings', type=int, default=20)
+    parser.add_argument('--loads', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    for name, row in results.items():
+        print(f"{name:9s} {row['llm_calls']:5d} LLM calls  {row['fallbacks']:5d} templates  "
+              f"p50 {row['latency_ms']['p50']:8.1f} ms  p99 {row['latency_ms']['p99']:8.1f} ms  {row['seconds']:7.2f} s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'benchmark': 'secure_fix',
+                'metadata': run_metadata(),
+                'parameters': vars(args),
+                'results': results
+            }, f, indent=2)
+    server.scan_executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Cost of turning enriched findings into a stored scan and a response body.
+
+    python -m benchmarks.serialization [--findings 100,1000,10000,50000]
+                                       [--repeat 3] [--output results.json]
+
+For each size, builds a scan from synthetic findings and AI analyses twice:
+  pydantic  a VulnerabilityIssue per finding, a ScanResult, model_dump for
+            Mongo, then validation and JSON serialization against
+            response_model=ScanResult as FastAPI does for returned models
+  lean      the Vulnerability records and scan dict of scan_records, the
+            storage document, and the body as json_response encodes it
+            (chunked above RESPONSE_STREAM_FINDINGS vulnerabilities)
+Reports the best time and the peak memory allocated (tracemalloc) of each.
+tests/test_scan_records.py checks that the two bodies match.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.common import configure_environment, run_metadata
+
+configure_environment()
+
+from pydantic import TypeAdapter  # noqa: E402
+
+import server  # noqa: E402
+from scan_records import encode_json, iter_json  # noqa: E402
+
+
+def synthetic_findings(count: int):
+    rules = list(server.SECURITY_RULES.items())
+    findings, analyses = [], []
+    for n in range(count):
+        rule_name, rule = rules[n % len(rules)]
+        findings.append({
+            'type': rule_name,
+            'severity': rule['severity'],
+            'title': rule['description'],
+            'line_number': n + 1,
+            'code_snippet': f'value_{n} = request.args.get("q") + " ORDER BY id"',
+            'owasp': rule['owasp']
+        })
+        analyses.append({
+            'ai_explanation': f'Finding {n}: user input reaches a sensitive sink without validation. ' * 3,
+            'confidence_score': 0.85,
+            'recommendation': 'Validate and encode untrusted input before use.'
+        })
+    return findings, analyses
+
+
+def pydantic_path(findings, analyses) -> bytes:
+    issues = [
+        server.VulnerabilityIssue(
+            type=vuln['type'],
+            severity=vuln['severity'],
+            title=vuln['title'],
+            description=vuln.get('owasp', ''),
+            filename='bench.py',
+            line_number=vuln.get('line_number'),
+            code_snippet=vuln.get('code_snippet'),
+            ai_explanation=ai_analysis['ai_explanation'],
+            confidence_score=ai_analysis['confidence_score'],
+            policy_mappings=[vuln.get('owasp', 'Security Issue')],
+            recommendation=ai_analysis['recommendation']
+        )
+        for vuln, ai_analysis in zip(findings, analyses)
+    ]
+    result = server.ScanResult(
+        scan_id='bench', language='python', project_context='bench', scan_profile='full',
+        vulnerabilities=issues, **server.summarize_vulnerabilities(issues)
+    )
+    doc = result.model_dump()
+    doc['timestamp'] = doc['timestamp'].isoformat()
+    adapter = TypeAdapter(server.ScanResult)
+    content = adapter.dump_python(adapter.validate_python(result), mode='json')
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf-8')
+
+
+def lean_path(findings, analyses) -> bytes:
+    vulnerabilities = [server.to_vulnerability(vuln, ai_analysis, 'bench.py') for vuln, ai_analysis in zip(findings, analyses)]
+    result = server.scan_result('bench', 'python', 'bench', 'full', vulnerabilities)
+    server.scan_document(result)
+    if server.RESPONSE_STREAM_FINDINGS and len(vulnerabilities) > server.RESPONSE_STREAM_FINDINGS:
+        return b''.join(iter_json(result, 500))
+    return encode_json(result)
+
+
+def measure(path, findings, analyses, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = path(findings, analyses)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    path(findings, analyses)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--findings', default='100,1000,10000,50000')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    for count in [int(n) for n in args.findings.split(',')]:
+        findings, analyses = synthetic_findings(count)
+        row = {'findings': count}
+        bodies = {}
+        for name, path in (('pydantic', pydantic_path), ('lean', lean_path)):
+            seconds, peak, bodies[name] = measure(path, findings, analyses, args.repeat)
+            row[name] = {'ms': round(seconds * 1000, 2), 'peak_mb': round(peak / 2 ** 20, 2)}
+        row['bytes'] = len(bodies['lean'])
+        results.append(row)
+        print(f"{count:7d} findings  pydantic {row['pydantic']['ms']:9.2f} ms {row['pydantic']['peak_mb']:8.2f} MB  "
+              f"lean {row['lean']['ms']:9.2f} ms {row['lean']['peak_mb']:8.2f} MB  "
+              f"x{row['pydantic']['ms'] / row['lean']['ms'] if row['lean']['ms'] else 0:.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'benchmark': 'serialization',
+                'metadata': run_metadata(),
+                'parameters': vars(args),
+                'results': results
+            }, f, indent=2)
+    server.scan_executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
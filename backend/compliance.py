@@ -0,0 +1,55 @@
+from collections import Counter
+from typing import Any, Dict, Iterable
+
+# OWASP categories in the report: (key, status when flagged, types that flag it, types counted as issues)
+OWASP_CATEGORIES = [
+    ('A01_Broken_Access_Control', 'warn', {'MISSING_AUTH'}, {'MISSING_AUTH', 'PATH_TRAVERSAL'}),
+    ('A02_Cryptographic_Failures', 'warn', {'WEAK_CRYPTO'}, {'WEAK_CRYPTO'}),
+    ('A03_Injection', 'fail', {'SQL_INJECTION', 'XSS', 'COMMAND_INJECTION'}, {'SQL_INJECTION', 'XSS', 'COMMAND_INJECTION'}),
+    ('A07_Auth_Failures', 'fail', {'HARDCODED_SECRET'}, {'HARDCODED_SECRET'}),
+    ('A08_Data_Integrity_Failures', 'warn', {'INSECURE_DESERIALIZATION'}, {'INSECURE_DESERIALIZATION'}),
+]
+
+
+def build_compliance_report(vulnerability_types: Iterable[str], critical: int, high: int) -> Dict[str, Any]:
+    """OWASP / ISO 27001 / NIST / GDPR report for a scan, in one pass over its findings"""
+    type_counts = Counter(vulnerability_types)
+
+    owasp_mapping = {}
+    for key, flagged_status, flagging, counted in OWASP_CATEGORIES:
+        owasp_mapping[key] = {
+            "status": flagged_status if any(type_counts[t] for t in flagging) else "pass",
+            "issues": sum(type_counts[t] for t in counted)
+        }
+    passed = sum(1 for v in owasp_mapping.values() if v['status'] == 'pass')
+
+    iso27001_score = max(0, 100 - (critical * 15 + high * 8))
+    nist_score = max(0, 100 - (critical * 12 + high * 7))
+    gdpr_compliant = critical == 0 and high <= 1
+
+    return {
+        "owasp": {
+            "mapping": owasp_mapping,
+            "total_categories": len(OWASP_CATEGORIES),
+            "passed": passed,
+            "compliance_score": round((passed / len(OWASP_CATEGORIES)) * 100)
+        },
+        "iso27001": {
+            "score": iso27001_score,
+            "status": "compliant" if iso27001_score >= 80 else "non-compliant",
+            "controls_passed": 45 if iso27001_score >= 80 else 32,
+            "controls_total": 50
+        },
+        "nist": {
+            "score": nist_score,
+            "status": "compliant" if nist_score >= 75 else "non-compliant",
+            "framework": "NIST CSF 2.0",
+            "categories_met": 4 if nist_score >= 75 else 2
+        },
+        "gdpr": {
+            "compliant": gdpr_compliant,
+            "risk_level": "low" if gdpr_compliant else "high",
+            "data_protection": "adequate" if gdpr_compliant else "inadequate",
+            "breach_notification_required": not gdpr_compliant
+        }
+    }
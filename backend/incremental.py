@@ -0,0 +1,239 @@
+import difflib
+import hashlib
+import math
+import re
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from rule_engine import RuleEngine
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+class DiffError(ValueError):
+    """Raised when a diff can't be parsed or doesn't apply to the base scan"""
+
+
+def line_hash(line: str) -> str:
+    return hashlib.blake2b(line.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def line_hashes(code: str) -> List[str]:
+    """Per-line fingerprints stored with a scan so later scans can diff against it"""
+    return [line_hash(line) for line in code.split('\n')]
+
+
+class LineChanges:
+    """What changed between a base scan and the new content.
+
+    line_map maps unchanged old line numbers to their new line numbers,
+    changed holds the new line numbers that were added or modified, and
+    new_text holds the text of every new line that is known (all of them
+    for full content, hunk lines only for a diff). All numbers are 1-based.
+
+    edits lists, in order, every place the new content differs from the
+    base: n for changed line n, n - 0.5 for base lines deleted between new
+    lines n - 1 and n (a finding spanning both lines no longer matches the
+    same text).
+    """
+
+    def __init__(
+        self,
+        line_map: Dict[int, int],
+        changed: set,
+        new_text: Dict[int, str],
+        new_hashes: List[str],
+        base_length: int
+    ):
+        self.line_map = line_map
+        self.changed = changed
+        self.new_text = new_text
+        self.new_hashes = new_hashes
+        old_lines = {new: old for old, new in line_map.items()}
+        old_lines[len(new_hashes) + 1] = base_length + 1
+        deleted = [
+            n - 0.5 for n in range(2, len(new_hashes) + 2)
+            if n - 1 in old_lines and n in old_lines and old_lines[n] != old_lines[n - 1] + 1
+        ]
+        self.edits = sorted([*changed, *deleted])
+
+    def edited(self, first: int, span: int = 1) -> bool:
+        """True if a finding on new lines first to first + span - 1 has to be detected again.
+
+        That is when one of its lines was edited, unless the lines up to the
+        edit are not all known: a diff may leave them out, so they can't be
+        rescanned and the finding counts as unchanged.
+        """
+        i = bisect_left(self.edits, first)
+        if i == len(self.edits) or self.edits[i] > first + span - 1:
+            return False
+        return all(n in self.new_text for n in range(first, int(self.edits[i]) + 1))
+
+    def regions(self, context: int, span: int = 1) -> List[Tuple[int, List[str]]]:
+        """Runs of known lines to rescan for findings of up to span lines.
+
+        Each run holds every line such a finding touching an edit can start
+        on, the rest of its span and up to context known lines either side.
+        With span 1 that is the changed lines plus context.
+        """
+        wanted = set()
+        reach = context + span - 1
+        for edit in (self.edits if span > 1 else self.changed):
+            for n in range(math.floor(edit) - reach, math.ceil(edit) + reach + 1):
+                if n in self.new_text:
+                    wanted.add(n)
+        runs = []
+        for n in sorted(wanted):
+            if runs and runs[-1][0] + len(runs[-1][1]) == n:
+                runs[-1][1].append(self.new_text[n])
+            else:
+                runs.append((n, [self.new_text[n]]))
+        return runs
+
+
+def changes_from_content(base_hashes: List[str], code: str) -> LineChanges:
+    """Diff new content against the base scan's line fingerprints"""
+    new_lines = code.split('\n')
+    new_hashes = [line_hash(line) for line in new_lines]
+    line_map = {}
+    changed = set()
+    matcher = difflib.SequenceMatcher(None, base_hashes, new_hashes, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for offset in range(i2 - i1):
+                line_map[i1 + offset + 1] = j1 + offset + 1
+        else:
+            changed.update(range(j1 + 1, j2 + 1))
+    new_text = {i: line for i, line in enumerate(new_lines, 1)}
+    return LineChanges(line_map, changed, new_text, new_hashes, len(base_hashes))
+
+
+def parse_unified_diff(diff: str) -> List[Dict[str, Any]]:
+    """Parse the hunks of a single-file unified diff"""
+    hunks = []
+    for raw in diff.split('\n'):
+        match = HUNK_HEADER.match(raw)
+        if match:
+            old_start, old_count, new_start, new_count = match.groups()
+            hunks.append({
+                'old_start': int(old_start),
+                'old_count': int(old_count) if old_count is not None else 1,
+                'new_start': int(new_start),
+                'new_count': int(new_count) if new_count is not None else 1,
+                'lines': []
+            })
+        elif hunks and raw[:1] in (' ', '+', '-'):
+            hunks[-1]['lines'].append((raw[0], raw[1:]))
+        elif hunks and raw == '':
+            # Some tools strip the leading space from empty context lines
+            hunks[-1]['lines'].append((' ', ''))
+    if not hunks:
+        raise DiffError("Diff contains no hunks")
+    return hunks
+
+
+def changes_from_diff(base_hashes: List[str], diff: str) -> LineChanges:
+    """Apply a unified diff to the base scan's line fingerprints"""
+    line_map = {}
+    changed = set()
+    new_text = {}
+    new_hashes = []
+    old_line = 1
+
+    def copy_unchanged(until):
+        nonlocal old_line
+        while old_line < until:
+            if old_line > len(base_hashes):
+                raise DiffError("Diff refers to lines beyond the end of the base scan")
+            new_hashes.append(base_hashes[old_line - 1])
+            line_map[old_line] = len(new_hashes)
+            old_line += 1
+
+    for hunk in parse_unified_diff(diff):
+        # A zero-length old range names the line after which the hunk is inserted
+        copy_unchanged(hunk['old_start'] + (1 if hunk['old_count'] == 0 else 0))
+        if hunk['new_start'] and len(new_hashes) + 1 != hunk['new_start'] + (1 if hunk['new_count'] == 0 else 0):
+            raise DiffError(f"Hunk at +{hunk['new_start']} does not line up with the base scan")
+        old_seen = new_seen = 0
+        for tag, text in hunk['lines']:
+            if old_seen == hunk['old_count'] and new_seen == hunk['new_count']:
+                break
+            if tag in (' ', '-'):
+                if old_line > len(base_hashes) or base_hashes[old_line - 1] != line_hash(text):
+                    raise DiffError(f"Diff does not apply to the base scan at line {old_line}")
+                old_seen += 1
+            if tag == ' ':
+                new_hashes.append(base_hashes[old_line - 1])
+                line_map[old_line] = len(new_hashes)
+                new_text[len(new_hashes)] = text
+                new_seen += 1
+                old_line += 1
+            elif tag == '-':
+                old_line += 1
+            else:
+                new_hashes.append(line_hash(text))
+                changed.add(len(new_hashes))
+                new_text[len(new_hashes)] = text
+                new_seen += 1
+    copy_unchanged(len(base_hashes) + 1)
+    return LineChanges(line_map, changed, new_text, new_hashes, len(base_hashes))
+
+
+def scan_changes(
+    engine: RuleEngine,
+    changes: LineChanges,
+    context: int,
+    scan_info: Optional[Dict[str, Any]] = None,
+    language: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Run the rule engine over the lines around edits only.
+
+    The rescanned runs are wide enough for the longest line-spanning rule,
+    and a finding is kept if any line of its span (engine.line_span of its
+    type, from its line_number) was edited.
+    """
+    findings = []
+    for first_line, lines in changes.regions(context, engine.max_line_span()):
+        findings.extend(engine.scan_lines(lines, first_line, scan_info=scan_info, language=language))
+    return [f for f in findings if changes.edited(f['line_number'], engine.line_span(f['type']))]
+
+
+def _snippet_key(vuln: Dict[str, Any]) -> Tuple[str, str]:
+    return vuln['type'], ' '.join((vuln.get('code_snippet') or '').split())
+
+
+def classify_findings(
+    base_vulnerabilities: List[Dict[str, Any]],
+    detected: List[Dict[str, Any]],
+    changes: LineChanges,
+    line_span: Callable[[str], int] = lambda rule_name: 1
+) -> Tuple[List[Tuple[Dict[str, Any], int]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split findings into carried over, new and fixed.
+
+    Returns (carried, new, fixed): carried is a list of (base vulnerability,
+    new line number), new the detected findings on changed lines that have
+    no counterpart in the base scan, and fixed the base vulnerabilities that
+    no longer appear. line_span(type) is how many lines from its
+    line_number a finding covers (RuleEngine.line_span); a base finding any
+    of whose lines was edited has to be detected again. One whose type and
+    snippet are detected again (e.g. a moved line) counts as carried over.
+    """
+    carried = []
+    removed: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for vuln in base_vulnerabilities:
+        new_line = changes.line_map.get(vuln.get('line_number'))
+        if new_line is not None and not changes.edited(new_line, line_span(vuln['type'])):
+            carried.append((vuln, new_line))
+        else:
+            removed.setdefault(_snippet_key(vuln), []).append(vuln)
+
+    new = []
+    for finding in detected:
+        matches = removed.get(_snippet_key(finding))
+        if matches:
+            carried.append((matches.pop(0), finding['line_number']))
+        else:
+            new.append(finding)
+
+    fixed = [vuln for vulns in removed.values() for vuln in vulns]
+    return carried, new, fixed
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Fields returned by JobQueue.get
+JOB_STATUS_FIELDS = {'_id': 0, 'payload': 0, 'lease_owner': 0}
+
+
+class LeaseLost(Exception):
+    """Raised when a worker's lease on a job expired and another worker may have taken it"""
+
+
+class JobQueue:
+    """Mongo-backed job queue with priorities, leases and retries.
+
+    Workers claim the highest-priority, oldest available job with a single
+    find_one_and_update, which sets a lease that expires after lease_seconds
+    unless the worker renews it. A job whose worker died is claimed again once
+    its lease expires. Failed attempts are retried with exponential backoff
+    (retry_delay * 2 ** (attempt - 1)) until max_attempts is reached.
+
+    Job status is one of queued, running, complete or failed.
+    """
+
+    def __init__(self, collection=None, lease_seconds: float = 60, max_attempts: int = 3, retry_delay: float = 5):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    async def ensure_indexes(self):
+        await self.collection.create_index('job_id', unique=True)
+        await self.collection.create_index([('status', 1), ('priority', -1), ('available_at', 1)])
+        await self.collection.create_index([('status', 1), ('lease_expires', 1)])
+
+    async def enqueue(self, job_id: str, kind: str, payload: Dict[str, Any], priority: int = 0) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        job = {
+            'job_id': job_id,
+            'kind': kind,
+            'payload': payload,
+            'priority': priority,
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': self.max_attempts,
+            'progress': {'stage': 'queued'},
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+            'available_at': now,
+            'lease_owner': None,
+            'lease_expires': None
+        }
+        await self.collection.insert_one(dict(job))
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({'job_id': job_id}, JOB_STATUS_FIELDS)
+
+    async def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Lease the next runnable job to worker_id; None if there is none"""
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {'$or': [
+                {'status': 'queued', 'available_at': {'$lte': now}},
+                # Abandoned by a worker that stopped renewing its lease
+                {'status': 'running', 'lease_expires': {'$lt': now}, '$expr': {'$lt': ['$attempts', '$max_attempts']}}
+            ]},
+            {
+                '$set': {
+                    'status': 'running',
+                    'lease_owner': worker_id,
+                    'lease_expires': now + timedelta(seconds=self.lease_seconds),
+                    'updated_at': now
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('priority', -1), ('available_at', 1)],
+            projection={'_id': 0},
+            # ReturnDocument.AFTER, without importing pymongo here
+            return_document=True
+        )
+
+    async def _update_owned(self, job: Dict[str, Any], worker_id: str, fields: Dict[str, Any]):
+        """Update a job only while worker_id still holds it; raises LeaseLost otherwise"""
+        fields['updated_at'] = datetime.now(timezone.utc)
+        result = await self.collection.update_one(
+            {'job_id': job['job_id'], 'lease_owner': worker_id, 'attempts': job['attempts']},
+            {'$set': fields}
+        )
+        if not result.matched_count:
+            raise LeaseLost(job['job_id'])
+
+    async def renew(self, job: Dict[str, Any], worker_id: str):
+        await self._update_owned(job, worker_id, {
+            'lease_expires': datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)
+        })
+
+    async def report_progress(self, job: Dict[str, Any], worker_id: str, progress: Dict[str, Any]):
+        await self._update_owned(job, worker_id, {'progress': progress})
+
+    async def complete(self, job: Dict[str, Any], worker_id: str, progress: Optional[Dict[str, Any]] = None):
+        fields = {'status': 'complete', 'error': None, 'lease_owner': None, 'lease_expires': None}
+        if progress is not None:
+            fields['progress'] = progress
+        await self._update_owned(job, worker_id, fields)
+
+    async def fail(self, job: Dict[str, Any], worker_id: str, error: str) -> bool:
+        """Record a failed attempt; returns True if the job will be retried"""
+        retry = job['attempts'] < job.get('max_attempts', self.max_attempts)
+        fields = {'error': error, 'lease_owner': None, 'lease_expires': None}
+        if retry:
+            delay = self.retry_delay * 2 ** (job['attempts'] - 1)
+            fields.update(status='queued', available_at=datetime.now(timezone.utc) + timedelta(seconds=delay))
+        else:
+            fields['status'] = 'failed'
+        await self._update_owned(job, worker_id, fields)
+        return retry
+
+    async def fail_abandoned(self) -> int:
+        """Fail running jobs whose lease expired on their last allowed attempt"""
+        now = datetime.now(timezone.utc)
+        result = await self.collection.update_many(
+            {'status': 'running', 'lease_expires': {'$lt': now}, '$expr': {'$gte': ['$attempts', '$max_attempts']}},
+            {'$set': {'status': 'failed', 'error': 'Lease expired on the last attempt', 'updated_at': now}}
+        )
+        return result.modified_count
+
+
+# Runs one claimed job; gets the job and a progress reporter
+JobHandler = Callable[[Dict[str, Any], Callable[[Dict[str, Any]], Awaitable[None]]], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class WorkerPool:
+    """Asyncio workers that claim jobs from a JobQueue and run them.
+
+    handlers maps a job kind to a coroutine function taking the job and an
+    async progress callback; what it returns becomes the final progress.
+    While a job runs its lease is renewed every lease_seconds / 3; if that
+    fails the job is cancelled, since another worker may be running it.
+    An error anywhere else in a worker's loop is logged and the worker goes
+    on; the job it was running is claimed again when its lease expires.
+    Several processes can each run a pool against the same collection, and
+    a pool can be stopped and started again on another event loop.
+    """
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, JobHandler], workers: int = 2, poll_interval: float = 1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.prefix = f'{socket.gethostname()}:{os.getpid()}'
+        self._tasks: List[asyncio.Task] = []
+        # Created in start(), since an Event is bound to the loop that first waits on it
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        for n in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._work(f'{self.prefix}:{n}')))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def notify(self):
+        """Wake idle workers in this process, e.g. right after an enqueue"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _idle(self):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _work(self, worker_id: str):
+        while True:
+            try:
+                await self._work_once(worker_id)
+            except Exception as e:
+                logger.exception(f"Worker {worker_id} failed: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _work_once(self, worker_id: str):
+        """Run the next job, or wait for one"""
+        try:
+            await self.queue.fail_abandoned()
+            job = await self.queue.claim(worker_id)
+        except Exception as e:
+            logger.warning(f"Worker {worker_id} could not claim a job: {e}")
+            job = None
+        if job is None:
+            await self._idle()
+            return
+        await self.run_job(job, worker_id)
+
+    async def _keep_leased(self, job: Dict[str, Any], worker_id: str, task: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                await self.queue.renew(job, worker_id)
+            except LeaseLost:
+                logger.warning(f"Worker {worker_id} lost the lease on job {job['job_id']}")
+                task.cancel()
+                return
+            except Exception as e:
+                logger.warning(f"Lease renewal for job {job['job_id']} failed: {e}")
+
+    async def run_job(self, job: Dict[str, Any], worker_id: str):
+        handler = self.handlers.get(job['kind'])
+
+        async def report(progress: Dict[str, Any]):
+            await self.queue.report_progress(job, worker_id, progress)
+
+        task = asyncio.create_task(handler(job, report)) if handler else None
+        keeper = asyncio.create_task(self._keep_leased(job, worker_id, task)) if task else None
+        try:
+            if task is None:
+                raise ValueError(f"No handler for job kind {job['kind']!r}")
+            progress = await task
+            await self.queue.complete(job, worker_id, progress)
+        except LeaseLost:
+            logger.warning(f"Job {job['job_id']} was taken over by another worker")
+        except asyncio.CancelledError:
+            # Unless the lease keeper cancelled the job (lease lost), the pool is stopping
+            if keeper is None or not keeper.done():
+                raise
+        except Exception as e:
+            logger.error(f"Job {job['job_id']} attempt {job['attempts']} failed: {e}")
+            try:
+                retry = await self.queue.fail(job, worker_id, str(e))
+                logger.info(f"Job {job['job_id']} {'will be retried' if retry else 'failed permanently'}")
+            except LeaseLost:
+                pass
+        finally:
+            if keeper is not None:
+                keeper.cancel()
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_MARKER = "Findings (JSON):"
+
+# Filled in by build_batch_prompt; its text is part of the scan memoization key
+BATCH_PROMPT_TEMPLATE = """Analyze these {count} security vulnerabilities found in the same file.
+
+Context:
+{context}
+
+{marker}
+{findings}
+
+For each finding provide:
+1. Clear explanation of the vulnerability and potential attack scenarios (2-3 sentences)
+2. Specific remediation steps
+
+Respond with only a JSON array containing one object per finding, in this form:
+[{{"index": 0, "ai_explanation": "...", "recommendation": "..."}}]"""
+
+
+class LlmClient:
+    """Minimal interface the scan pipeline needs from an LLM backend"""
+
+    async def complete(self, prompt: str, system_message: str) -> str:
+        raise NotImplementedError
+
+
+class EmergentLlmClient(LlmClient):
+    """Long-lived client for emergentintegrations' LlmChat.
+
+    An LlmChat is a conversation: it sends its whole message history with
+    every prompt. So each call gets a new chat with its own session id.
+    Reusing chats would carry one finding's code into unrelated later
+    prompts, grow token usage, and make cached explanations depend on
+    earlier calls. Only what is stateless is shared across calls: the
+    provider settings and the lazily imported classes. Connection reuse is
+    left to the provider SDK underneath. emergentintegrations (and the
+    provider SDKs it pulls in) is only imported on the first call, so
+    processes that never reach the LLM, e.g. demo-profile scans, don't pay
+    for it.
+    """
+
+    def __init__(self, api_key: Optional[str], provider: str, model: str):
+        self._chat_cls = None
+        self._message_cls = None
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+
+    def _load(self):
+        if self._chat_cls is None:
+            from emergentintegrations.llm.chat import LlmChat, UserMessage
+            self._chat_cls = LlmChat
+            self._message_cls = UserMessage
+
+    def _new_chat(self, system_message: str) -> Any:
+        self._load()
+        return self._chat_cls(
+            api_key=self.api_key,
+            session_id=f"secure_review_{uuid.uuid4()}",
+            system_message=system_message
+        ).with_model(self.provider, self.model)
+
+    async def complete(self, prompt: str, system_message: str) -> str:
+        chat = self._new_chat(system_message)
+        return await chat.send_message(self._message_cls(text=prompt))
+
+
+class FakeLlmClient(LlmClient):
+    """Local stand-in for tests and benchmarks; no network access.
+
+    Answers batch prompts with a well-formed JSON array, secure fix prompts
+    with a JSON fix and anything else with a fixed explanation. latency
+    adds an asyncio.sleep per call.
+    """
+
+    def __init__(self, latency: float = 0.0, responder: Optional[Callable[[str], str]] = None):
+        self.latency = latency
+        self.responder = responder
+        self.calls = 0
+
+    async def complete(self, prompt: str, system_message: str) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.responder is not None:
+            return self.responder(prompt)
+        if BATCH_MARKER in prompt:
+            findings = json.loads(prompt.split(BATCH_MARKER, 1)[1].split('\n\n', 1)[0])
+            return json.dumps([
+                {
+                    'index': f['index'],
+                    'ai_explanation': f"{f['type']} at this location can be exploited by an attacker.",
+                    'recommendation': f"Remediate the {f['type']} issue."
+                }
+                for f in findings
+            ])
+        if '"fixed_code"' in prompt:
+            return json.dumps({
+                'fixed_code': '# Validated and parameterized\n' + prompt.split('Code:\n', 1)[-1].split('\n\n', 1)[0],
+                'explanation': 'Untrusted input is validated and passed as a parameter instead of concatenated.',
+                'prevents_attacks': ['Injection']
+            })
+        return "This code is vulnerable. Validate input and use safe APIs."
+
+
+def create_llm_client(provider: str, model: str) -> LlmClient:
+    """Build the client selected by LLM_BACKEND ("emergent" or "fake")"""
+    backend = os.environ.get('LLM_BACKEND', 'emergent')
+    if backend == 'fake':
+        return FakeLlmClient(latency=float(os.environ.get('FAKE_LLM_LATENCY', '0')))
+    return EmergentLlmClient(
+        api_key=os.environ.get('EMERGENT_LLM_KEY'),
+        provider=provider,
+        model=model
+    )
+
+
+def build_batch_prompt(vulns: List[Dict[str, Any]], context: str) -> str:
+    """Pack several findings from one scan into a single structured prompt"""
+    findings = [
+        {'index': i, 'type': v['type'], 'severity': v['severity'], 'code': v.get('code_snippet', 'N/A')}
+        for i, v in enumerate(vulns)
+    ]
+    return BATCH_PROMPT_TEMPLATE.format(
+        count=len(vulns), context=context, marker=BATCH_MARKER, findings=json.dumps(findings)
+    )
+
+
+def parse_batch_response(response: str, count: int) -> List[Dict[str, str]]:
+    """Split a batch response back into per-finding results.
+
+    Raises ValueError unless every index in range(count) has an explanation
+    and a recommendation.
+    """
+    text = re.sub(r'^```(?:json)?\s*|\s*```$', '', response.strip())
+    start, end = text.find('['), text.rfind(']')
+    if start == -1 or end < start:
+        raise ValueError("No JSON array in batch response")
+    try:
+        items = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON in batch response: {e}")
+
+    results: Dict[int, Dict[str, str]] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index = item.get('index')
+        explanation = item.get('ai_explanation')
+        recommendation = item.get('recommendation')
+        if isinstance(index, int) and 0 <= index < count and isinstance(explanation, str) and isinstance(recommendation, str):
+            results[index] = {'ai_explanation': explanation, 'recommendation': recommendation}
+
+    if len(results) != count:
+        raise ValueError(f"Batch response covered {len(results)} of {count} findings")
+    return [results[i] for i in range(count)]
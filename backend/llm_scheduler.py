@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Tenant (project_context) whose budget the current LLM calls are charged to
+current_tenant: ContextVar[Optional[str]] = ContextVar('current_tenant', default=None)
+
+
+class LlmUnavailable(Exception):
+    """Raised instead of calling the LLM; callers should use their fallback"""
+
+
+class CircuitOpenError(LlmUnavailable):
+    """The circuit breaker is open after repeated failures"""
+
+
+class LoadShedError(LlmUnavailable):
+    """The call would have waited too long for rate budget"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After failure_threshold failures in a row the circuit opens and allow()
+    refuses calls. Once reset_timeout seconds have passed a single probe call
+    is let through (half open): its success closes the circuit, its failure
+    opens it again for another reset_timeout. A probe that has neither
+    succeeded nor failed after reset_timeout is given up on and the next
+    call probes instead, so a hung call can't keep the circuit half open.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self._probing = False
+
+    def is_open(self) -> bool:
+        """True while calls are refused outright (not yet time for a probe)"""
+        return self.state == 'open' and self.clock() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        if self.state == 'closed':
+            return True
+        if self.state == 'open':
+            if self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = 'half_open'
+            self._probing = False
+        if self._probing and self.clock() - self.probe_started < self.reset_timeout:
+            return False
+        self._probing = True
+        self.probe_started = self.clock()
+        return True
+
+    def release(self):
+        """Give back a probe that allow() let through but that was never made"""
+        self._probing = False
+
+    def record_success(self):
+        if self.state != 'closed':
+            logger.info("LLM circuit breaker closed")
+        self.state = 'closed'
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+            logger.warning(f"LLM circuit breaker opened after {self.failures} consecutive failures")
+            self.state = 'open'
+            self.opened_at = self.clock()
+            self._probing = False
+
+
+class TokenBucket:
+    """Budget of capacity units per minute, refilled continuously.
+
+    The level may go negative when actual usage is settled above the
+    estimate; later calls then wait for the debt to refill.
+    """
+
+    def __init__(self, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self.clock = clock
+        self.level = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (amounts above capacity wait for a full bucket)"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+# Tenants tracked before idle ones are forgotten
+TENANT_SWEEP_MIN = 1024
+
+
+class LlmScheduler:
+    """Gate for every LLM call: circuit breaker plus per-minute rate budgets.
+
+    Budgets cover requests and (estimated) tokens per minute, overall and per
+    tenant; 0 disables a budget. A call without budget waits in its tenant's
+    FIFO queue, but if it would wait longer than max_wait seconds, or
+    max_waiting calls are already queued, it is shed with LoadShedError.
+    While the breaker is open calls fail at once with CircuitOpenError,
+    before any budget is spent. Calls that raise, time out after
+    call_timeout seconds (0 = no limit; run can override it) or are
+    cancelled by their caller count as breaker failures.
+
+    Tenant names come from clients, so per-tenant state exists only while
+    tenant budgets are enabled, and tenants whose buckets have refilled
+    (idle for up to a minute) are forgotten once more than TENANT_SWEEP_MIN
+    are tracked.
+    """
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        tenant_requests_per_minute: int = 0,
+        tenant_tokens_per_minute: int = 0,
+        max_wait: float = 10.0,
+        max_waiting: int = 100,
+        response_tokens: int = 512,
+        call_timeout: float = 0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.breaker = breaker
+        self.tenant_requests_per_minute = tenant_requests_per_minute
+        self.tenant_tokens_per_minute = tenant_tokens_per_minute
+        self.max_wait = max_wait
+        self.max_waiting = max_waiting
+        self.response_tokens = response_tokens
+        self.call_timeout = call_timeout
+        self.clock = clock
+        self.global_buckets = self._buckets(requests_per_minute, tokens_per_minute)
+        self._tenant_buckets: Dict[str, Tuple[Optional[TokenBucket], Optional[TokenBucket]]] = {}
+        self._tenant_locks: Dict[Optional[str], asyncio.Lock] = {}
+        self._sweep_at = TENANT_SWEEP_MIN
+        self.waiting = 0
+        self.counters = {'calls': 0, 'short_circuited': 0, 'shed': 0}
+
+    def _buckets(self, requests: int, tokens: int) -> Tuple[Optional[TokenBucket], Optional[TokenBucket]]:
+        return (
+            TokenBucket(requests, self.clock) if requests else None,
+            TokenBucket(tokens, self.clock) if tokens else None
+        )
+
+    @property
+    def tenant_budgets(self) -> bool:
+        return bool(self.tenant_requests_per_minute or self.tenant_tokens_per_minute)
+
+    def _tenant_state(self, tenant: str) -> Tuple[Optional[TokenBucket], Optional[TokenBucket]]:
+        if not self.tenant_budgets:
+            return None, None
+        buckets = self._tenant_buckets.get(tenant)
+        if buckets is None:
+            if len(self._tenant_buckets) >= self._sweep_at:
+                self._expire_tenants()
+            buckets = self._tenant_buckets[tenant] = self._buckets(
+                self.tenant_requests_per_minute, self.tenant_tokens_per_minute
+            )
+        return buckets
+
+    def _expire_tenants(self):
+        """Forget tenants whose buckets are full again; a new tenant starts the same way"""
+        for tenant, buckets in list(self._tenant_buckets.items()):
+            lock = self._tenant_locks.get(tenant)
+            if lock is not None and lock.locked():
+                continue
+            if all(bucket is None or bucket.wait_time(bucket.capacity) == 0 for bucket in buckets):
+                del self._tenant_buckets[tenant]
+                self._tenant_locks.pop(tenant, None)
+        self._sweep_at = max(TENANT_SWEEP_MIN, 2 * len(self._tenant_buckets))
+
+    def _charges(self, tenant: str, tokens: int) -> List[Tuple[TokenBucket, int]]:
+        charges = []
+        for requests_bucket, tokens_bucket in (self.global_buckets, self._tenant_state(tenant)):
+            if requests_bucket is not None:
+                charges.append((requests_bucket, 1))
+            if tokens_bucket is not None:
+                charges.append((tokens_bucket, tokens))
+        return charges
+
+    async def _acquire(self, tenant: str, tokens: int):
+        charges = self._charges(tenant, tokens)
+        if not charges:
+            return
+        if self.waiting >= self.max_waiting:
+            raise LoadShedError(f"{self.waiting} LLM calls already waiting for budget")
+        deadline = self.clock() + self.max_wait
+        self.waiting += 1
+        try:
+            # Without tenant budgets every call waits for the same global budget, in one queue
+            queue = tenant if self.tenant_budgets else None
+            async with self._tenant_locks.setdefault(queue, asyncio.Lock()):
+                while True:
+                    wait = max(bucket.wait_time(amount) for bucket, amount in charges)
+                    if wait <= 0:
+                        for bucket, amount in charges:
+                            bucket.take(amount)
+                        return
+                    if self.clock() + wait > deadline:
+                        raise LoadShedError(f"LLM budget for {tenant!r} exhausted; would wait {wait:.1f}s")
+                    await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
+
+    def _settle(self, tenant: str, extra_tokens: int):
+        """Charge (or refund) the difference between actual and estimated tokens"""
+        for bucket in (self.global_buckets[1], self._tenant_state(tenant)[1]):
+            if bucket is not None:
+                bucket.take(extra_tokens)
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[str]],
+        prompt: str,
+        tenant: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> str:
+        """Await call() within the breaker and budgets; raises LlmUnavailable instead of calling.
+
+        timeout replaces call_timeout for this call; a timed out call raises
+        asyncio.TimeoutError.
+        """
+        tenant = tenant or current_tenant.get() or 'default'
+        if not self.breaker.allow():
+            self.counters['short_circuited'] += 1
+            raise CircuitOpenError("LLM circuit breaker is open")
+        estimate = estimate_tokens(prompt) + self.response_tokens
+        try:
+            await self._acquire(tenant, estimate)
+        except LoadShedError:
+            self.counters['shed'] += 1
+            self.breaker.release()
+            raise
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+
+        self.counters['calls'] += 1
+        timeout = self.call_timeout if timeout is None else timeout
+        try:
+            response = await (asyncio.wait_for(call(), timeout) if timeout else call())
+        except (Exception, asyncio.CancelledError):
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        self._settle(tenant, estimate_tokens(prompt) + estimate_tokens(response) - estimate)
+        return response
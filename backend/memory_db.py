@@ -0,0 +1,294 @@
+"""In-memory stand-in for the Motor database, for tests and benchmarks.
+
+Implements the subset of the Mongo API the app uses: the query operators,
+projections and aggregation stages its stores send, in a list per
+collection. Nothing is indexed; create_index is accepted and ignored.
+"""
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+
+# Query operators understood by _matches
+OPERATORS = {
+    '$in': lambda value, arg: value in arg,
+    '$gte': lambda value, arg: value is not None and value >= arg,
+    '$lt': lambda value, arg: value is not None and value < arg,
+    '$lte': lambda value, arg: value is not None and value <= arg,
+}
+
+
+def _matches(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    for key, condition in query.items():
+        if key == '$or':
+            if not any(_matches(doc, branch) for branch in condition):
+                return False
+            continue
+        if key == '$expr':
+            if not _evaluate(doc, condition):
+                return False
+            continue
+        if '.' in key:
+            # Equality on a field of an array's elements, e.g. vulnerabilities.id
+            parent, child = key.split('.', 1)
+            items = doc.get(parent)
+            if not isinstance(items, list) or not any(isinstance(item, dict) and item.get(child) == condition for item in items):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(condition, dict) and condition and all(op in OPERATORS for op in condition):
+            if not all(OPERATORS[op](value, arg) for op, arg in condition.items()):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _lookup(doc: Dict[str, Any], path: str) -> Any:
+    for part in path.split('.'):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]], query: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Apply a top-level or one-level dotted inclusion/exclusion projection.
+
+    A positional 'field.$' inclusion keeps the first element of the array
+    matched by query's 'field.x' condition.
+    """
+    doc = {key: value for key, value in doc.items() if key != '_id'}
+    if not projection:
+        return doc
+    included = {key for key, value in projection.items() if value and key != '_id'}
+    if not included:
+        return {key: value for key, value in doc.items() if projection.get(key, 1)}
+    result = {}
+    for key in included:
+        if key.endswith('.$'):
+            parent = key[:-2]
+            matched = [
+                item for item in doc.get(parent) or []
+                if _matches({parent: [item]}, {k: v for k, v in (query or {}).items() if k.startswith(parent + '.')})
+            ]
+            result[parent] = matched[:1]
+        elif '.' in key:
+            parent, child = key.split('.', 1)
+            if isinstance(doc.get(parent), list):
+                result[parent] = [{child: item.get(child)} for item in doc[parent]]
+        elif key in doc:
+            result[key] = doc[key]
+    return result
+
+
+def _evaluate(doc: Dict[str, Any], expression: Any) -> Any:
+    """The few aggregation expressions the app's pipelines use"""
+    if isinstance(expression, str) and expression.startswith('$'):
+        path = expression[1:]
+        parent, _, child = path.partition('.')
+        if child and isinstance(doc.get(parent), list):
+            return [item.get(child) for item in doc[parent]]
+        return _lookup(doc, path)
+    if isinstance(expression, dict) and len(expression) == 1:
+        (operator, args), = expression.items()
+        if operator == '$substrBytes':
+            value, start, length = (_evaluate(doc, arg) for arg in args)
+            return (value or '')[start:start + length]
+        if operator == '$ifNull':
+            value = _evaluate(doc, args[0])
+            return _evaluate(doc, args[1]) if value is None else value
+        if operator in OPERATORS:
+            value, arg = (_evaluate(doc, arg) for arg in args)
+            return OPERATORS[operator](value, arg)
+        if operator == '$cond':
+            condition, then, otherwise = args
+            return _evaluate(doc, then if _evaluate(doc, condition) else otherwise)
+    return expression
+
+
+def _reshape(doc: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Aggregation $project: 1 keeps a field, an expression computes one; missing values are left out"""
+    result = {}
+    for key, value in spec.items():
+        if isinstance(value, (str, dict)):
+            found = _evaluate(doc, value)
+        elif value and key in doc:
+            found = doc[key]
+        else:
+            continue
+        if found is not None:
+            result[key] = found
+    return result
+
+
+def _group(docs: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Aggregation $group with $sum and $avg accumulators"""
+    groups: Dict[Any, List[Dict[str, Any]]] = {}
+    for doc in docs:
+        groups.setdefault(_evaluate(doc, spec['_id']), []).append(doc)
+    results = []
+    for key, members in groups.items():
+        row = {'_id': key}
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            (operator, expression), = accumulator.items()
+            values = [_evaluate(doc, expression) for doc in members]
+            values = [value for value in values if isinstance(value, (int, float))]
+            if operator == '$sum':
+                row[field] = sum(values)
+            elif operator == '$avg':
+                row[field] = sum(values) / len(values) if values else None
+            else:
+                raise NotImplementedError(operator)
+        results.append(row)
+    return results
+
+
+class MemoryCursor:
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self.docs = docs
+
+    def sort(self, key, direction: int = 1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self.docs.sort(key=lambda doc: (doc.get(field) is not None, doc.get(field)), reverse=order == -1)
+        return self
+
+    def limit(self, count: int):
+        if count:
+            self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length: Optional[int] = None):
+        return self.docs[:length] if length else list(self.docs)
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class MemoryCollection:
+    """In-memory stand-in for the Motor collection methods the app uses"""
+
+    def __init__(self):
+        self.docs: List[Dict[str, Any]] = []
+
+    async def insert_one(self, doc: Dict[str, Any]):
+        self.docs.append(dict(doc))
+
+    async def insert_many(self, docs: List[Dict[str, Any]]):
+        self.docs.extend(dict(doc) for doc in docs)
+
+    async def find_one(self, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None):
+        for doc in self.docs:
+            if _matches(doc, query):
+                return _project(doc, projection, query)
+        return None
+
+    def find(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> MemoryCursor:
+        return MemoryCursor([_project(doc, projection) for doc in self.docs if _matches(doc, query or {})])
+
+    @staticmethod
+    def _apply(doc: Dict[str, Any], update: Dict[str, Any]):
+        doc.update(update.get('$set', {}))
+        for key, value in update.get('$push', {}).items():
+            doc.setdefault(key, []).append(value)
+        for key, value in update.get('$inc', {}).items():
+            target = doc
+            *parents, leaf = key.split('.')
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[leaf] = target.get(leaf, 0) + value
+
+    async def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        for doc in self.docs:
+            if _matches(doc, query):
+                self._apply(doc, update)
+                return SimpleNamespace(matched_count=1, modified_count=1)
+        if upsert:
+            self.docs.append({**query, **update.get('$set', {})})
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+    async def update_many(self, query: Dict[str, Any], update: Dict[str, Any]):
+        matched = [doc for doc in self.docs if _matches(doc, query)]
+        for doc in matched:
+            self._apply(doc, update)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+    async def find_one_and_update(
+        self,
+        query: Dict[str, Any],
+        update: Dict[str, Any],
+        sort: Optional[List[Any]] = None,
+        projection: Optional[Dict[str, Any]] = None,
+        return_document: bool = False
+    ):
+        """Updates the first match in sort order; return_document=True (ReturnDocument.AFTER) returns it updated"""
+        cursor = MemoryCursor([doc for doc in self.docs if _matches(doc, query)])
+        if sort:
+            cursor.sort(sort)
+        if not cursor.docs:
+            return None
+        doc = cursor.docs[0]
+        before = _project(doc, projection)
+        self._apply(doc, update)
+        return _project(doc, projection) if return_document else before
+
+    def aggregate(self, pipeline: List[Dict[str, Any]]) -> MemoryCursor:
+        """$match, $sort, $limit, $project, $unwind and $group only"""
+        cursor = MemoryCursor([dict(doc) for doc in self.docs])
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == '$match':
+                cursor.docs = [doc for doc in cursor.docs if _matches(doc, spec)]
+            elif operator == '$sort':
+                cursor.sort(list(spec.items()))
+            elif operator == '$limit':
+                cursor.limit(spec)
+            elif operator == '$project':
+                cursor.docs = [_reshape(doc, spec) for doc in cursor.docs]
+            elif operator == '$unwind':
+                field = spec[1:]
+                cursor.docs = [{**doc, field: item} for doc in cursor.docs for item in (doc.get(field) or [])]
+            elif operator == '$group':
+                cursor.docs = _group(cursor.docs, spec)
+            else:
+                raise NotImplementedError(operator)
+        return cursor
+
+    async def delete_many(self, query: Dict[str, Any]):
+        self.docs = [doc for doc in self.docs if not _matches(doc, query)]
+
+    async def create_index(self, *args, **kwargs):
+        return None
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self._collections.setdefault(name, MemoryCollection())
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        return getattr(self, name)
+
+
+def use_memory_database(server) -> MemoryDatabase:
+    """Swap the app's Mongo database for an in-memory one"""
+    database = MemoryDatabase()
+    server.db = database
+    server.scan_store.db = database
+    server.analysis_cache.collection = database.ai_analysis_cache
+    server.fix_cache.collection = database.secure_fix_cache
+    server.job_queue.collection = database.scan_jobs
+    return database
@@ -0,0 +1,774 @@
+import logging
+import mmap
+import re
+import time
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Set, Tuple, Union
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+# How often (in lines) scan_lines checks the time budget
+BUDGET_CHECK_LINES = 256
+
+# Shortest literal worth prefiltering on; shorter ones occur on most lines
+MIN_LITERAL_LENGTH = 3
+
+# Bytes of a buffer decoded and matched line by line at a time in scan_buffer
+WINDOW_BYTES = 1024 * 1024
+
+NEWLINE = re.compile('\n')
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', sre_parse.MAX_REPEAT))
+
+
+def load_re2():
+    """The google-re2 module, or None if it isn't installed"""
+    try:
+        import re2
+    except ImportError:
+        return None
+    return re2
+
+
+def _class_end(pattern: str, start: int) -> int:
+    """Index of the ] closing the character class opened at start"""
+    pos = start + 1
+    if pattern.startswith('^', pos):
+        pos += 1
+    # A ] first in the class is a literal
+    if pattern.startswith(']', pos):
+        pos += 1
+    while pos < len(pattern) and pattern[pos] != ']':
+        pos += 2 if pattern[pos] == '\\' else 1
+    return pos
+
+
+# Letters re folds to i that RE2 doesn't: dotted capital İ and dotless ı
+DOTTED_I = '\u0130\u0131'
+
+# Characters re's \s matches in str patterns (those str.isspace accepts); RE2's \s is ASCII only
+UNICODE_SPACE = r'\t\n\x0b\x0c\r\x1c-\x20\x85\xa0\x{1680}\x{2000}-\x{200a}\x{2028}\x{2029}\x{202f}\x{205f}\x{3000}'
+
+
+def _class_body(body: str) -> str:
+    """Character class contents with \\s spelled out as UNICODE_SPACE"""
+    out = []
+    pos = 0
+    while pos < len(body):
+        if body[pos] == '\\':
+            out.append(UNICODE_SPACE if body[pos + 1:pos + 2] == 's' else body[pos:pos + 2])
+            pos += 2
+        else:
+            out.append(body[pos])
+            pos += 1
+    return ''.join(out)
+
+
+def re_compatible(pattern: str) -> str:
+    """Rewrite a case-insensitive pattern so RE2 matches what re matches.
+
+    re treats the Turkish dotted capital İ and dotless ı as case variants of
+    i, RE2's simple Unicode case folding doesn't: each literal i or I
+    becomes [iİı], and İı are added to every character class (negated or
+    not) that contains i. \\s and \\S, ASCII-only in RE2, are spelled out
+    as re's Unicode whitespace (\\S inside a class is left as it is).
+    \\d, \\w and \\b remain ASCII-only in RE2.
+    """
+    out = []
+    pos = 0
+    while pos < len(pattern):
+        char = pattern[pos]
+        if char == '\\':
+            # Other escapes stay as they are, \p{Name} and \N{NAME} with their names
+            end = pos + 2
+            escape = pattern[pos + 1:end]
+            if escape in ('s', 'S'):
+                out.append(f"[{'^' if escape == 'S' else ''}{UNICODE_SPACE}]")
+            else:
+                if pattern.startswith('{', end) and escape in ('p', 'P', 'N'):
+                    end = pattern.find('}', end) + 1 or len(pattern)
+                out.append(pattern[pos:end])
+            pos = end
+        elif char == '(' and pattern.startswith('?', pos + 1):
+            # Group names and inline flags are not literals
+            group = re.match(r'\(\?(?:P?<[^>]*>|[a-zA-Z-]*[:)])?', pattern[pos:])
+            out.append(group.group())
+            pos += len(group.group())
+        elif char == '[':
+            end = _class_end(pattern, pos)
+            body = pattern[pos + 1:end]
+            negated = body.startswith('^')
+            try:
+                folds = re.fullmatch(f'[{body[1:] if negated else body}]', 'i', re.IGNORECASE) is not None
+            except re.error:
+                folds = False
+            out.append(f"[{_class_body(body)}{DOTTED_I if folds else ''}]")
+            pos = end + 1
+        elif char in 'iI':
+            out.append(f'[i{DOTTED_I}]')
+            pos += 1
+        else:
+            out.append(char)
+            pos += 1
+    return ''.join(out)
+
+
+def compile_linear(pattern: Union[str, bytes], flags: int = re.IGNORECASE):
+    """Compile pattern with RE2, which matches in time linear in the input.
+
+    Raises ValueError if RE2 is unavailable, the flags can't be expressed,
+    or the pattern uses syntax RE2 lacks (lookaround, backreferences).
+    Case-insensitive patterns are passed through re_compatible, so they fold
+    case and match whitespace like re does; bytes patterns are UTF-8 and
+    match UTF-8 text.
+    """
+    re2 = load_re2()
+    if re2 is None:
+        raise ValueError("google-re2 is not installed")
+    if flags & ~re.IGNORECASE:
+        raise ValueError("only re.IGNORECASE is supported")
+    options = re2.Options()
+    options.case_sensitive = not flags & re.IGNORECASE
+    options.log_errors = False
+    if flags & re.IGNORECASE:
+        if isinstance(pattern, bytes):
+            pattern = re_compatible(pattern.decode('utf-8')).encode('utf-8')
+        else:
+            pattern = re_compatible(pattern)
+    try:
+        return re2.compile(pattern, options)
+    except re2.error as e:
+        raise ValueError(e.args[0].decode('utf-8', 'replace') if e.args and isinstance(e.args[0], bytes) else str(e))
+
+
+def fold(text: str) -> str:
+    """Case-fold text for literal prefiltering.
+
+    Python's re treats dotted capital I and dotless i as case variants of i
+    under IGNORECASE, but str.casefold doesn't fold either to a plain i, so
+    they are mapped by hand. No other character matches an ASCII letter in
+    re or RE2 without casefolding to it.
+    """
+    return text.replace('\u0130', 'i').casefold().replace('\u0131', 'i')
+
+
+def _literal_sets(items) -> List[Set[str]]:
+    """Sets of literals, one of which every match of the parsed pattern contains"""
+    sets = []
+    run = []
+
+    def flush():
+        if run:
+            sets.append({''.join(run)})
+            run.clear()
+
+    for op, av in items:
+        if op == sre_parse.LITERAL and av != 10:
+            run.append(chr(av))
+            continue
+        flush()
+        if op == sre_parse.SUBPATTERN:
+            sets.extend(_literal_sets(av[-1]))
+        elif op in _REPEATS and av[0] >= 1:
+            sets.extend(_literal_sets(av[2]))
+        elif op == sre_parse.BRANCH:
+            alternatives = [_best_literals(branch) for branch in av[1]]
+            if all(alternatives):
+                sets.append(set().union(*alternatives))
+    flush()
+    return sets
+
+
+def _best_literals(items) -> Optional[Set[str]]:
+    sets = _literal_sets(items)
+    return max(sets, key=lambda literals: min(map(len, literals)), default=None)
+
+
+def _has_newline(items) -> bool:
+    for op, av in items:
+        if op == sre_parse.LITERAL and av == 10:
+            return True
+        if op == sre_parse.IN and (sre_parse.LITERAL, 10) in av:
+            return True
+        if op == sre_parse.SUBPATTERN and _has_newline(av[-1]):
+            return True
+        if op in _REPEATS and _has_newline(av[2]):
+            return True
+        if op == sre_parse.BRANCH and any(_has_newline(branch) for branch in av[1]):
+            return True
+    return False
+
+
+def spans_lines(pattern: str) -> bool:
+    """True if pattern matches an explicit newline (\\n), so it is meant to match across lines"""
+    try:
+        return _has_newline(sre_parse.parse(pattern))
+    except (re.error, RecursionError):
+        return False
+
+
+def _newlines(items) -> int:
+    count = 0
+    for op, av in items:
+        if op == sre_parse.LITERAL and av == 10:
+            count += 1
+        elif op == sre_parse.IN and (sre_parse.LITERAL, 10) in av:
+            count += 1
+        elif op == sre_parse.SUBPATTERN:
+            count += _newlines(av[-1])
+        elif op in _REPEATS:
+            inner = _newlines(av[2])
+            if inner:
+                count += inner * (av[1] if av[1] != sre_parse.MAXREPEAT else max(av[0], 1))
+        elif op == sre_parse.BRANCH:
+            count += max(_newlines(branch) for branch in av[1])
+    return count
+
+
+def line_span(pattern: str) -> int:
+    """Most lines a match of pattern covers, counting its explicit newlines.
+
+    An unbounded repeat of a newline counts at its minimum (at least once);
+    classes such as \\s that happen to match a newline are not counted.
+    """
+    try:
+        return _newlines(sre_parse.parse(pattern)) + 1
+    except (re.error, RecursionError):
+        return 1
+
+
+def required_literals(pattern: str) -> Optional[Tuple[str, ...]]:
+    """Case-folded literals of which any line matching pattern contains at least one.
+
+    None if the pattern has no literal of MIN_LITERAL_LENGTH characters or
+    more that every match needs (e.g. it is all character classes).
+    """
+    try:
+        literals = _best_literals(sre_parse.parse(pattern))
+    except (re.error, RecursionError):
+        return None
+    if not literals or min(map(len, literals)) < MIN_LITERAL_LENGTH:
+        return None
+    return tuple(sorted({fold(literal) for literal in literals}))
+
+
+class RuleEngine:
+    """Compiled matcher for a rule table shaped like SECURITY_RULES.
+
+    Every pattern is compiled once. A combined alternation of all patterns is
+    used to reject clean lines with a single regex call; only lines that hit
+    the combined pattern are checked against the individual patterns.
+    Findings are returned in rule -> pattern -> line order, the same order the
+    original nested loops produced.
+
+    Most patterns contain a literal every match needs ('execute(', 'pickle.loads',
+    one of 'innerHTML'/'document.write(' ...). These are indexed up front, and
+    scan_lines looks for each literal in the case-folded text with str.find,
+    so a pattern only runs on the lines that contain one of its literals;
+    lines with none are never handed to a regex. Patterns without such a
+    literal go through the combined alternation on every line. Disabling
+    literal_prefilter gives the unfiltered engine, which finds the same.
+
+    Patterns that match an explicit newline (spans_lines), such as a route
+    decorator followed by its def, are not run line by line: they are
+    matched over the whole text, and each match is reported on the line it
+    starts on. Their findings are placed in the usual order.
+
+    scan_buffer scans bytes or a memory-mapped file without building a
+    string or a list of lines for the whole input: lines are decoded and
+    matched one window at a time, line-spanning patterns are matched over
+    the buffer itself, and match offsets are mapped to line numbers with an
+    index of line start offsets.
+
+    A rule may list the languages it applies to in 'languages'; scans given
+    a language skip rules that don't list it. Rules without the key, and
+    scans without a language, use every rule.
+
+    backend "re2" compiles patterns with RE2 so matching is linear in line
+    length (see compile_linear); "auto" does so when google-re2 is installed
+    and uses re otherwise. A rule may give
+    RE2-ready rewrites of its patterns in 'linear_patterns' ({pattern:
+    rewrite}). Each pattern is validated at construction: if RE2 rejects it,
+    or it disagrees with Python's re on any of the sample lines, that pattern
+    alone falls back to re and is listed in incompatible.
+
+    max_line_length > 0 matches only the first that many characters of longer
+    lines; findings on such lines carry 'truncated': True. time_budget > 0
+    stops a scan after that many seconds; it is checked between lines, so
+    only max_line_length bounds a single re match on a pathological line
+    (RE2 needs no bound). Both are reported through the
+    scan_info dict accepted by scan_lines and scan. Callers that split one
+    scan into several calls, possibly in other processes, pass each call
+    the same absolute deadline from new_deadline(), so the whole scan gets
+    one budget rather than one per call.
+
+    Passing a pattern_times list (one float per entry) to scan_lines or scan
+    skips the combined prefilter and runs each pattern over all lines on its
+    own, adding the seconds each pattern took. Findings and the time budget
+    are the same; this is for profiling sampled scans, since it is several
+    times slower.
+    """
+
+    def __init__(
+        self,
+        rules: Dict[str, Dict[str, Any]],
+        flags: int = re.IGNORECASE,
+        backend: str = 're',
+        max_line_length: int = 0,
+        time_budget: float = 0.0,
+        samples: Sequence[str] = (),
+        literal_prefilter: bool = True
+    ):
+        if backend not in ('re', 're2', 'auto'):
+            raise ValueError(f"Unknown match backend: {backend}")
+        if backend == 're2' and load_re2() is None:
+            raise ValueError("Match backend re2 needs the google-re2 package")
+        self.rules = rules
+        self.flags = flags
+        self.backend = backend
+        self.max_line_length = max_line_length
+        self.time_budget = time_budget
+        self.samples = list(samples)
+        self.literal_prefilter = literal_prefilter
+        linear = backend == 're2' or (backend == 'auto' and load_re2() is not None)
+
+        # (rule_name, rule_data, pattern source, compiled pattern)
+        self.entries = []
+        # Backend actually used for each entry, and why a pattern couldn't use RE2
+        self.entry_backends: List[str] = []
+        self.incompatible: Dict[str, str] = {}
+        for rule_name, rule_data in rules.items():
+            rewrites = rule_data.get('linear_patterns', {})
+            for pattern in rule_data['patterns']:
+                compiled = re.compile(pattern, flags)
+                entry_backend = 're'
+                if linear:
+                    try:
+                        compiled = self._validated_linear(pattern, rewrites.get(pattern, pattern), compiled)
+                        entry_backend = 're2'
+                    except ValueError as e:
+                        self.incompatible[pattern] = str(e)
+                self.entries.append((rule_name, rule_data, pattern, compiled))
+                self.entry_backends.append(entry_backend)
+
+        # Entries matched over the whole text rather than line by line, and
+        # their patterns compiled for bytes (RE2 entries stay RE2)
+        self.spanning: List[int] = [idx for idx, entry in enumerate(self.entries) if spans_lines(entry[2])]
+        # Most lines a finding of each rule with line-spanning patterns covers
+        self.line_spans: Dict[str, int] = {}
+        for idx in self.spanning:
+            rule_name = self.entries[idx][0]
+            self.line_spans[rule_name] = max(self.line_spans.get(rule_name, 1), line_span(self.entries[idx][2]))
+        self._binary_patterns = {
+            idx: (compile_linear if self.entry_backends[idx] == 're2' else re.compile)(self._source(idx).encode('utf-8'), flags)
+            for idx in self.spanning
+        }
+
+        # RE2 entries share an RE2 prefilter; re entries share an re one
+        self._prefilters = []
+        for entry_backend in ('re2', 're'):
+            indexes = [
+                idx for idx, used in enumerate(self.entry_backends) if used == entry_backend and idx not in self.spanning
+            ]
+            if not indexes:
+                continue
+            sources = '|'.join(f'(?:{self._source(idx)})' for idx in indexes)
+            combined = compile_linear(sources, flags) if entry_backend == 're2' else re.compile(sources, flags)
+            self._prefilters.append((combined, indexes))
+        self.combined = self._prefilters[0][0] if self._prefilters else None
+
+        # Case-folded literal -> entries that need it (or another of their literals)
+        self.literals: Dict[str, List[int]] = {}
+        self.unfiltered: List[int] = []
+        for idx in range(len(self.entries)):
+            if idx in self.spanning:
+                continue
+            literals = required_literals(self._source(idx)) if literal_prefilter else None
+            if literals is None:
+                self.unfiltered.append(idx)
+                continue
+            for literal in literals:
+                self.literals.setdefault(literal, []).append(idx)
+        self._selections: Dict[Optional[str], Set[int]] = {}
+
+    def _source(self, idx: int) -> str:
+        """Pattern text compiled for entry idx (the rewrite, for RE2 entries)"""
+        pattern = self.entries[idx][2]
+        if self.entry_backends[idx] == 're2':
+            return self.entries[idx][1].get('linear_patterns', {}).get(pattern, pattern)
+        return pattern
+
+    def _validated_linear(self, pattern: str, source: str, reference):
+        compiled = compile_linear(source, self.flags)
+        for line in self.samples:
+            if bool(compiled.search(line)) != bool(reference.search(line)):
+                raise ValueError(f"RE2 and re disagree on sample line {line[:80]!r}")
+        return compiled
+
+    def options(self) -> Dict[str, Any]:
+        """Constructor arguments that rebuild an equivalent engine (e.g. in worker processes)"""
+        return {
+            'flags': self.flags,
+            'backend': self.backend,
+            'max_line_length': self.max_line_length,
+            'time_budget': self.time_budget,
+            'samples': self.samples,
+            'literal_prefilter': self.literal_prefilter
+        }
+
+    def line_span(self, rule_name: str) -> int:
+        """Most lines a finding of rule_name covers, starting at its line_number"""
+        return self.line_spans.get(rule_name, 1)
+
+    def max_line_span(self) -> int:
+        return max(self.line_spans.values(), default=1)
+
+    def select(self, language: Optional[str] = None) -> Set[int]:
+        """Indexes of the entries whose rule applies to language (all if None)"""
+        language = language.strip().lower() if language else None
+        selected = self._selections.get(language)
+        if selected is None:
+            selected = self._selections[language] = {
+                idx for idx, (_, rule_data, _, _) in enumerate(self.entries)
+                if language is None or 'languages' not in rule_data or language in rule_data['languages']
+            }
+        return selected
+
+    def match_line(self, line: str) -> List[int]:
+        """Return the indexes of every entry whose pattern matches the line"""
+        matched = []
+        for combined, indexes in self._prefilters:
+            if combined.search(line):
+                matched.extend(idx for idx in indexes if self.entries[idx][3].search(line))
+        return matched
+
+    def _candidates(self, lines: List[str], selected: Set[int]) -> Dict[int, Set[int]]:
+        """Map of line index -> selected entries that have one of their literals on it"""
+        folded = fold('\n'.join(lines))
+        starts = [0]
+        for line in folded.split('\n')[:-1]:
+            starts.append(starts[-1] + len(line) + 1)
+        candidates: Dict[int, Set[int]] = {}
+        for literal, indexes in self.literals.items():
+            indexes = [idx for idx in indexes if idx in selected]
+            if not indexes:
+                continue
+            pos = folded.find(literal)
+            while pos != -1:
+                n = bisect_right(starts, pos) - 1
+                candidates.setdefault(n, set()).update(indexes)
+                # One hit per line is enough; resume at the next line
+                if n + 1 == len(starts):
+                    break
+                pos = folded.find(literal, starts[n + 1])
+        return candidates
+
+    def _filtered_hits(self, lines: List[str], first_line: int, selected: Set[int], deadline: Optional[float]):
+        """Hits per entry, running each pattern only on its candidate lines; also returns timed_out"""
+        hits = [[] for _ in self.entries]
+        entries = self.entries
+        unfiltered = {idx for idx in self.unfiltered if idx in selected}
+        candidates = self._candidates(lines, selected)
+        if unfiltered:
+            rest = [(n, set()) for n in range(len(lines))]
+            for n, indexes in candidates.items():
+                rest[n] = (n, indexes)
+        else:
+            rest = sorted(candidates.items())
+        for checked, (n, indexes) in enumerate(rest):
+            if deadline is not None and checked % BUDGET_CHECK_LINES == 0 and time.time() > deadline:
+                logger.warning(f"Scan time budget of {self.time_budget}s exhausted after {n} of {len(lines)} lines")
+                return hits, True
+            line = lines[n]
+            for idx in indexes:
+                if entries[idx][3].search(line):
+                    hits[idx].append((first_line + n, line))
+            if unfiltered:
+                for idx in self.match_line(line):
+                    if idx in unfiltered:
+                        hits[idx].append((first_line + n, line))
+        return hits, False
+
+    def _profiled_hits(
+        self,
+        lines: List[str],
+        first_line: int,
+        pattern_times: List[float],
+        selected: Set[int],
+        deadline: Optional[float]
+    ):
+        """Hits per entry, running each pattern over every line on its own; also returns timed_out"""
+        hits = [[] for _ in self.entries]
+        for idx, entry in enumerate(self.entries):
+            if idx not in selected or idx in self.spanning:
+                continue
+            search = entry[3].search
+            started = time.perf_counter()
+            for n, line in enumerate(lines):
+                if deadline is not None and n % BUDGET_CHECK_LINES == 0 and time.time() > deadline:
+                    pattern_times[idx] += time.perf_counter() - started
+                    logger.warning(f"Scan time budget of {self.time_budget}s exhausted while profiling a pattern")
+                    return hits, True
+                if search(line):
+                    hits[idx].append((first_line + n, line))
+            pattern_times[idx] += time.perf_counter() - started
+        return hits, False
+
+    def _line_text(self, text, line_starts: Sequence[int], n: int) -> Tuple[str, bool]:
+        """Line n of text cut to max_line_length, and whether it was cut"""
+        start = line_starts[n]
+        end = line_starts[n + 1] - 1 if n + 1 < len(line_starts) else len(text)
+        limit = self.max_line_length
+        if isinstance(text, str):
+            line = text[start:end]
+        else:
+            if limit:
+                # Enough bytes for limit + 1 characters of any encoded width
+                end = min(end, start + 4 * limit + 4)
+            line = bytes(text[start:end]).decode('utf-8', 'replace')
+        if limit and len(line) > limit:
+            return line[:limit], True
+        return line, False
+
+    def _add_spanning_hits(
+        self,
+        text,
+        line_starts: Sequence[int],
+        first_line: int,
+        selected: Set[int],
+        hits: List[List[Tuple[int, str]]],
+        truncated: Set[int],
+        pattern_times: Optional[List[float]],
+        deadline: Optional[float]
+    ) -> bool:
+        """Match the selected line-spanning patterns over all of text; returns timed_out.
+
+        text is a str, or a bytes-like buffer with line_starts in bytes. A
+        match is a hit on the line it starts on, at most once per line.
+        """
+        binary = not isinstance(text, str)
+        for idx in self.spanning:
+            if idx not in selected:
+                continue
+            if deadline is not None and time.time() > deadline:
+                logger.warning(f"Scan time budget of {self.time_budget}s exhausted before line-spanning patterns")
+                return True
+            compiled = self._binary_patterns[idx] if binary else self.entries[idx][3]
+            started = time.perf_counter()
+            last = -1
+            for match in compiled.finditer(text):
+                n = bisect_right(line_starts, match.start()) - 1
+                if n == last:
+                    continue
+                last = n
+                line, cut = self._line_text(text, line_starts, n)
+                hits[idx].append((first_line + n, line))
+                if cut:
+                    truncated.add(first_line + n)
+            if pattern_times is not None:
+                pattern_times[idx] += time.perf_counter() - started
+        return False
+
+    def _limit_lines(self, lines: List[str], first_line: int, scan_info: Optional[Dict[str, Any]]):
+        """Apply max_line_length; returns (lines to match, truncated line numbers)"""
+        truncated = set()
+        if self.max_line_length:
+            limit = self.max_line_length
+            for i, line in enumerate(lines, first_line):
+                if len(line) > limit:
+                    truncated.add(i)
+            if truncated:
+                lines = [line[:limit] for line in lines]
+        if scan_info is not None:
+            scan_info['truncated_lines'] = scan_info.get('truncated_lines', 0) + len(truncated)
+        return lines, truncated
+
+    def _findings(self, hits: List[List[Tuple[int, str]]], truncated: Set[int]) -> List[Dict[str, Any]]:
+        findings = []
+        for (rule_name, rule_data, pattern, _), entry_hits in zip(self.entries, hits):
+            for line_number, line in entry_hits:
+                finding = {
+                    'type': rule_name,
+                    'severity': rule_data['severity'],
+                    'title': rule_data['description'],
+                    'line_number': line_number,
+                    'code_snippet': line.strip(),
+                    'owasp': rule_data['owasp'],
+                    'pattern_matched': pattern
+                }
+                if line_number in truncated:
+                    finding['truncated'] = True
+                findings.append(finding)
+        return findings
+
+    def new_deadline(self) -> Optional[float]:
+        """Absolute end of a scan starting now, or None without a time budget.
+
+        Wall-clock time, so a deadline set in one process holds in the
+        scan executor's worker processes.
+        """
+        if not self.time_budget:
+            return None
+        return time.time() + self.time_budget
+
+    def _deadline(self, deadline: Optional[float]) -> Optional[float]:
+        return deadline if deadline is not None else self.new_deadline()
+
+    def _scan(
+        self,
+        lines: List[str],
+        text: Optional[str],
+        first_line: int,
+        pattern_times: Optional[List[float]],
+        scan_info: Optional[Dict[str, Any]],
+        language: Optional[str],
+        spanning: bool,
+        deadline: Optional[float]
+    ) -> List[Dict[str, Any]]:
+        selected = self.select(language)
+        spanned = spanning and any(idx in selected for idx in self.spanning)
+        if spanned:
+            if text is None:
+                text = '\n'.join(lines)
+            line_starts = array('q', accumulate((len(line) + 1 for line in lines[:-1]), initial=0))
+        lines, truncated = self._limit_lines(lines, first_line, scan_info)
+        deadline = self._deadline(deadline)
+        if pattern_times is not None:
+            hits, timed_out = self._profiled_hits(lines, first_line, pattern_times, selected, deadline)
+        else:
+            hits, timed_out = self._filtered_hits(lines, first_line, selected, deadline)
+        if spanned and not timed_out:
+            timed_out = self._add_spanning_hits(text, line_starts, first_line, selected, hits, truncated, pattern_times, deadline)
+        if scan_info is not None:
+            scan_info['timed_out'] = scan_info.get('timed_out', False) or timed_out
+        return self._findings(hits, truncated)
+
+    def scan_lines(
+        self,
+        lines: List[str],
+        first_line: int = 1,
+        pattern_times: Optional[List[float]] = None,
+        scan_info: Optional[Dict[str, Any]] = None,
+        language: Optional[str] = None,
+        spanning: bool = True,
+        deadline: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """Scan pre-split lines; line numbers start at first_line.
+
+        scan_info, if given, gets truncated_lines (count of lines cut to
+        max_line_length) and timed_out (True if the time budget ran out
+        before the last line). spanning=False leaves out the line-spanning
+        patterns, for callers that scan slices of a text and run
+        scan_spanning over all of it. deadline, from new_deadline(),
+        replaces the time budget of this call.
+        """
+        return self._scan(lines, None, first_line, pattern_times, scan_info, language, spanning, deadline)
+
+    def scan(
+        self,
+        code: str,
+        pattern_times: Optional[List[float]] = None,
+        scan_info: Optional[Dict[str, Any]] = None,
+        language: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """Scan a source string"""
+        return self._scan(code.split('\n'), code, 1, pattern_times, scan_info, language, True, deadline)
+
+    def scan_spanning(
+        self,
+        code: str,
+        pattern_times: Optional[List[float]] = None,
+        scan_info: Optional[Dict[str, Any]] = None,
+        language: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """Only the line-spanning patterns, over all of code (see scan_lines)"""
+        hits = [[] for _ in self.entries]
+        truncated: Set[int] = set()
+        line_starts = array('q', [0])
+        line_starts.extend(match.end() for match in NEWLINE.finditer(code))
+        timed_out = self._add_spanning_hits(
+            code, line_starts, 1, self.select(language), hits, truncated, pattern_times, self._deadline(deadline)
+        )
+        if scan_info is not None:
+            scan_info['timed_out'] = scan_info.get('timed_out', False) or timed_out
+        return self._findings(hits, truncated)
+
+    def _windows(self, buffer, window_bytes: int, with_starts: bool) -> Iterator[Tuple[List[int], List[str]]]:
+        """Decoded lines of buffer, about window_bytes at a time, with their start offsets if with_starts"""
+        size = len(buffer)
+        cap = 4 * self.max_line_length + 4 if self.max_line_length else 0
+        pos = 0
+        while pos < size:
+            end = size
+            if pos + window_bytes < size:
+                end = buffer.rfind(b'\n', pos, pos + window_bytes)
+                if end == -1:
+                    # A single line longer than the window
+                    end = buffer.find(b'\n', pos + window_bytes)
+                    if end == -1:
+                        end = size
+                    if cap and end - pos > cap:
+                        # Only enough of it for its first max_line_length characters
+                        yield [pos], [bytes(buffer[pos:pos + cap]).decode('utf-8', 'replace')]
+                        pos = end + 1
+                        continue
+            chunk = buffer[pos:end]
+            starts = list(accumulate((len(line) + 1 for line in chunk.split(b'\n')[:-1]), initial=pos)) if with_starts else []
+            yield starts, bytes(chunk).decode('utf-8', 'replace').split('\n')
+            pos = end + 1
+
+    def scan_buffer(
+        self,
+        buffer: Union[bytes, bytearray, mmap.mmap],
+        pattern_times: Optional[List[float]] = None,
+        scan_info: Optional[Dict[str, Any]] = None,
+        language: Optional[str] = None,
+        window_bytes: int = WINDOW_BYTES
+    ) -> List[Dict[str, Any]]:
+        """Scan UTF-8 bytes or a memory-mapped file; finds what scan finds on the decoded text.
+
+        Only one window of decoded lines is held at a time, plus (when a
+        selected rule spans lines) an array of line start offsets; lines
+        longer than a window are decoded only as far as max_line_length
+        needs. Undecodable bytes are replaced. Line-spanning patterns run
+        over the buffer itself; with the re backend they compare letters
+        case-insensitively in ASCII only.
+        """
+        selected = self.select(language)
+        spanned = any(idx in selected for idx in self.spanning)
+        hits = [[] for _ in self.entries]
+        truncated: Set[int] = set()
+        # Four bytes per line below 4GB
+        line_starts = array('I' if len(buffer) < 2 ** 32 else 'q')
+        deadline = self._deadline(None)
+        timed_out = False
+        first_line = 1
+        if scan_info is not None:
+            scan_info.setdefault('truncated_lines', 0)
+        for starts, lines in self._windows(buffer, window_bytes, spanned):
+            line_starts.extend(starts)
+            lines, cut = self._limit_lines(lines, first_line, scan_info)
+            truncated |= cut
+            if pattern_times is not None:
+                window_hits, timed_out = self._profiled_hits(lines, first_line, pattern_times, selected, deadline)
+            else:
+                window_hits, timed_out = self._filtered_hits(lines, first_line, selected, deadline)
+            for entry_hits, new_hits in zip(hits, window_hits):
+                entry_hits.extend(new_hits)
+            first_line += len(lines)
+            if timed_out:
+                break
+        if spanned and not timed_out:
+            timed_out = self._add_spanning_hits(buffer, line_starts, 1, selected, hits, truncated, pattern_times, deadline)
+        if scan_info is not None:
+            scan_info['timed_out'] = scan_info.get('timed_out', False) or timed_out
+        return self._findings(hits, truncated)
@@ -0,0 +1,216 @@
+import asyncio
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from rule_engine import RuleEngine
+
+# Per-process engine, built by the pool initializer
+_worker_engine: Optional[RuleEngine] = None
+
+# Workers are started fresh rather than forked from the server: a fork
+# copies the server's threads' locks (thread pool, Mongo driver, logging)
+# in whatever state they happen to be in
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def init_worker(rules: Dict[str, Dict[str, Any]], engine_options: Optional[Dict[str, Any]] = None):
+    global _worker_engine
+    _worker_engine = RuleEngine(rules, **(engine_options or {}))
+
+
+def worker_engine() -> RuleEngine:
+    return _worker_engine
+
+
+def scan_chunk(
+    text: str,
+    first_line: int,
+    profile: bool = False,
+    language: Optional[str] = None,
+    spanning: bool = True,
+    deadline: Optional[float] = None
+) -> Tuple[List[Dict[str, Any]], Optional[List[float]], Dict[str, Any]]:
+    """Scan a slice of a file inside a worker; line numbers start at first_line.
+
+    Returns the findings, the seconds spent per pattern when profiling, and
+    the engine's scan_info. spanning and deadline are passed on to
+    RuleEngine.scan_lines.
+    """
+    pattern_times = [0.0] * len(_worker_engine.entries) if profile else None
+    scan_info: Dict[str, Any] = {}
+    findings = _worker_engine.scan_lines(
+        text.split('\n'), first_line, pattern_times, scan_info, language, spanning, deadline
+    )
+    return findings, pattern_times, scan_info
+
+
+def create_process_pool(
+    rules: Dict[str, Dict[str, Any]],
+    workers: Optional[int] = None,
+    engine_options: Optional[Dict[str, Any]] = None
+) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(START_METHOD),
+        initializer=init_worker,
+        initargs=(rules, engine_options)
+    )
+
+
+class ScanExecutor:
+    """Runs rule-engine scans off the event loop.
+
+    mode is one of:
+      "auto"    - thread pool below process_threshold bytes, process pool above
+      "thread"  - always the thread pool
+      "process" - always the process pool
+      "inline"  - on the calling thread (blocks the event loop; for comparison)
+
+    Process-pool scans split the input into chunk_lines slices so a single
+    large file is spread across workers; line-spanning patterns, which may
+    match across slices, run over the whole input in the thread pool
+    meanwhile. All slices share one deadline, so the engine's time budget
+    applies to the scan, not to each slice.
+
+    scan_buffer scans bytes or a memory-mapped upload with
+    RuleEngine.scan_buffer in the thread pool (inline in "inline" mode),
+    without decoding it into one string.
+
+    A profile_rate fraction of scans is run in the engine's per-pattern
+    profiling mode and on_profile is called with the seconds per entry.
+    """
+
+    def __init__(
+        self,
+        rules: Dict[str, Dict[str, Any]],
+        engine: RuleEngine,
+        mode: str = 'auto',
+        process_threshold: int = 256 * 1024,
+        chunk_lines: int = 5000,
+        threads: int = 4,
+        workers: Optional[int] = None,
+        profile_rate: float = 0.0,
+        on_profile: Optional[Callable[[List[float]], None]] = None
+    ):
+        if mode not in ('auto', 'thread', 'process', 'inline'):
+            raise ValueError(f"Unknown scan executor mode: {mode}")
+        self.rules = rules
+        self.engine = engine
+        self.mode = mode
+        self.process_threshold = process_threshold
+        self.chunk_lines = chunk_lines
+        self.threads = threads
+        self.workers = workers
+        self.profile_rate = profile_rate
+        self.on_profile = on_profile
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._order = {(entry[0], entry[2]): idx for idx, entry in enumerate(engine.entries)}
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='scan')
+        return self._thread_pool
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = create_process_pool(self.rules, self.workers, self.engine.options())
+        return self._process_pool
+
+    async def scan(
+        self,
+        code: str,
+        scan_info: Optional[Dict[str, Any]] = None,
+        language: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Scan code and return findings in the same order as RuleEngine.scan.
+
+        scan_info, if given, is filled in as by RuleEngine.scan_lines; language
+        selects rules as there.
+        """
+        mode = self.mode
+        if mode == 'auto':
+            mode = 'process' if len(code) >= self.process_threshold else 'thread'
+
+        profile = self.on_profile is not None and random.random() < self.profile_rate
+        pattern_times = [0.0] * len(self.engine.entries) if profile else None
+
+        if mode == 'inline':
+            findings = self.engine.scan(code, pattern_times, scan_info, language)
+        elif mode == 'thread':
+            loop = asyncio.get_running_loop()
+            findings = await loop.run_in_executor(self.thread_pool, self.engine.scan, code, pattern_times, scan_info, language)
+        else:
+            findings = await self._scan_chunks(code, profile, pattern_times, scan_info, language)
+
+        if profile:
+            self.on_profile(pattern_times)
+        return findings
+
+    async def _scan_chunks(
+        self,
+        code: str,
+        profile: bool,
+        pattern_times: Optional[List[float]],
+        scan_info: Optional[Dict[str, Any]],
+        language: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        lines = code.split('\n')
+        deadline = self.engine.new_deadline()
+        chunks = [
+            loop.run_in_executor(
+                self.process_pool, scan_chunk,
+                '\n'.join(lines[i:i + self.chunk_lines]), i + 1, profile, language, False, deadline
+            )
+            for i in range(0, len(lines), self.chunk_lines)
+        ]
+        spanning_info: Dict[str, Any] = {}
+        spanning = loop.run_in_executor(
+            self.thread_pool, self.engine.scan_spanning, code, pattern_times, spanning_info, language, deadline
+        )
+        *results, findings = await asyncio.gather(*chunks, spanning)
+        if scan_info is not None:
+            scan_info['timed_out'] = scan_info.get('timed_out', False) or spanning_info['timed_out']
+        for chunk_findings, chunk_times, chunk_info in results:
+            findings.extend(chunk_findings)
+            if pattern_times is not None:
+                for idx, seconds in enumerate(chunk_times):
+                    pattern_times[idx] += seconds
+            if scan_info is not None:
+                scan_info['truncated_lines'] = scan_info.get('truncated_lines', 0) + chunk_info['truncated_lines']
+                scan_info['timed_out'] = scan_info.get('timed_out', False) or chunk_info['timed_out']
+        # Each chunk is ordered rule -> pattern -> line; restore that order across chunks
+        findings.sort(key=lambda f: (self._order[(f['type'], f['pattern_matched'])], f['line_number']))
+        return findings
+
+    async def scan_buffer(
+        self,
+        buffer,
+        scan_info: Optional[Dict[str, Any]] = None,
+        language: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Scan bytes or an mmap.mmap; the caller keeps the buffer open until this returns"""
+        profile = self.on_profile is not None and random.random() < self.profile_rate
+        pattern_times = [0.0] * len(self.engine.entries) if profile else None
+        if self.mode == 'inline':
+            findings = self.engine.scan_buffer(buffer, pattern_times, scan_info, language)
+        else:
+            loop = asyncio.get_running_loop()
+            findings = await loop.run_in_executor(self.thread_pool, self.engine.scan_buffer, buffer, pattern_times, scan_info, language)
+        if profile:
+            self.on_profile(pattern_times)
+        return findings
+
+    def shutdown(self):
+        """Stop the pools; they are created again if the executor is used after this"""
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(cancel_futures=True)
+            self._process_pool = None
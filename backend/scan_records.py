@@ -0,0 +1,187 @@
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from starlette.responses import Response, StreamingResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Field order of a vulnerability in responses and stored scans (VulnerabilityIssue)
+VULNERABILITY_FIELDS = (
+    'id', 'type', 'severity', 'title', 'description', 'filename', 'line_number', 'code_snippet',
+    'change_status', 'truncated', 'ai_explanation', 'confidence_score', 'policy_mappings', 'recommendation'
+)
+
+# Field order of a scan result (ScanResult), with the defaults of the optional fields
+SCAN_RESULT_FIELDS = (
+    'id', 'scan_id', 'timestamp', 'language', 'project_context', 'scan_profile', 'total_issues',
+    'critical_count', 'high_count', 'medium_count', 'low_count', 'risk_score', 'deployment_ready',
+    'vulnerabilities', 'archive_summary', 'status', 'base_scan_id', 'fixed_vulnerabilities', 'truncated'
+)
+SCAN_RESULT_DEFAULTS = {
+    'archive_summary': None, 'status': 'complete', 'base_scan_id': None, 'fixed_vulnerabilities': None, 'truncated': False
+}
+
+
+class Vulnerability:
+    """A finding with its AI analysis, as it moves through the scan pipeline.
+
+    A slotted record instead of the VulnerabilityIssue model: nothing is
+    validated or copied until as_dict() turns it into the stored and
+    returned form, once per scan.
+    """
+
+    __slots__ = VULNERABILITY_FIELDS
+
+    def __init__(
+        self,
+        type: str,
+        severity: str,
+        title: str,
+        description: str,
+        ai_explanation: str,
+        confidence_score: float,
+        policy_mappings: List[str],
+        recommendation: str,
+        filename: Optional[str] = None,
+        line_number: Optional[int] = None,
+        code_snippet: Optional[str] = None,
+        change_status: Optional[str] = None,
+        truncated: bool = False,
+        id: Optional[str] = None
+    ):
+        self.id = id or str(uuid.uuid4())
+        self.type = type
+        self.severity = severity
+        self.title = title
+        self.description = description
+        self.filename = filename
+        self.line_number = line_number
+        self.code_snippet = code_snippet
+        self.change_status = change_status
+        self.truncated = truncated
+        self.ai_explanation = ai_explanation
+        self.confidence_score = float(confidence_score)
+        self.policy_mappings = policy_mappings
+        self.recommendation = recommendation
+
+    @classmethod
+    def from_dict(cls, doc: Dict[str, Any]) -> 'Vulnerability':
+        """Rebuild a stored vulnerability, ignoring bookkeeping fields such as position"""
+        return cls(**{field: doc[field] for field in VULNERABILITY_FIELDS if field in doc})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'type': self.type,
+            'severity': self.severity,
+            'title': self.title,
+            'description': self.description,
+            'filename': self.filename,
+            'line_number': self.line_number,
+            'code_snippet': self.code_snippet,
+            'change_status': self.change_status,
+            'truncated': self.truncated,
+            'ai_explanation': self.ai_explanation,
+            'confidence_score': self.confidence_score,
+            'policy_mappings': self.policy_mappings,
+            'recommendation': self.recommendation
+        }
+
+
+def summarize_vulnerabilities(vulnerabilities: List[Vulnerability]) -> Dict[str, Any]:
+    """Severity counts, risk score and deployment readiness for a scan"""
+    severity_counts = {'Critical': 0, 'High': 0, 'Medium': 0, 'Low': 0}
+    for v in vulnerabilities:
+        severity_counts[v.severity] = severity_counts.get(v.severity, 0) + 1
+
+    critical_count = severity_counts['Critical']
+    high_count = severity_counts['High']
+    medium_count = severity_counts['Medium']
+    low_count = severity_counts['Low']
+
+    return {
+        'total_issues': len(vulnerabilities),
+        'critical_count': critical_count,
+        'high_count': high_count,
+        'medium_count': medium_count,
+        'low_count': low_count,
+        'risk_score': float(min(100, (critical_count * 10 + high_count * 5 + medium_count * 2 + low_count * 0.5))),
+        'deployment_ready': critical_count == 0 and high_count <= 2
+    }
+
+
+def scan_result(
+    scan_id: str,
+    language: str,
+    project_context: str,
+    scan_profile: str,
+    vulnerabilities: List[Vulnerability],
+    fixed_vulnerabilities: Optional[List[Vulnerability]] = None,
+    **fields: Any
+) -> Dict[str, Any]:
+    """A scan result as a plain dict in ScanResult field order, ready to store and return.
+
+    fields sets the optional ScanResult fields (archive_summary, status,
+    base_scan_id, truncated). The timestamp is a UTC ISO string, as stored.
+    """
+    values = {
+        'id': str(uuid.uuid4()),
+        'scan_id': scan_id,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'language': language,
+        'project_context': project_context,
+        'scan_profile': scan_profile,
+        **summarize_vulnerabilities(vulnerabilities),
+        'vulnerabilities': [v.as_dict() for v in vulnerabilities],
+        **SCAN_RESULT_DEFAULTS,
+        **fields
+    }
+    if fixed_vulnerabilities is not None:
+        values['fixed_vulnerabilities'] = [v.as_dict() for v in fixed_vulnerabilities]
+    return {field: values[field] for field in SCAN_RESULT_FIELDS}
+
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(value: Any) -> bytes:
+    """Compact UTF-8 JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_encode_default).encode('utf-8')
+
+
+def iter_json(doc: Dict[str, Any], chunk_items: int) -> Iterator[bytes]:
+    """Encode doc piecewise: lists longer than chunk_items go out chunk_items elements at a time"""
+    yield b'{'
+    for n, (key, value) in enumerate(doc.items()):
+        yield (b',' if n else b'') + encode_json(key) + b':'
+        if isinstance(value, list) and len(value) > chunk_items:
+            yield b'['
+            for start in range(0, len(value), chunk_items):
+                # Strip the brackets of each slice to splice them into one array
+                yield (b',' if start else b'') + encode_json(value[start:start + chunk_items])[1:-1]
+            yield b']'
+        else:
+            yield encode_json(value)
+    yield b'}'
+
+
+def json_response(doc: Dict[str, Any], stream_threshold: int, chunk_items: int = 500) -> Response:
+    """Encode a scan for the client once, bypassing response_model validation.
+
+    Scans with more than stream_threshold vulnerabilities are streamed in
+    chunks instead of being encoded into one buffer; 0 never streams.
+    """
+    if stream_threshold and len(doc.get('vulnerabilities') or ()) > stream_threshold:
+        # The iterator runs in a worker thread, off the event loop
+        return StreamingResponse(iter_json(doc, chunk_items), media_type='application/json')
+    return Response(encode_json(doc), media_type='application/json')
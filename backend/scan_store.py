@@ -0,0 +1,341 @@
+import asyncio
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Internal bookkeeping fields that are not returned with a scan;
+# the precomputed compliance report is served by /api/compliance instead
+HIDDEN_FIELDS = {'_id': 0, 'created_at': 0, 'content_hash': 0, 'compliance': 0, 'rule_types': 0}
+
+# Fields returned for each scan by list_scans
+SCAN_LISTING = {
+    '_id': 0,
+    'scan_id': 1,
+    'timestamp': 1,
+    'language': 1,
+    'project_context': 1,
+    'scan_profile': 1,
+    'status': 1,
+    'total_issues': 1,
+    'critical_count': 1,
+    'high_count': 1,
+    'medium_count': 1,
+    'low_count': 1,
+    'risk_score': 1,
+    'deployment_ready': 1
+}
+
+# Newest first; scan_id breaks ties between scans stored in the same instant
+LISTING_ORDER = [('timestamp', -1), ('scan_id', -1)]
+
+# Equality filters of the scan listing, each indexed ahead of LISTING_ORDER
+LISTING_FILTERS = ['project_context', 'language', 'scan_profile', 'deployment_ready']
+
+# Bookkeeping fields of split-layout vulnerability documents
+VULNERABILITY_HIDDEN = {'_id': 0, 'scan_id': 0, 'position': 0, 'created_at': 0}
+
+# Per-scan row returned by compliance_summaries
+COMPLIANCE_SUMMARY = {
+    '_id': 0,
+    'scan_id': 1,
+    'timestamp': 1,
+    'project_context': 1,
+    'status': 1,
+    'risk_score': 1,
+    'deployment_ready': 1,
+    'owasp_score': '$compliance.owasp.compliance_score',
+    'iso27001_score': '$compliance.iso27001.score',
+    'nist_score': '$compliance.nist.score',
+    'gdpr_compliant': '$compliance.gdpr.compliant'
+}
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Opaque pagination cursor pointing just past doc"""
+    return base64.urlsafe_b64encode(json.dumps([doc['timestamp'], doc['scan_id']]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        timestamp, scan_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(timestamp, str) or not isinstance(scan_id, str):
+        raise ValueError("Invalid cursor")
+    return timestamp, scan_id
+
+
+class ScanStore:
+    """Persistence for scan documents.
+
+    layout "embedded" keeps vulnerabilities inside the scan document (the
+    original layout); "split" writes them to a separate vulnerabilities
+    collection with insert_many so scan documents stay small. Reads handle
+    both layouts, so the setting can be changed without a migration.
+    retention_days > 0 adds TTL indexes that expire old scans together with
+    their split-layout vulnerabilities and line index: every document
+    written for a scan is stamped with created_at.
+    """
+
+    def __init__(self, db, layout: str = 'embedded', retention_days: int = 0):
+        if layout not in ('embedded', 'split'):
+            raise ValueError(f"Unknown scan storage layout: {layout}")
+        self.db = db
+        self.layout = layout
+        self.retention_days = retention_days
+
+    async def ensure_indexes(self):
+        scans = self.db.scans
+        await scans.create_index('scan_id', unique=True)
+        await scans.create_index(LISTING_ORDER)
+        for field in LISTING_FILTERS:
+            await scans.create_index([(field, 1), *LISTING_ORDER])
+        await scans.create_index([('content_hash', 1), ('timestamp', -1)], sparse=True)
+        await scans.create_index('vulnerabilities.id', sparse=True)
+        await self.db.vulnerabilities.create_index([('scan_id', 1), ('position', 1)])
+        await self.db.vulnerabilities.create_index('id')
+        await self.db.scan_sources.create_index('scan_id', unique=True)
+        if self.retention_days > 0:
+            for collection in (scans, self.db.vulnerabilities, self.db.scan_sources):
+                await collection.create_index('created_at', expireAfterSeconds=self.retention_days * 24 * 3600)
+
+    async def insert_scan(self, doc: Dict[str, Any]):
+        doc = {**doc, 'created_at': datetime.now(timezone.utc)}
+        if self.layout == 'embedded':
+            await self.db.scans.insert_one(doc)
+            return
+        vulnerabilities = doc.pop('vulnerabilities', [])
+        doc['storage_layout'] = 'split'
+        await self.db.scans.insert_one(doc)
+        await self._insert_vulnerabilities(doc['scan_id'], vulnerabilities, created_at=doc['created_at'])
+
+    async def _insert_vulnerabilities(
+        self,
+        scan_id: str,
+        vulnerabilities: List[Dict[str, Any]],
+        start: int = 0,
+        created_at: Optional[datetime] = None
+    ):
+        if vulnerabilities:
+            created_at = created_at or datetime.now(timezone.utc)
+            await self.db.vulnerabilities.insert_many([
+                {**vuln, 'scan_id': scan_id, 'position': start + i, 'created_at': created_at}
+                for i, vuln in enumerate(vulnerabilities)
+            ])
+
+    async def _attach_vulnerabilities(self, doc: Dict[str, Any], fields: Optional[List[str]]):
+        """Fill doc['vulnerabilities'] for a split-layout scan"""
+        if fields is None:
+            projection = VULNERABILITY_HIDDEN
+        else:
+            vuln_fields = [f.split('.', 1)[1] for f in fields if f.startswith('vulnerabilities.')]
+            if not vuln_fields and 'vulnerabilities' not in fields:
+                return
+            projection = {'_id': 0, **{f: 1 for f in vuln_fields}} if vuln_fields else VULNERABILITY_HIDDEN
+        cursor = self.db.vulnerabilities.find({'scan_id': doc['scan_id']}, projection).sort('position', 1)
+        doc['vulnerabilities'] = await cursor.to_list(None)
+
+    async def _finish(self, doc: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+        if doc.pop('storage_layout', 'embedded') == 'split':
+            await self._attach_vulnerabilities(doc, fields)
+        return doc
+
+    def _projection(self, fields: Optional[List[str]]) -> Dict[str, Any]:
+        if fields is None:
+            return HIDDEN_FIELDS
+        return {'_id': 0, 'scan_id': 1, 'storage_layout': 1, **{field: 1 for field in fields}}
+
+    async def get_scan(self, scan_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Load a scan, or only the given fields.
+
+        fields are Mongo dotted paths such as ['critical_count',
+        'vulnerabilities.type']; for split-layout scans the vulnerability
+        fields are read from the vulnerabilities collection.
+        """
+        doc = await self.db.scans.find_one({'scan_id': scan_id}, self._projection(fields))
+        if doc is None:
+            return None
+        return await self._finish(doc, fields)
+
+    async def find_latest(self, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Most recent complete scan document matching query"""
+        cursor = self.db.scans.find(query, HIDDEN_FIELDS).sort('timestamp', -1).limit(1)
+        docs = await cursor.to_list(1)
+        if not docs:
+            return None
+        return await self._finish(docs[0], None)
+
+    async def _find_embedded_vulnerability(
+        self, vuln_id: str, fields: List[str], scan_fields: List[str]
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        # The positional projection returns the matched element whole
+        doc = await self.db.scans.find_one(
+            {'vulnerabilities.id': vuln_id},
+            {'_id': 0, 'vulnerabilities.$': 1, **{field: 1 for field in scan_fields}}
+        )
+        if not doc or not doc.get('vulnerabilities'):
+            return None
+        vuln = doc.pop('vulnerabilities')[0]
+        return {field: vuln[field] for field in fields if field in vuln}, doc
+
+    async def _find_split_vulnerability(
+        self, vuln_id: str, fields: List[str], scan_fields: List[str]
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        vuln = await self.db.vulnerabilities.find_one(
+            {'id': vuln_id}, {'_id': 0, 'scan_id': 1, **{field: 1 for field in fields}}
+        )
+        if not vuln:
+            return None
+        scan_id = vuln.pop('scan_id')
+        if 'scan_id' in fields:
+            vuln['scan_id'] = scan_id
+        scan = await self.db.scans.find_one({'scan_id': scan_id}, {'_id': 0, **{field: 1 for field in scan_fields}})
+        return vuln, scan or {}
+
+    async def find_vulnerability(
+        self, vuln_id: str, fields: List[str], scan_fields: List[str]
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """One stored vulnerability by id, as (vulnerability fields, fields of its scan).
+
+        Looks in the layout new scans are written with first, then the
+        other, so findings of scans stored before a layout change are found.
+        """
+        finders = [self._find_embedded_vulnerability, self._find_split_vulnerability]
+        if self.layout == 'split':
+            finders.reverse()
+        for find in finders:
+            found = await find(vuln_id, fields, scan_fields)
+            if found is not None:
+                return found
+        return None
+
+    async def append_vulnerability(self, scan_id: str, position: int, vuln: Dict[str, Any], updates: Dict[str, Any]):
+        """Add one vulnerability to a scan that is still running"""
+        if self.layout == 'embedded':
+            await self.db.scans.update_one({'scan_id': scan_id}, {'$push': {'vulnerabilities': vuln}, **updates})
+            return
+        await self._insert_vulnerabilities(scan_id, [vuln], start=position)
+        await self.db.scans.update_one({'scan_id': scan_id}, updates)
+
+    async def update_scan(self, scan_id: str, fields: Dict[str, Any], vulnerabilities: Optional[List[Dict[str, Any]]] = None):
+        """Set fields on a scan, replacing its vulnerabilities if given"""
+        if vulnerabilities is not None:
+            if self.layout == 'embedded':
+                fields = {**fields, 'vulnerabilities': vulnerabilities}
+            else:
+                await self.db.vulnerabilities.delete_many({'scan_id': scan_id})
+                await self._insert_vulnerabilities(scan_id, vulnerabilities)
+        await self.db.scans.update_one({'scan_id': scan_id}, {'$set': fields})
+
+    async def list_scans(
+        self,
+        query: Dict[str, Any],
+        limit: int,
+        after: Optional[Tuple[str, str]] = None
+    ) -> List[Dict[str, Any]]:
+        """One page of slim scan rows, newest first.
+
+        after is the (timestamp, scan_id) of the last row of the previous
+        page; keyset pagination keeps every page an index range scan.
+        """
+        if after is not None:
+            timestamp, scan_id = after
+            query = {**query, '$or': [
+                {'timestamp': {'$lt': timestamp}},
+                {'timestamp': timestamp, 'scan_id': {'$lt': scan_id}}
+            ]}
+        cursor = self.db.scans.find(query, SCAN_LISTING).sort(LISTING_ORDER).limit(limit)
+        return await cursor.to_list(limit)
+
+    async def aggregate_scans(self, query: Dict[str, Any], bucket_chars: int, top_types: int) -> Dict[str, Any]:
+        """Severity trend, most common finding types and overall means for matching scans.
+
+        Trend buckets are the first bucket_chars characters of the ISO
+        timestamp (10 = day, 7 = month). Each pipeline starts with the same
+        indexed $match and runs concurrently.
+        """
+        trend = [
+            {'$match': query},
+            {'$group': {
+                '_id': {'$substrBytes': ['$timestamp', 0, bucket_chars]},
+                'scans': {'$sum': 1},
+                'critical': {'$sum': '$critical_count'},
+                'high': {'$sum': '$high_count'},
+                'medium': {'$sum': '$medium_count'},
+                'low': {'$sum': '$low_count'},
+                'mean_risk_score': {'$avg': '$risk_score'}
+            }},
+            {'$sort': {'_id': 1}}
+        ]
+        types = [
+            {'$match': query},
+            # Scans stored before rule_types existed still carry embedded findings
+            {'$project': {'_id': 0, 'type': {'$ifNull': ['$rule_types', '$vulnerabilities.type']}}},
+            {'$unwind': '$type'},
+            {'$group': {'_id': '$type', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1, '_id': 1}},
+            {'$limit': top_types}
+        ]
+        overall = [
+            {'$match': query},
+            {'$group': {
+                '_id': None,
+                'scans': {'$sum': 1},
+                'total_issues': {'$sum': '$total_issues'},
+                'mean_risk_score': {'$avg': '$risk_score'},
+                'deployment_ready': {'$sum': {'$cond': ['$deployment_ready', 1, 0]}}
+            }}
+        ]
+        trend_rows, type_rows, overall_rows = await asyncio.gather(
+            self.db.scans.aggregate(trend).to_list(None),
+            self.db.scans.aggregate(types).to_list(None),
+            self.db.scans.aggregate(overall).to_list(None)
+        )
+        totals = overall_rows[0] if overall_rows else {'scans': 0, 'total_issues': 0, 'mean_risk_score': None, 'deployment_ready': 0}
+        totals.pop('_id', None)
+        return {
+            'severity_trend': [{'period': row.pop('_id'), **row} for row in trend_rows],
+            'top_types': [{'type': row['_id'], 'count': row['count']} for row in type_rows],
+            'totals': totals
+        }
+
+    async def compliance_summaries(
+        self,
+        scan_ids: Optional[List[str]] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 1000
+    ) -> List[Dict[str, Any]]:
+        """Compliance scores for many scans in one aggregation, newest first.
+
+        Selects scans by scan_id, or by ISO timestamp range [since, until).
+        Rows for scans without a stored report (older or still running
+        scans) have no score fields.
+        """
+        if scan_ids is not None:
+            match: Dict[str, Any] = {'scan_id': {'$in': scan_ids}}
+        else:
+            window = {}
+            if since is not None:
+                window['$gte'] = since
+            if until is not None:
+                window['$lt'] = until
+            match = {'timestamp': window} if window else {}
+        pipeline = [
+            {'$match': match},
+            {'$sort': {'timestamp': -1}},
+            {'$limit': limit},
+            {'$project': COMPLIANCE_SUMMARY}
+        ]
+        return await self.db.scans.aggregate(pipeline).to_list(None)
+
+    async def save_line_index(self, scan_id: str, hashes: List[str]):
+        await self.db.scan_sources.insert_one(
+            {'scan_id': scan_id, 'line_hashes': hashes, 'created_at': datetime.now(timezone.utc)}
+        )
+
+    async def get_line_index(self, scan_id: str) -> Optional[List[str]]:
+        doc = await self.db.scan_sources.find_one({'scan_id': scan_id}, {'_id': 0, 'line_hashes': 1})
+        return doc['line_hashes'] if doc else None
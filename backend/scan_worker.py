@@ -0,0 +1,34 @@
+"""Worker process for job-mode scans (/api/scan/analyze?mode=job).
+
+    python scan_worker.py [--workers 4]
+
+Run as many as needed, on any host that reaches the same MongoDB: workers
+lease each job, so a job runs on one worker at a time and is retried
+elsewhere if its worker dies. Set SCAN_JOB_WORKERS=0 on API servers that
+should only enqueue.
+"""
+import argparse
+import asyncio
+
+import server
+
+
+async def run(workers: int):
+    # The app's startup and shutdown without the HTTP server
+    server.job_workers.workers = workers
+    async with server.lifespan(server.app):
+        await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=max(server.SCAN_JOB_WORKERS, 1))
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from ai_cache import AnalysisCache, SingleFlight, normalize_snippet
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever build_fix_prompt changes, so cached fixes are regenerated
+FIX_PROMPT_VERSION = "1"
+FIX_SYSTEM_MESSAGE = "You are a security engineer who rewrites vulnerable code into secure code. Reply with JSON only."
+
+# Fields of a stored vulnerability and of its scan that a fix is generated from
+FIX_FIELDS = ['id', 'type', 'severity', 'title', 'description', 'filename', 'code_snippet']
+FIX_SCAN_FIELDS = ['language', 'project_context', 'scan_profile']
+
+# Served when no generated fix is cached and the LLM can't be used
+FIX_TEMPLATES = {
+    "SQL_INJECTION": {
+        "original": "cursor.execute(\"SELECT * FROM users WHERE id = \" + user_id)",
+        "fixed": "cursor.execute(\"SELECT * FROM users WHERE id = ?\", (user_id,))",
+        "explanation": "Replaced string concatenation with parameterized query. The database driver handles escaping, preventing SQL injection.",
+        "prevents": ["SQL Injection", "Data Exfiltration", "Authentication Bypass"]
+    },
+    "XSS": {
+        "original": "element.innerHTML = userInput;",
+        "fixed": "element.textContent = userInput;\n// Or use DOMPurify: element.innerHTML = DOMPurify.sanitize(userInput);",
+        "explanation": "Use textContent for plain text or DOMPurify for HTML. This prevents script execution from user input.",
+        "prevents": ["Cross-Site Scripting", "Session Hijacking", "Cookie Theft"]
+    },
+    "HARDCODED_SECRET": {
+        "original": "API_KEY = \"sk-1234567890abcdef\"",
+        "fixed": "import os\nAPI_KEY = os.environ.get('API_KEY')\nif not API_KEY:\n    raise ValueError('API_KEY not set')",
+        "explanation": "Load credentials from environment variables. Never commit secrets to version control.",
+        "prevents": ["Credential Exposure", "Unauthorized API Access", "Account Takeover"]
+    }
+}
+DEFAULT_FIX_TYPE = 'SQL_INJECTION'
+
+
+def fix_key(vuln_type: str, snippet: Optional[str], model: str, prompt_version: str = FIX_PROMPT_VERSION) -> str:
+    """Cache key of a generated fix: finding type, snippet hash and model"""
+    snippet_hash = hashlib.sha256(normalize_snippet(snippet).encode('utf-8')).hexdigest()
+    payload = json.dumps(['secure_fix', vuln_type, snippet_hash, model, prompt_version])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def build_fix_prompt(vuln: Dict[str, Any], scan: Dict[str, Any]) -> str:
+    return f"""Rewrite this vulnerable code so that it is secure.
+
+Type: {vuln['type']}
+Severity: {vuln.get('severity', 'N/A')}
+Finding: {vuln.get('title', '')}
+Language: {scan.get('language') or 'unknown'}
+File: {vuln.get('filename') or 'N/A'}
+Code:
+{vuln['code_snippet']}
+
+Reply with a JSON object with the keys "fixed_code" (the secure replacement
+for the code above, in the same language), "explanation" (1-2 sentences on
+what changed and why) and "prevents_attacks" (a list of short attack names)."""
+
+
+def parse_fix_response(response: str) -> Dict[str, Any]:
+    """Read the JSON object asked for by build_fix_prompt; raises ValueError if it's unusable"""
+    text = response.strip()
+    # Tolerate a reply wrapped in a Markdown code fence
+    fenced = re.match(r'^```(?:json)?\s*(.*?)\s*```$', text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Fix reply is not JSON: {e}")
+    if not isinstance(data, dict) or not isinstance(data.get('fixed_code'), str) or not data['fixed_code'].strip():
+        raise ValueError("Fix reply has no fixed_code")
+    prevents = data.get('prevents_attacks')
+    return {
+        'fixed_code': data['fixed_code'],
+        'explanation': str(data.get('explanation') or ''),
+        'prevents_attacks': [str(attack) for attack in prevents] if isinstance(prevents, list) else []
+    }
+
+
+def template_fix(vulnerability_id: str, vuln_type: str) -> Dict[str, Any]:
+    fix = FIX_TEMPLATES.get(vuln_type, FIX_TEMPLATES[DEFAULT_FIX_TYPE])
+    return {
+        "vulnerability_id": vulnerability_id,
+        "original_code": fix["original"],
+        "fixed_code": fix["fixed"],
+        "explanation": fix["explanation"],
+        "prevents_attacks": fix["prevents"],
+        "fallback": True
+    }
+
+
+class SecureFixService:
+    """Secure fixes for stored findings, generated once per distinct snippet.
+
+    load(vulnerability_id) returns (vulnerability, scan) with FIX_FIELDS and
+    FIX_SCAN_FIELDS, or None; complete(prompt, tenant) calls the LLM.
+    Generated fixes go in cache, an AnalysisCache (in-process LRU plus a
+    Mongo collection), keyed on the finding's type, snippet hash and model.
+    Concurrent requests for the same vulnerability share one load, and
+    findings with the same snippet share one generation.
+
+    Unknown ids, demo scans and findings without a snippet get the type's
+    template. So does a finding whose fix is not cached when the LLM call
+    fails or takes longer than timeout; nothing is cached then, so a later
+    request tries again. A generation that outlives timeout keeps running
+    and is cached for the next request.
+    """
+
+    def __init__(
+        self,
+        cache: AnalysisCache,
+        load: Callable[[str], Awaitable[Optional[Tuple[Dict[str, Any], Dict[str, Any]]]]],
+        complete: Callable[[str, Optional[str]], Awaitable[str]],
+        model: str,
+        timeout: float = 20
+    ):
+        self.cache = cache
+        self.load = load
+        self.complete = complete
+        self.model = model
+        self.timeout = timeout
+        self._requests = SingleFlight()
+        self.counters = {'generated': 0, 'template': 0, 'coalesced': 0}
+
+    async def get_fix(self, vulnerability_id: str) -> Dict[str, Any]:
+        if vulnerability_id in self._requests:
+            self.counters['coalesced'] += 1
+        return await self._requests.run(vulnerability_id, lambda: self._fix(vulnerability_id))
+
+    async def _generate(self, vuln: Dict[str, Any], scan: Dict[str, Any]) -> Dict[str, Any]:
+        response = await self.complete(build_fix_prompt(vuln, scan), scan.get('project_context'))
+        return parse_fix_response(response)
+
+    async def _fix(self, vulnerability_id: str) -> Dict[str, Any]:
+        found = await self.load(vulnerability_id)
+        if found is None:
+            # Ids of the original demo fixes started with the finding type
+            self.counters['template'] += 1
+            return template_fix(vulnerability_id, vulnerability_id.split('_')[0])
+        vuln, scan = found
+        if scan.get('scan_profile') == 'demo' or not vuln.get('code_snippet'):
+            self.counters['template'] += 1
+            return template_fix(vulnerability_id, vuln.get('type'))
+
+        key = fix_key(vuln['type'], vuln['code_snippet'], self.model)
+        try:
+            fix = await asyncio.wait_for(self.cache.get_or_compute(key, lambda: self._generate(vuln, scan)), self.timeout)
+        except Exception as e:
+            logger.warning(f"Secure fix generation for {vulnerability_id} failed: {e!r}")
+            self.counters['template'] += 1
+            return template_fix(vulnerability_id, vuln['type'])
+        self.counters['generated'] += 1
+        return {
+            "vulnerability_id": vulnerability_id,
+            "original_code": vuln['code_snippet'],
+            "fixed_code": fix['fixed_code'],
+            "explanation": fix['explanation'],
+            "prevents_attacks": fix['prevents_attacks'],
+            "fallback": False
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, 'inflight': len(self._requests), 'cache': self.cache.stats()}
@@ -0,0 +1,33 @@
+"""Make the backend modules importable and point the app at local fakes.
+
+The environment is set before any test imports server: LLM calls go to
+FakeLlmClient, and the Mongo URL is never connected to (tests that need
+storage swap in the in-memory database).
+"""
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('LLM_BACKEND', 'fake')
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'secure_review_test')
+
+
+@pytest.fixture
+def memory_db(monkeypatch):
+    """Swap the app's Mongo database for memory_db's in-memory one for one test"""
+    import server
+    from memory_db import use_memory_database
+    for target, name in (
+        (server, 'db'),
+        (server.scan_store, 'db'),
+        (server.analysis_cache, 'collection'),
+        (server.fix_cache, 'collection'),
+        (server.job_queue, 'collection')
+    ):
+        monkeypatch.setattr(target, name, getattr(target, name))
+    return use_memory_database(server)
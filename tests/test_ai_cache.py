@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import ai_cache
+from ai_cache import AnalysisCache, TTLCache
+from memory_db import MemoryCollection
+
+ANALYSIS = {'ai_explanation': 'Explained.', 'confidence_score': 0.88, 'recommendation': 'Fix it.'}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ai_cache.time, 'monotonic', clock)
+    return clock
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 1)
+    clock.now += 59
+    assert cache.get('a') == 1
+    clock.now += 2
+    assert cache.get('a') is None and len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+
+class Compute:
+    def __init__(self, latency=0.0, fail=False):
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError('LLM unavailable')
+        return dict(ANALYSIS)
+
+
+def test_hits_and_misses_are_counted():
+    cache = AnalysisCache(MemoryCollection())
+    compute = Compute()
+
+    async def run():
+        await cache.get_or_compute('a', compute)
+        await cache.get_or_compute('a', compute)
+        # A new process: only the Mongo tier has the entry
+        cache.memory._data.clear()
+        await cache.get_or_compute('a', compute)
+        return await cache.lookup('b')
+
+    assert asyncio.run(run()) is None
+    assert compute.calls == 1
+    assert cache.counters == {'memory_hits': 1, 'db_hits': 1, 'misses': 2, 'coalesced': 0}
+    assert cache.stats()['hit_ratio'] == 0.5
+
+
+@pytest.mark.parametrize('expires_at,hit', [
+    (datetime.now(timezone.utc) + timedelta(hours=1), True),
+    # Mongo returns naive UTC datetimes unless the client is tz_aware
+    (datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1), True),
+    (datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=1), False),
+    (datetime.now(timezone.utc) - timedelta(hours=1), False),
+    (None, True),
+])
+def test_stored_entries_honour_expires_at(expires_at, hit):
+    collection = MemoryCollection()
+    collection.docs.append({'key': 'a', 'value': {**ANALYSIS, 'ai_explanation': 'Stored.'}, 'expires_at': expires_at})
+    cache = AnalysisCache(collection)
+    compute = Compute()
+    value = asyncio.run(cache.get_or_compute('a', compute))
+    assert (value['ai_explanation'] == 'Stored.') == hit
+    assert compute.calls == (0 if hit else 1)
+
+
+def test_concurrent_identical_keys_share_one_computation():
+    cache = AnalysisCache(MemoryCollection())
+    compute = Compute(latency=0.02)
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute('a', compute) for _ in range(5)), cache.get_or_compute('b', compute))
+
+    values = asyncio.run(run())
+    assert compute.calls == 2
+    assert all(value == ANALYSIS for value in values)
+    assert cache.counters['coalesced'] == 4 and cache.counters['misses'] == 2
+    assert [doc['key'] for doc in cache.collection.docs] == ['a', 'b']
+
+
+def test_exceptions_are_not_cached():
+    cache = AnalysisCache(MemoryCollection())
+    compute = Compute(latency=0.01, fail=True)
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute('a', compute) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert compute.calls == 1
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert len(cache.memory) == 0 and cache.collection.docs == []
+    compute.fail = False
+    assert asyncio.run(cache.get_or_compute('a', compute)) == ANALYSIS
+    assert compute.calls == 2
+
+
+def test_caller_timeout_does_not_cancel_the_shared_computation():
+    cache = AnalysisCache(MemoryCollection())
+    compute = Compute(latency=0.05)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(cache.get_or_compute('a', compute), 0.01)
+        await asyncio.sleep(0.08)
+
+    asyncio.run(run())
+    assert cache.memory.get('a') == ANALYSIS
+    assert compute.calls == 1
@@ -0,0 +1,114 @@
+import io
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from starlette.testclient import TestClient
+
+import server
+from archive_scan import ArchiveLimitError, scan_archive
+from scan_executor import init_worker
+
+SQL = b'query = "SELECT * FROM users WHERE id = " + user_id\n'
+XSS = b'element.innerHTML = location.hash;\n'
+
+FILES = {
+    'src/app.py': SQL,
+    'web/main.js': XSS,
+    'README.md': SQL,
+    'assets/logo.py': b'\0PNG' + SQL,
+}
+
+
+def zip_archive(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tar_archive(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+ARCHIVES = [('repo.zip', zip_archive), ('repo.tar.gz', tar_archive)]
+
+
+def scan(name, data, max_files=100, **options):
+    with ThreadPoolExecutor(1, initializer=init_worker, initargs=(server.SECURITY_RULES,)) as executor:
+        return scan_archive(io.BytesIO(data), name, executor, max_files, 1024, 1024 * 1024, **options)
+
+
+@pytest.mark.parametrize('name,build', ARCHIVES)
+def test_scans_source_files_and_skips_binaries(name, build):
+    findings, contexts, summary = scan(name, build(FILES))
+    assert {(f['filename'], f['type']) for f in findings} == {('src/app.py', 'SQL_INJECTION'), ('web/main.js', 'XSS')}
+    assert set(contexts) == {'src/app.py', 'web/main.js'}
+    assert summary['files_scanned'] == 2
+    assert summary['languages'] == ['javascript', 'python']
+    assert summary['skipped_files'] == [{'filename': 'assets/logo.py', 'reason': 'binary file'}]
+
+
+@pytest.mark.parametrize('name,build', ARCHIVES)
+def test_every_file_counts_toward_the_file_limit(name, build):
+    files = {f'docs/page{n}.md': b'text' for n in range(10)}
+    with pytest.raises(ArchiveLimitError):
+        scan(name, build(files), max_files=9)
+    assert scan(name, build(files), max_files=10)[2]['files_scanned'] == 0
+
+
+def test_files_share_the_scan_deadline():
+    scan_info = {}
+    findings, _, summary = scan('repo.zip', zip_archive(FILES), scan_info=scan_info, deadline=time.time() - 1)
+    assert findings == [] and summary['files_scanned'] == 2
+    assert scan_info == {'truncated_lines': 0, 'timed_out': True}
+
+
+def post_archive(client, name, data):
+    return client.post(
+        '/api/scan/archive',
+        files={'file': (name, data)},
+        data={'project_context': 'tests', 'scan_profile': 'full'}
+    )
+
+
+@pytest.mark.parametrize('name,build', ARCHIVES)
+def test_archive_scan(memory_db, name, build):
+    response = post_archive(TestClient(server.app), name, build(FILES))
+    assert response.status_code == 200
+    result = response.json()
+    assert {(v['filename'], v['type']) for v in result['vulnerabilities']} == {('src/app.py', 'SQL_INJECTION'), ('web/main.js', 'XSS')}
+    assert result['language'] == 'mixed' and not result['truncated']
+    assert result['archive_summary']['skipped_files'] == [{'filename': 'assets/logo.py', 'reason': 'binary file'}]
+
+
+def test_archive_limits_are_413(memory_db, monkeypatch):
+    client = TestClient(server.app)
+    monkeypatch.setattr(server, 'ARCHIVE_MAX_FILES', 3)
+    response = post_archive(client, 'repo.zip', zip_archive(FILES))
+    assert response.status_code == 413
+    assert response.json()['detail'] == 'Archive contains more than 3 files'
+
+    app = server.app.middleware_stack
+    while not isinstance(app, server.RequestBodyLimit) or app.path != '/api/scan/archive':
+        app = app.app
+    monkeypatch.setattr(app, 'max_bytes', 1024)
+    response = post_archive(client, 'repo.zip', b'x' * 2048)
+    assert response.status_code == 413
+    assert response.json()['detail'] == 'Request body is larger than 1024 bytes'
+
+
+def test_timed_out_archive_scan_is_truncated(memory_db, monkeypatch):
+    monkeypatch.setattr(server.RULE_ENGINE, 'new_deadline', lambda: time.time() - 1)
+    response = post_archive(TestClient(server.app), 'repo.zip', zip_archive(FILES))
+    assert response.status_code == 200
+    assert response.json()['truncated'] and response.json()['total_issues'] == 0
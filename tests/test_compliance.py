@@ -0,0 +1,116 @@
+import asyncio
+import random
+
+from starlette.testclient import TestClient
+
+import server
+from compliance import build_compliance_report
+
+TYPES = list(server.SECURITY_RULES) + ['UNKNOWN_TYPE']
+
+
+def baseline_report(vulnerabilities, critical, high):
+    """The report /api/compliance built from a scan's findings on every request"""
+    owasp_mapping = {
+        "A01_Broken_Access_Control": {"status": "warn" if any(v['type'] == 'MISSING_AUTH' for v in vulnerabilities) else "pass", "issues": 0},
+        "A02_Cryptographic_Failures": {"status": "warn" if any(v['type'] == 'WEAK_CRYPTO' for v in vulnerabilities) else "pass", "issues": 0},
+        "A03_Injection": {"status": "fail" if any(v['type'] in ['SQL_INJECTION', 'XSS', 'COMMAND_INJECTION'] for v in vulnerabilities) else "pass", "issues": 0},
+        "A07_Auth_Failures": {"status": "fail" if any(v['type'] == 'HARDCODED_SECRET' for v in vulnerabilities) else "pass", "issues": 0},
+        "A08_Data_Integrity_Failures": {"status": "warn" if any(v['type'] == 'INSECURE_DESERIALIZATION' for v in vulnerabilities) else "pass", "issues": 0}
+    }
+    for vuln in vulnerabilities:
+        if vuln['type'] in ['MISSING_AUTH', 'PATH_TRAVERSAL']:
+            owasp_mapping['A01_Broken_Access_Control']['issues'] += 1
+        elif vuln['type'] == 'WEAK_CRYPTO':
+            owasp_mapping['A02_Cryptographic_Failures']['issues'] += 1
+        elif vuln['type'] in ['SQL_INJECTION', 'XSS', 'COMMAND_INJECTION']:
+            owasp_mapping['A03_Injection']['issues'] += 1
+        elif vuln['type'] == 'HARDCODED_SECRET':
+            owasp_mapping['A07_Auth_Failures']['issues'] += 1
+        elif vuln['type'] == 'INSECURE_DESERIALIZATION':
+            owasp_mapping['A08_Data_Integrity_Failures']['issues'] += 1
+
+    iso27001_score = max(0, 100 - (critical * 15 + high * 8))
+    nist_score = max(0, 100 - (critical * 12 + high * 7))
+    gdpr_compliant = critical == 0 and high <= 1
+
+    return {
+        "owasp": {
+            "mapping": owasp_mapping,
+            "total_categories": 5,
+            "passed": sum(1 for v in owasp_mapping.values() if v['status'] == 'pass'),
+            "compliance_score": round((sum(1 for v in owasp_mapping.values() if v['status'] == 'pass') / 5) * 100)
+        },
+        "iso27001": {
+            "score": iso27001_score,
+            "status": "compliant" if iso27001_score >= 80 else "non-compliant",
+            "controls_passed": 45 if iso27001_score >= 80 else 32,
+            "controls_total": 50
+        },
+        "nist": {
+            "score": nist_score,
+            "status": "compliant" if nist_score >= 75 else "non-compliant",
+            "framework": "NIST CSF 2.0",
+            "categories_met": 4 if nist_score >= 75 else 2
+        },
+        "gdpr": {
+            "compliant": gdpr_compliant,
+            "risk_level": "low" if gdpr_compliant else "high",
+            "data_protection": "adequate" if gdpr_compliant else "inadequate",
+            "breach_notification_required": not gdpr_compliant
+        }
+    }
+
+
+def random_findings(rng):
+    return [{'type': rng.choice(TYPES)} for _ in range(rng.randrange(12))]
+
+
+def test_report_matches_the_baseline():
+    rng = random.Random(11)
+    for _ in range(500):
+        findings = random_findings(rng)
+        critical, high = rng.randrange(10), rng.randrange(10)
+        assert build_compliance_report((v['type'] for v in findings), critical, high) == baseline_report(findings, critical, high)
+
+
+def stored_scan(scan_id, findings, timestamp):
+    vulnerabilities = [
+        server.to_vulnerability(
+            {**finding, 'severity': server.SECURITY_RULES.get(finding['type'], {}).get('severity', 'Low'), 'title': finding['type']},
+            server.fallback_analysis({'title': finding['type']})
+        )
+        for finding in findings
+    ]
+    return server.scan_document(server.scan_result(scan_id, 'python', 'tests', 'full', vulnerabilities, timestamp=timestamp))
+
+
+def test_endpoints_serve_the_baseline_report(memory_db):
+    rng = random.Random(12)
+    docs = [stored_scan(f'scan-{n}', random_findings(rng), f'2026-01-{n + 1:02d}T00:00:00+00:00') for n in range(20)]
+    # Scans stored before reports were precomputed get theirs on request
+    for doc in docs[::4]:
+        del doc['compliance'], doc['rule_types']
+    for doc in docs:
+        asyncio.run(server.scan_store.insert_scan(doc))
+
+    client = TestClient(server.app)
+    expected = {
+        doc['scan_id']: baseline_report(doc['vulnerabilities'], doc['critical_count'], doc['high_count']) for doc in docs
+    }
+    for scan_id, report in expected.items():
+        assert client.get(f'/api/compliance/{scan_id}').json() == {'scan_id': scan_id, **report}
+
+    batch = client.post('/api/compliance/batch', json={'scan_ids': list(expected)}).json()
+    assert len(batch['scans']) == len(docs)
+    for row in batch['scans']:
+        report = expected[row['scan_id']]
+        assert row['owasp_score'] == report['owasp']['compliance_score']
+        assert row['iso27001_score'] == report['iso27001']['score']
+        assert row['nist_score'] == report['nist']['score']
+        assert row['gdpr_compliant'] == report['gdpr']['compliant']
+    assert batch['totals']['gdpr_compliant'] == sum(report['gdpr']['compliant'] for report in expected.values())
+
+    window = client.post('/api/compliance/batch', json={'since': '2026-01-05T00:00:00Z', 'until': '2026-01-10T00:00:00Z'}).json()
+    assert [row['scan_id'] for row in window['scans']] == [f'scan-{n}' for n in range(8, 3, -1)]
+    assert client.get('/api/compliance/missing').status_code == 404
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+import server
+
+
+def findings(latencies):
+    return [
+        {'type': 'SQL_INJECTION', 'severity': 'Critical', 'title': f'Finding {n}', 'line_number': n + 1,
+         'code_snippet': f'q{n} = "SELECT " + x', 'latency': latency}
+        for n, latency in enumerate(latencies)
+    ]
+
+
+class Analyzer:
+    """Stands in for ai_analyze_vulnerability, sleeping each finding's latency"""
+
+    def __init__(self):
+        self.started = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, vuln, context, is_demo=False, count_lookup=True):
+        self.started.append(vuln['line_number'])
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(vuln.get('latency', 0))
+        finally:
+            self.in_flight -= 1
+        return {'ai_explanation': vuln['title'], 'confidence_score': 0.88, 'recommendation': 'Fix it.'}
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    analyzer = Analyzer()
+    monkeypatch.setattr(server, 'ai_analyze_vulnerability', analyzer)
+    monkeypatch.setattr(server, 'AI_BATCH_SIZE', 1)
+    return analyzer
+
+
+def enrich(vulns, on_result=None):
+    return asyncio.run(server.enrich_vulnerabilities(vulns, 'code', on_result=on_result))
+
+
+def test_results_keep_the_input_order(analyzer):
+    vulns = findings([0.05, 0.0, 0.03, 0.01, 0.04, 0.02])
+    reported = []
+
+    async def on_result(index, analysis):
+        reported.append((index, analysis['ai_explanation']))
+
+    results = enrich(vulns, on_result)
+    assert [result['ai_explanation'] for result in results] == [vuln['title'] for vuln in vulns]
+    # on_result sees each finding as it finishes, fastest first
+    assert reported == sorted(((n, vulns[n]['title']) for n in range(6)), key=lambda item: vulns[item[0]]['latency'])
+
+
+def test_batches_keep_the_input_order(monkeypatch):
+    monkeypatch.setattr(server, 'AI_BATCH_SIZE', 2)
+    server.analysis_cache.memory._data.clear()
+    batches = []
+
+    async def analyze_batch(vulns, context):
+        batches.append([vuln['line_number'] for vuln in vulns])
+        await asyncio.sleep(0.05 if context == 'slow' else 0)
+        return [{'ai_explanation': vuln['title'], 'confidence_score': 0.88, 'recommendation': 'Fix it.'} for vuln in vulns]
+
+    monkeypatch.setattr(server, 'llm_analyze_batch', analyze_batch)
+    vulns = findings([0] * 5)
+    for vuln, filename in zip(vulns, ['slow.py', 'fast.py', 'slow.py', 'fast.py', 'fast.py']):
+        vuln['filename'] = filename
+    results = asyncio.run(server.enrich_vulnerabilities(vulns, {'slow.py': 'slow', 'fast.py': 'fast'}))
+    assert [result['ai_explanation'] for result in results] == [vuln['title'] for vuln in vulns]
+    # Only findings from the same file share a prompt
+    assert sorted(batches) == [[1, 3], [2, 4], [5]]
+
+
+def test_slow_calls_get_the_fallback(analyzer, monkeypatch):
+    monkeypatch.setattr(server, 'AI_CALL_TIMEOUT', 0.05)
+    results = enrich(findings([0, 1, 0]))
+    assert [result['confidence_score'] for result in results] == [0.88, 0.75, 0.88]
+    assert results[1]['recommendation'] == 'Manual review recommended.'
+    assert results[1]['ai_explanation'] == 'Security issue detected: Finding 1'
+
+
+def test_scan_deadline_cuts_off_queued_calls(analyzer, monkeypatch):
+    monkeypatch.setattr(server, 'AI_MAX_CONCURRENCY', 1)
+    monkeypatch.setattr(server, 'AI_SCAN_DEADLINE', 0.1)
+    started = time.monotonic()
+    results = enrich(findings([0.06] * 5))
+    assert time.monotonic() - started < 0.5
+    assert [result.get('fallback', False) for result in results] == [False, True, True, True, True]
+    # The second call is cut short at the deadline; the rest never start
+    assert analyzer.started == [1, 2]
+
+
+def test_concurrency_is_capped(analyzer, monkeypatch):
+    monkeypatch.setattr(server, 'AI_MAX_CONCURRENCY', 3)
+    results = enrich(findings([0.01] * 10))
+    assert not any(result.get('fallback') for result in results)
+    assert analyzer.max_in_flight == 3
+
+
+def test_only_the_first_findings_are_enriched(memory_db, analyzer, monkeypatch):
+    monkeypatch.setattr(server, 'SCAN_MAX_FINDINGS', 2)
+    code = ''.join(f'query{n} = "SELECT * FROM limit_{n} WHERE id = " + user_id\n' for n in range(5))
+    response = TestClient(server.app).post('/api/scan/analyze', json={
+        'code': code, 'language': 'python', 'project_context': 'tests', 'scan_profile': 'full', 'use_cache': False
+    })
+    assert response.status_code == 200
+    assert [v['line_number'] for v in response.json()['vulnerabilities']] == [1, 2]
+    assert len(analyzer.started) == 2
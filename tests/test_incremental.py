@@ -0,0 +1,118 @@
+import difflib
+import random
+
+import pytest
+
+import server
+from incremental import DiffError, changes_from_content, changes_from_diff, classify_findings, line_hashes, scan_changes
+from rule_engine import RuleEngine
+
+BASE = [
+    'import hashlib',
+    '@app.route("/users")',
+    '@login_required',
+    'def users():',
+    '    query = "SELECT * FROM users WHERE id = " + user_id',
+    '    cursor.execute(query)',
+    '    return hashlib.md5(password)',
+    '',
+    '@app.route("/health")',
+    'def health():',
+    '    return "ok"',
+    'el.innerHTML = params.get("q")',
+    'x = 1',
+]
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return RuleEngine(server.SECURITY_RULES)
+
+
+def unified_diff(old, new, context=3):
+    return '\n'.join(difflib.unified_diff(old, new, lineterm='', n=context))
+
+
+def rescan(engine, old, new):
+    """Incremental scan of new against a full scan of old: (carried, new, fixed)"""
+    changes = changes_from_content(line_hashes('\n'.join(old)), '\n'.join(new))
+    detected = scan_changes(engine, changes, 2, language='python')
+    return classify_findings(engine.scan('\n'.join(old), language='python'), detected, changes, engine.line_span)
+
+
+def random_edit(rng, lines):
+    lines = list(lines)
+    for _ in range(rng.randint(1, 3)):
+        n = rng.randrange(len(lines))
+        action = rng.choice(['insert', 'delete', 'replace'])
+        if action == 'delete' and len(lines) > 1:
+            del lines[n]
+        else:
+            line = rng.choice(BASE + ['@app.route("/new")', 'def new():', 'pass'])
+            if action == 'insert':
+                lines.insert(n, line)
+            else:
+                lines[n] = line
+    return lines
+
+
+@pytest.mark.parametrize('context', [0, 3])
+def test_diff_applies_like_full_content(context):
+    rng = random.Random(8)
+    for _ in range(50):
+        new = random_edit(rng, BASE)
+        base_hashes = line_hashes('\n'.join(BASE))
+        from_diff = changes_from_diff(base_hashes, unified_diff(BASE, new, context))
+        from_content = changes_from_content(base_hashes, '\n'.join(new))
+        assert from_diff.new_hashes == from_content.new_hashes == line_hashes('\n'.join(new))
+        assert from_diff.line_map == from_content.line_map
+        assert from_diff.changed == from_content.changed
+        assert from_diff.edits == from_content.edits
+        assert all(from_content.new_text[n] == text for n, text in from_diff.new_text.items())
+
+
+@pytest.mark.parametrize('diff', [
+    '@@ -2,1 +2,1 @@\n-not the base line\n+x = 2',
+    '@@ -40,1 +40,1 @@\n-x\n+y',
+    'no hunks here',
+])
+def test_diff_that_does_not_apply_is_rejected(diff):
+    with pytest.raises(DiffError):
+        changes_from_diff(line_hashes('\n'.join(BASE)), diff)
+
+
+def test_findings_match_a_full_rescan(engine):
+    rng = random.Random(16)
+    for _ in range(200):
+        new = random_edit(rng, BASE)
+        carried, added, fixed = rescan(engine, BASE, new)
+        expected = sorted((f['type'], f['line_number']) for f in engine.scan('\n'.join(new), language='python'))
+        found = sorted([(vuln['type'], line) for vuln, line in carried] + [(f['type'], f['line_number']) for f in added])
+        assert found == expected, new
+        assert len(carried) + len(fixed) == len(engine.scan('\n'.join(BASE), language='python'))
+
+
+@pytest.mark.parametrize('new', [
+    # Deleting the decorator between the route and its function
+    BASE[:2] + BASE[3:],
+    # Replacing it with the function
+    BASE[:2] + ['def users():'] + BASE[3:],
+])
+def test_spanning_finding_on_an_unchanged_line_is_new(engine, new):
+    carried, added, fixed = rescan(engine, BASE, new)
+    assert [(f['type'], f['line_number']) for f in added] == [('MISSING_AUTH', 2)]
+    assert fixed == []
+
+
+def test_spanning_finding_broken_by_an_edit_is_fixed(engine):
+    new = BASE[:9] + ['@login_required'] + BASE[9:]
+    carried, added, fixed = rescan(engine, BASE, new)
+    assert [(vuln['type'], vuln['line_number']) for vuln in fixed] == [('MISSING_AUTH', 9)]
+    assert added == []
+    assert ('MISSING_AUTH', 9) not in [(vuln['type'], vuln['line_number']) for vuln, _ in carried]
+
+
+def test_spans_are_counted_from_explicit_newlines(engine):
+    assert engine.line_span('MISSING_AUTH') == 2
+    assert engine.line_span('SQL_INJECTION') == 1
+    assert engine.max_line_span() == 2
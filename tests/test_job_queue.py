@@ -0,0 +1,190 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from starlette.testclient import TestClient
+
+import server
+from job_queue import JobQueue, LeaseLost, WorkerPool
+from memory_db import MemoryCollection
+
+
+def make_queue(**options):
+    return JobQueue(MemoryCollection(), **options)
+
+
+def stored(queue, job_id):
+    return next(doc for doc in queue.collection.docs if doc['job_id'] == job_id)
+
+
+def test_claims_highest_priority_then_oldest():
+    queue = make_queue()
+
+    async def run():
+        for job_id, priority in (('low', 0), ('high', 5), ('high-later', 5), ('urgent', 9)):
+            await queue.enqueue(job_id, 'scan', {}, priority)
+        return [(await queue.claim('w'))['job_id'] for _ in range(4)], await queue.claim('w')
+
+    claimed, empty = asyncio.run(run())
+    assert claimed == ['urgent', 'high', 'high-later', 'low']
+    assert empty is None
+
+
+def test_expired_lease_is_reclaimed_and_the_old_owner_is_locked_out():
+    queue = make_queue(lease_seconds=0.05)
+
+    async def run():
+        await queue.enqueue('a', 'scan', {})
+        first = await queue.claim('w1')
+        assert await queue.claim('w2') is None
+        await asyncio.sleep(0.06)
+        second = await queue.claim('w2')
+        for call in (queue.renew(first, 'w1'), queue.report_progress(first, 'w1', {}), queue.complete(first, 'w1')):
+            with pytest.raises(LeaseLost):
+                await call
+        await queue.complete(second, 'w2', {'stage': 'complete'})
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert (first['attempts'], second['attempts'], second['lease_owner']) == (1, 2, 'w2')
+    assert stored(queue, 'a')['status'] == 'complete'
+    assert stored(queue, 'a')['progress'] == {'stage': 'complete'}
+
+
+def test_failed_attempts_back_off_exponentially():
+    queue = make_queue(max_attempts=3, retry_delay=10)
+
+    async def attempt():
+        # Make the job due now, whatever its backoff
+        stored(queue, 'a')['available_at'] = datetime.now(timezone.utc)
+        job = await queue.claim('w')
+        started = datetime.now(timezone.utc)
+        retry = await queue.fail(job, 'w', 'boom')
+        return retry, stored(queue, 'a')['available_at'] - started
+
+    async def run():
+        await queue.enqueue('a', 'scan', {})
+        first = await attempt()
+        blocked = await queue.claim('w')
+        return first, blocked, await attempt(), await attempt()
+
+    (retry1, delay1), blocked, (retry2, delay2), (retry3, _) = asyncio.run(run())
+    assert retry1 and retry2 and not retry3
+    assert blocked is None
+    assert timedelta(seconds=10) <= delay1 < timedelta(seconds=11)
+    assert timedelta(seconds=20) <= delay2 < timedelta(seconds=21)
+    assert (stored(queue, 'a')['status'], stored(queue, 'a')['error']) == ('failed', 'boom')
+
+
+def test_abandoned_last_attempt_fails():
+    queue = make_queue(lease_seconds=0.01, max_attempts=1)
+
+    async def run():
+        await queue.enqueue('a', 'scan', {})
+        await queue.enqueue('b', 'scan', {})
+        await queue.claim('w')
+        await asyncio.sleep(0.02)
+        return await queue.fail_abandoned(), await queue.claim('w')
+
+    failed, claimed = asyncio.run(run())
+    assert failed == 1
+    assert stored(queue, 'a')['status'] == 'failed'
+    # An expired job on its last attempt is not claimed again
+    assert claimed['job_id'] == 'b'
+
+
+async def until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        await asyncio.sleep(0.005)
+
+
+def test_lost_lease_cancels_the_job():
+    queue = make_queue(lease_seconds=0.06)
+    cancelled = []
+
+    async def handler(job, report):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(job['job_id'])
+            raise
+
+    async def run():
+        await queue.enqueue('a', 'scan', {})
+        pool = WorkerPool(queue, {'scan': handler}, workers=0)
+        job = await queue.claim('w1')
+        running = asyncio.create_task(pool.run_job(job, 'w1'))
+        # Another worker takes the job over
+        stored(queue, 'a')['lease_owner'] = 'w2'
+        await asyncio.wait_for(running, 1)
+
+    asyncio.run(run())
+    assert cancelled == ['a']
+    assert stored(queue, 'a')['status'] == 'running' and stored(queue, 'a')['lease_owner'] == 'w2'
+
+
+def test_pool_survives_errors_and_restarts_on_a_new_loop():
+    queue = make_queue(retry_delay=0)
+    done = []
+
+    async def handler(job, report):
+        await report({'stage': 'working'})
+        if job['payload'].get('fail'):
+            raise RuntimeError('handler failed')
+        done.append(job['job_id'])
+        return {'stage': 'complete'}
+
+    pool = WorkerPool(queue, {'scan': handler}, workers=1, poll_interval=0.01)
+    run_job = pool.run_job
+    broken = []
+
+    async def run_job_once_broken(job, worker_id):
+        if not broken:
+            broken.append(job['job_id'])
+            raise RuntimeError('worker bug')
+        await run_job(job, worker_id)
+
+    pool.run_job = run_job_once_broken
+
+    async def session(job_ids, fail=()):
+        pool.start()
+        try:
+            # Let the worker go idle first
+            await asyncio.sleep(0.02)
+            for job_id in job_ids:
+                await queue.enqueue(job_id, 'scan', {'fail': job_id in fail})
+                pool.notify()
+            await until(lambda: all(stored(queue, job_id)['status'] in ('complete', 'failed') for job_id in job_ids))
+        finally:
+            await pool.stop()
+
+    # The job whose run raised is picked up again once its lease expires
+    queue.lease_seconds = 0.05
+    asyncio.run(session(['a', 'b', 'c'], fail={'c'}))
+    asyncio.run(session(['d']))
+    assert sorted(done) == ['a', 'b', 'd']
+    assert stored(queue, broken[0])['attempts'] == 2
+    assert (stored(queue, 'c')['status'], stored(queue, 'c')['attempts']) == ('failed', 3)
+
+
+def test_job_mode_scan_reports_progress(memory_db, monkeypatch):
+    monkeypatch.setattr(server.job_workers, 'poll_interval', 0.01)
+    code = 'query = "SELECT * FROM users WHERE id = " + user_id\n'
+    # The lifespan runs once per client, each time on a new event loop
+    for _ in range(2):
+        with TestClient(server.app) as client:
+            response = client.post('/api/scan/analyze', params={'mode': 'job', 'priority': 3},
+                                   json={'code': code, 'language': 'python', 'project_context': 'tests', 'scan_profile': 'full'})
+            assert response.status_code == 202
+            scan_id = response.json()['scan_id']
+            deadline = time.monotonic() + 5
+            while (status := client.get(f'/api/scan/{scan_id}/status').json())['status'] != 'complete':
+                assert status['status'] in ('queued', 'running') and time.monotonic() < deadline
+                time.sleep(0.01)
+            assert status['progress'] == {'stage': 'complete', 'total_issues': 2}
+            assert (status['priority'], status['attempts'], status['error']) == (3, 1, None)
+            assert client.get(f'/api/scan/{scan_id}').json()['total_issues'] == 2
+    assert client.get('/api/scan/missing/status').status_code == 404
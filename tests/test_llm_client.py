@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+from ai_cache import AnalysisCache
+from llm_client import BATCH_MARKER, EmergentLlmClient, FakeLlmClient, build_batch_prompt, parse_batch_response
+
+VULNS = [
+    {'type': 'SQL_INJECTION', 'severity': 'Critical', 'title': 'SQL Injection', 'code_snippet': 'query = "SELECT " + q'},
+    {'type': 'XSS', 'severity': 'High', 'title': 'XSS', 'code_snippet': 'el.innerHTML = input'},
+    {'type': 'WEAK_CRYPTO', 'severity': 'Medium', 'title': 'Weak crypto', 'code_snippet': 'hashlib.md5(p)'}
+]
+
+
+def reply(indexes):
+    return json.dumps([
+        {'index': i, 'ai_explanation': f'explanation {i}', 'recommendation': f'recommendation {i}'} for i in indexes
+    ])
+
+
+def test_batch_prompt_round_trips_through_fake_llm():
+    prompt = build_batch_prompt(VULNS, 'context')
+    findings = json.loads(prompt.split(BATCH_MARKER, 1)[1].split('\n\n', 1)[0])
+    assert [f['index'] for f in findings] == [0, 1, 2]
+    assert [f['code'] for f in findings] == [v['code_snippet'] for v in VULNS]
+
+    response = asyncio.run(FakeLlmClient().complete(prompt, 'system'))
+    results = parse_batch_response(response, len(VULNS))
+    assert [r['ai_explanation'] for r in results] == [f"{v['type']} at this location can be exploited by an attacker." for v in VULNS]
+
+
+def test_parse_accepts_fenced_json_in_any_order():
+    response = '```json\n' + reply([2, 0, 1]) + '\n```'
+    results = parse_batch_response(response, 3)
+    assert [r['ai_explanation'] for r in results] == ['explanation 0', 'explanation 1', 'explanation 2']
+
+
+def test_parse_ignores_non_dict_items():
+    items = json.loads(reply([0, 1]))
+    response = json.dumps(['noise', 42, items[0], None, items[1]])
+    assert [r['recommendation'] for r in parse_batch_response(response, 2)] == ['recommendation 0', 'recommendation 1']
+
+
+@pytest.mark.parametrize('response', [
+    reply([0, 2]),
+    reply([0, 0]),
+    '[{"index": 0, "ai_explanation": "x"}, {"index": 1, "ai_explanation": "y", "recommendation": "z"}]',
+    'no array here',
+    '[{"index": 0,',
+])
+def test_parse_rejects_incomplete_responses(response):
+    with pytest.raises(ValueError):
+        parse_batch_response(response, 2)
+
+
+def test_failed_batch_falls_back_to_one_call_per_finding(monkeypatch):
+    client = FakeLlmClient(responder=lambda prompt: 'not json' if BATCH_MARKER in prompt else 'single explanation')
+    monkeypatch.setattr(server, 'llm_client', client)
+    monkeypatch.setattr(server, 'analysis_cache', AnalysisCache(None))
+    monkeypatch.setattr(server, 'AI_BATCH_SIZE', 10)
+
+    results = asyncio.run(server.enrich_vulnerabilities(VULNS, 'context'))
+
+    assert client.calls == 1 + len(VULNS)
+    assert [r['ai_explanation'] for r in results] == ['single explanation'] * len(VULNS)
+    assert not any(r.get('fallback') for r in results)
+    # lookup counts each finding once, even though the retry goes through the cache again
+    assert server.analysis_cache.counters['misses'] == len(VULNS)
+
+
+def test_batch_reply_is_split_per_finding(monkeypatch):
+    client = FakeLlmClient()
+    monkeypatch.setattr(server, 'llm_client', client)
+    monkeypatch.setattr(server, 'analysis_cache', AnalysisCache(None))
+    monkeypatch.setattr(server, 'AI_BATCH_SIZE', 10)
+
+    results = asyncio.run(server.enrich_vulnerabilities(VULNS, 'context'))
+
+    assert client.calls == 1
+    assert [r['recommendation'] for r in results] == [f"Remediate the {v['type']} issue." for v in VULNS]
+
+
+class RecordingChat:
+    """LlmChat double that keeps a history the way a conversation does"""
+
+    created = []
+
+    def __init__(self, api_key, session_id, system_message):
+        self.session_id = session_id
+        self.history = []
+        RecordingChat.created.append(self)
+
+    def with_model(self, provider, model):
+        return self
+
+    async def send_message(self, message):
+        self.history.append(message.text)
+        return f'{self.session_id}: {len(self.history)} prompts'
+
+
+class Message:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_emergent_client_starts_a_new_conversation_per_call():
+    RecordingChat.created = []
+    client = EmergentLlmClient(api_key='key', provider='openai', model='model')
+    client._chat_cls, client._message_cls = RecordingChat, Message
+
+    async def run():
+        return await asyncio.gather(*(client.complete(f'prompt {n}', 'system') for n in range(5)))
+
+    responses = asyncio.run(run())
+    responses += [asyncio.run(client.complete('later prompt', 'system'))]
+
+    assert len(RecordingChat.created) == 6
+    assert len({chat.session_id for chat in RecordingChat.created}) == 6
+    # No chat ever saw a prompt other than its own
+    assert all(len(chat.history) == 1 for chat in RecordingChat.created)
+    assert all(response.endswith(': 1 prompts') for response in responses)
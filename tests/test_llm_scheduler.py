@@ -0,0 +1,235 @@
+import asyncio
+
+import pytest
+
+import llm_scheduler
+import server
+from llm_scheduler import CircuitBreaker, CircuitOpenError, LlmScheduler, LoadShedError, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def opened(clock, failures=3):
+    breaker = CircuitBreaker(failure_threshold=failures, reset_timeout=30, clock=clock)
+    for _ in range(failures):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.is_open()
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = opened(clock)
+    clock.now += 30
+    assert not breaker.is_open()
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = opened(clock)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_hung_probe_is_given_up_after_reset_timeout(clock):
+    breaker = opened(clock)
+    clock.now += 30
+    assert breaker.allow()
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_token_bucket_refills_continuously(clock):
+    bucket = TokenBucket(60, clock)
+    assert bucket.wait_time(60) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1)
+    clock.now += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock.now += 100
+    assert bucket.wait_time(0) == 0
+    assert bucket.level == 60
+
+
+def test_token_bucket_debt_and_oversized_amounts(clock):
+    bucket = TokenBucket(60, clock)
+    bucket.take(90)
+    assert bucket.level == -30
+    assert bucket.wait_time(1) == pytest.approx(31)
+    # More than the capacity waits for a full bucket rather than forever
+    clock.now += 90
+    assert bucket.wait_time(600) == 0
+
+
+def ok():
+    async def call():
+        return 'response'
+    return call
+
+
+def test_open_breaker_spends_no_budget(clock):
+    breaker = opened(clock)
+    scheduler = LlmScheduler(breaker, tenant_requests_per_minute=1, max_wait=0, clock=clock)
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(scheduler.run(ok(), 'prompt', 'tenant'))
+    clock.now += 30
+    # The tenant's single request per minute is still there for the probe
+    assert asyncio.run(scheduler.run(ok(), 'prompt', 'tenant')) == 'response'
+    assert breaker.state == 'closed'
+    assert scheduler.counters == {'calls': 1, 'short_circuited': 1, 'shed': 0}
+
+
+def test_call_refused_during_a_probe_spends_no_budget(clock):
+    breaker = opened(clock)
+    scheduler = LlmScheduler(breaker, tenant_requests_per_minute=1, max_wait=0, clock=clock)
+    clock.now += 30
+    assert breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(scheduler.run(ok(), 'prompt', 'tenant'))
+    breaker.record_success()
+    assert asyncio.run(scheduler.run(ok(), 'prompt', 'tenant')) == 'response'
+
+
+def test_shed_probe_is_released(clock):
+    breaker = opened(clock)
+    scheduler = LlmScheduler(breaker, tenant_requests_per_minute=1, max_wait=0, clock=clock)
+    scheduler._charges('tenant', 1)[0][0].take(1)
+    clock.now += 30
+    with pytest.raises(LoadShedError):
+        asyncio.run(scheduler.run(ok(), 'prompt', 'tenant'))
+    assert breaker.allow()
+
+
+def test_calls_beyond_budget_are_shed(clock):
+    scheduler = LlmScheduler(CircuitBreaker(clock=clock), tenant_requests_per_minute=2, max_wait=0, clock=clock)
+    for _ in range(2):
+        asyncio.run(scheduler.run(ok(), 'prompt', 'a'))
+    with pytest.raises(LoadShedError):
+        asyncio.run(scheduler.run(ok(), 'prompt', 'a'))
+    # Other tenants have budgets of their own
+    assert asyncio.run(scheduler.run(ok(), 'prompt', 'b')) == 'response'
+    assert scheduler.counters == {'calls': 3, 'short_circuited': 0, 'shed': 1}
+
+
+def test_failed_calls_count_toward_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=2, clock=clock)
+    scheduler = LlmScheduler(breaker, clock=clock)
+
+    async def fail():
+        raise RuntimeError('down')
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            asyncio.run(scheduler.run(fail, 'prompt'))
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(scheduler.run(ok(), 'prompt'))
+
+
+def hang():
+    async def call():
+        await asyncio.sleep(5)
+    return call
+
+
+def test_hung_calls_time_out_and_open_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=2, clock=clock)
+    scheduler = LlmScheduler(breaker, call_timeout=0.01, clock=clock)
+    for _ in range(2):
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(scheduler.run(hang(), 'prompt'))
+    assert breaker.state == 'open'
+    # A per-call timeout replaces the scheduler's
+    clock.now += 30
+    assert asyncio.run(scheduler.run(ok(), 'prompt', timeout=1)) == 'response'
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(scheduler.run(hang(), 'prompt', timeout=0.01))
+    assert breaker.failures == 1
+
+
+def test_no_tenant_state_without_tenant_budgets(clock):
+    scheduler = LlmScheduler(CircuitBreaker(clock=clock), requests_per_minute=10 ** 6, clock=clock)
+    for n in range(100):
+        asyncio.run(scheduler.run(ok(), 'prompt', f'tenant-{n}'))
+    assert scheduler._tenant_buckets == {}
+    assert list(scheduler._tenant_locks) == [None]
+
+
+def test_idle_tenants_are_forgotten(clock, monkeypatch):
+    monkeypatch.setattr(llm_scheduler, 'TENANT_SWEEP_MIN', 10)
+    scheduler = LlmScheduler(CircuitBreaker(clock=clock), tenant_requests_per_minute=1, max_wait=0, clock=clock)
+
+    async def calls(tenants):
+        for tenant in tenants:
+            await scheduler.run(ok(), 'prompt', tenant)
+
+    asyncio.run(calls([f'old-{n}' for n in range(10)]))
+    # Buckets still refilling are kept: their tenants must not get a fresh budget
+    asyncio.run(calls(['new-0']))
+    assert len(scheduler._tenant_buckets) == 11
+    with pytest.raises(LoadShedError):
+        asyncio.run(scheduler.run(ok(), 'prompt', 'old-0'))
+    clock.now += 60
+    asyncio.run(calls([f'new-{n}' for n in range(1, 30)]))
+    # Everyone idle for a minute went at the next sweep; the tenants of the last minute remain
+    assert set(scheduler._tenant_buckets) == {f'new-{n}' for n in range(1, 30)}
+    assert set(scheduler._tenant_locks) <= set(scheduler._tenant_buckets)
+
+
+def test_hung_per_finding_calls_open_the_breaker(memory_db, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2)
+    monkeypatch.setattr(server.llm_scheduler, 'breaker', breaker)
+    monkeypatch.setattr(server.llm_scheduler, 'call_timeout', 0.05)
+    monkeypatch.setattr(server, 'AI_CALL_TIMEOUT', 0.05)
+    monkeypatch.setattr(server, 'AI_BATCH_SIZE', 1)
+    monkeypatch.setattr(server.llm_client, 'latency', 5)
+    vulns = [
+        {'type': 'XSS', 'severity': 'High', 'title': 'XSS', 'line_number': n, 'code_snippet': f'el.innerHTML = v{n}'}
+        for n in range(4)
+    ]
+
+    async def enrich():
+        results = await server.enrich_vulnerabilities(vulns, 'code')
+        # The shielded calls end with their own timeout, not the caller's
+        await asyncio.sleep(0.1)
+        return results
+
+    results = asyncio.run(enrich())
+    assert all(result['fallback'] for result in results)
+    assert breaker.state == 'open'
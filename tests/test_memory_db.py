@@ -0,0 +1,117 @@
+"""The in-memory Mongo stand-in behaves like Mongo for the queries the app sends"""
+import asyncio
+
+import pytest
+
+from memory_db import MemoryCollection
+
+DOCS = [
+    {'scan_id': 'a', 'timestamp': '2026-01-02', 'language': 'python', 'risk_score': 10.0,
+     'vulnerabilities': [{'id': 'v1', 'type': 'XSS'}, {'id': 'v2', 'type': 'SQL_INJECTION'}]},
+    {'scan_id': 'b', 'timestamp': '2026-01-01', 'language': 'java', 'risk_score': 30.0, 'vulnerabilities': []},
+    {'scan_id': 'c', 'timestamp': '2026-01-02', 'language': 'python', 'rule_types': ['XSS']},
+]
+
+
+@pytest.fixture
+def collection():
+    collection = MemoryCollection()
+    asyncio.run(collection.insert_many(DOCS))
+    return collection
+
+
+def find(collection, query, projection=None, sort=None, limit=0):
+    cursor = collection.find(query, projection)
+    if sort:
+        cursor.sort(sort)
+    return asyncio.run(cursor.limit(limit).to_list(None))
+
+
+def ids(docs):
+    return [doc['scan_id'] for doc in docs]
+
+
+@pytest.mark.parametrize('query,expected', [
+    ({}, ['a', 'b', 'c']),
+    ({'language': 'python'}, ['a', 'c']),
+    ({'scan_id': {'$in': ['b', 'c', 'x']}}, ['b', 'c']),
+    ({'timestamp': {'$gte': '2026-01-02'}}, ['a', 'c']),
+    ({'timestamp': {'$gte': '2026-01-01', '$lt': '2026-01-02'}}, ['b']),
+    ({'risk_score': {'$lte': 10}}, ['a']),
+    ({'$or': [{'timestamp': {'$lt': '2026-01-02'}}, {'timestamp': '2026-01-02', 'scan_id': {'$lt': 'c'}}]}, ['a', 'b']),
+    ({'vulnerabilities.id': 'v2'}, ['a']),
+    ({'language': 'python', 'vulnerabilities.id': 'v3'}, []),
+])
+def test_queries(collection, query, expected):
+    assert ids(find(collection, query)) == expected
+
+
+def test_keyset_sort_and_limit(collection):
+    order = [('timestamp', -1), ('scan_id', -1)]
+    assert ids(find(collection, {}, sort=order)) == ['c', 'a', 'b']
+    assert ids(find(collection, {}, sort=order, limit=2)) == ['c', 'a']
+    # Missing values sort first ascending, as in Mongo
+    assert ids(find(collection, {}, sort=[('risk_score', 1)])) == ['c', 'a', 'b']
+
+
+def test_projections(collection):
+    assert find(collection, {'scan_id': 'b'}, {'_id': 0, 'scan_id': 1, 'missing': 1}) == [{'scan_id': 'b'}]
+    assert find(collection, {'scan_id': 'c'}, {'_id': 0, 'rule_types': 0, 'timestamp': 0}) == [
+        {'scan_id': 'c', 'language': 'python'}
+    ]
+    assert find(collection, {'scan_id': 'a'}, {'vulnerabilities.type': 1}) == [
+        {'vulnerabilities': [{'type': 'XSS'}, {'type': 'SQL_INJECTION'}]}
+    ]
+    # The positional operator keeps the array element the query matched
+    doc = asyncio.run(collection.find_one({'vulnerabilities.id': 'v2'}, {'_id': 0, 'vulnerabilities.$': 1, 'language': 1}))
+    assert doc == {'vulnerabilities': [{'id': 'v2', 'type': 'SQL_INJECTION'}], 'language': 'python'}
+
+
+def test_updates(collection):
+    async def run():
+        await collection.update_one({'scan_id': 'b'}, {'$set': {'status': 'complete'}, '$inc': {'progress.done': 2}})
+        await collection.update_one({'scan_id': 'b'}, {'$push': {'vulnerabilities': {'id': 'v3'}}, '$inc': {'progress.done': 1}})
+        missing = await collection.update_one({'scan_id': 'x'}, {'$set': {'status': 'new'}})
+        await collection.update_one({'scan_id': 'x'}, {'$set': {'status': 'new'}}, upsert=True)
+        before = await collection.find_one_and_update(
+            {'language': 'python'}, {'$set': {'claimed': True}}, sort=[('scan_id', -1)], projection={'_id': 0, 'scan_id': 1, 'claimed': 1}
+        )
+        return missing, before
+
+    missing, before = asyncio.run(run())
+    b = find(collection, {'scan_id': 'b'})[0]
+    assert (b['status'], b['progress'], b['vulnerabilities']) == ('complete', {'done': 3}, [{'id': 'v3'}])
+    assert missing.matched_count == 0
+    assert find(collection, {'scan_id': 'x'}) == [{'scan_id': 'x', 'status': 'new'}]
+    assert before == {'scan_id': 'c'}
+    assert ids(find(collection, {'claimed': True})) == ['c']
+
+
+def test_aggregation(collection):
+    pipeline = [
+        {'$match': {'language': 'python'}},
+        {'$project': {'_id': 0, 'type': {'$ifNull': ['$rule_types', '$vulnerabilities.type']}}},
+        {'$unwind': '$type'},
+        {'$group': {'_id': '$type', 'count': {'$sum': 1}}},
+        {'$sort': {'count': -1, '_id': 1}},
+        {'$limit': 5}
+    ]
+    assert asyncio.run(collection.aggregate(pipeline).to_list(None)) == [
+        {'_id': 'XSS', 'count': 2}, {'_id': 'SQL_INJECTION', 'count': 1}
+    ]
+    grouped = [
+        {'$group': {
+            '_id': {'$substrBytes': ['$timestamp', 0, 7]},
+            'scans': {'$sum': 1},
+            'mean_risk_score': {'$avg': '$risk_score'},
+            'scored': {'$sum': {'$cond': [{'$gte': ['$risk_score', 20]}, 1, 0]}}
+        }}
+    ]
+    assert asyncio.run(collection.aggregate(grouped).to_list(None)) == [
+        {'_id': '2026-01', 'scans': 3, 'mean_risk_score': 20.0, 'scored': 1}
+    ]
+
+
+def test_delete_many(collection):
+    asyncio.run(collection.delete_many({'language': 'python'}))
+    assert ids(find(collection, {})) == ['b']
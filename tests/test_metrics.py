@@ -0,0 +1,104 @@
+import re
+
+import pytest
+from starlette.testclient import TestClient
+
+import server
+from metrics import Registry, current_spans, server_timing, span
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('latency_seconds', 'Latency', ['stage'], buckets=(1.0, 0.1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value, stage='detect')
+    assert registry.render() == '\n'.join([
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{stage="detect",le="0.1"} 2',
+        'latency_seconds_bucket{stage="detect",le="1.0"} 3',
+        'latency_seconds_bucket{stage="detect",le="+Inf"} 4',
+        'latency_seconds_sum{stage="detect"} 5.65',
+        'latency_seconds_count{stage="detect"} 4',
+    ]) + '\n'
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    counter = registry.counter('matches_total', 'Matches', ['pattern'])
+    counter.inc(pattern='a"b\\c\nd')
+    counter.inc(2, pattern='a"b\\c\nd')
+    assert registry.render().splitlines()[-1] == 'matches_total{pattern="a\\"b\\\\c\\nd"} 3'
+    with pytest.raises(ValueError):
+        counter.inc(rule='SQL_INJECTION')
+
+
+def test_callback_metrics_are_read_at_render_time():
+    registry = Registry()
+    counters = {'hits': 1, 'misses': 2}
+    registry.callback('lookups_total', 'Lookups', lambda: {(result,): count for result, count in counters.items()},
+                      ['result'], kind='counter')
+    registry.callback('open', 'Open', lambda: 0)
+    counters['hits'] += 4
+    assert registry.render().splitlines() == [
+        '# HELP lookups_total Lookups',
+        '# TYPE lookups_total counter',
+        'lookups_total{result="hits"} 5',
+        'lookups_total{result="misses"} 2',
+        '# HELP open Open',
+        '# TYPE open gauge',
+        'open 0',
+    ]
+
+
+def test_span_records_into_the_histogram_and_the_request_spans():
+    histogram = Registry().histogram('stage_seconds', 'Stages', ['stage'])
+    # Outside a request only the histogram is recorded
+    with span(histogram, 'detect'):
+        pass
+    spans = {}
+    token = current_spans.set(spans)
+    try:
+        for _ in range(2):
+            with span(histogram, 'enrich'):
+                pass
+        with pytest.raises(RuntimeError):
+            with span(histogram, 'store'):
+                raise RuntimeError('store failed')
+    finally:
+        current_spans.reset(token)
+    assert sorted(spans) == ['enrich', 'store']
+    assert {key: series[2] for key, series in histogram._series.items()} == {('detect',): 1, ('enrich',): 2, ('store',): 1}
+    assert server_timing({'detect': 0.0123}, 0.05) == 'detect;dur=12.3, total;dur=50.0'
+
+
+def scan(client):
+    return client.post('/api/scan/analyze', json={
+        'code': 'query = "SELECT * FROM metrics WHERE id = " + user_id\n',
+        'language': 'python', 'project_context': 'tests', 'scan_profile': 'full', 'use_cache': False
+    })
+
+
+def test_metrics_endpoint_serves_the_scan_stages(memory_db):
+    client = TestClient(server.app)
+    assert scan(client).status_code == 200
+    response = client.get('/api/metrics')
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    body = response.text
+    for stage in ('detect', 'ai_enrich', 'store'):
+        assert re.search(rf'^secure_review_scan_stage_seconds_count{{stage="{stage}"}} [1-9]', body, re.M), stage
+    assert re.search(
+        r'^secure_review_http_request_seconds_count\{method="POST",route="/api/scan/analyze",status="200"\} [1-9]', body, re.M
+    )
+    assert '# TYPE secure_review_ai_cache_lookups_total counter' in body
+
+
+@pytest.mark.parametrize('enabled', [False, True])
+def test_server_timing_header(memory_db, monkeypatch, enabled):
+    monkeypatch.setattr(server, 'METRICS_TIMING_HEADERS', enabled)
+    response = scan(TestClient(server.app))
+    if not enabled:
+        assert 'server-timing' not in response.headers
+        return
+    stages = [entry.split(';')[0] for entry in response.headers['server-timing'].split(', ')]
+    assert {'detect', 'ai_enrich', 'store'} <= set(stages) and stages[-1] == 'total'
@@ -0,0 +1,144 @@
+import re
+
+import pytest
+
+import server
+from benchmarks.corpora import generate_source, pathological_inputs, standard_corpora
+from rule_engine import RuleEngine, compile_linear, load_re2
+
+needs_re2 = pytest.mark.skipif(load_re2() is None, reason='google-re2 is not installed')
+BACKENDS = ['re', pytest.param('re2', marks=needs_re2)]
+
+TURKISH_I = 'el.İnnerHTML = params.get("q")'
+
+
+def route_source(routes: int) -> str:
+    """Generated code with a Flask route every 20 lines, every third one behind login_required"""
+    block = generate_source('python', 18)
+    parts = []
+    for n in range(routes):
+        parts.append(f"@app.route('/r{n}')" + ('\n@login_required' if n % 3 == 0 else '') + f'\ndef route_{n}():\n{block}')
+    return '\n'.join(parts)
+
+
+CORPUS = [
+    *((name, code) for name, _, code in standard_corpora([100, 1000])),
+    *((f'pathological-{pattern}', code) for _, pattern, code in pathological_inputs(server.SECURITY_RULES, 2000)),
+    *((f'sample-{language}', code) for language, code in server.SAMPLE_CODE.items()),
+    ('routes', route_source(30)),
+    ('unicode', 'naïve = "SELECT * FROM t WHERE x = " + q\n\n  \nel.innerHTML = ünïcode\r\nx = 1\n' + TURKISH_I + '\nEVAL(ınput)\n'),
+]
+
+
+def baseline_scan(code):
+    """The rules x patterns x lines loop the rule engine replaced"""
+    vulnerabilities = []
+    lines = code.split('\n')
+    for rule_name, rule_data in server.SECURITY_RULES.items():
+        for pattern in rule_data['patterns']:
+            for i, line in enumerate(lines, 1):
+                if re.search(pattern, line, re.IGNORECASE):
+                    vulnerabilities.append({
+                        'type': rule_name,
+                        'severity': rule_data['severity'],
+                        'title': rule_data['description'],
+                        'line_number': i,
+                        'code_snippet': line.strip(),
+                        'owasp': rule_data['owasp'],
+                        'pattern_matched': pattern
+                    })
+    return vulnerabilities
+
+
+@pytest.mark.parametrize('name,code', CORPUS, ids=[name for name, _ in CORPUS])
+def test_line_rules_match_the_baseline_loop(name, code):
+    # Line-spanning patterns never matched a single line in the baseline loop
+    engine = RuleEngine(server.SECURITY_RULES)
+    assert engine.scan_lines(code.split('\n'), spanning=False) == baseline_scan(code)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_literal_prefilter_changes_no_findings(backend):
+    engines = [RuleEngine(server.SECURITY_RULES, backend=backend, literal_prefilter=prefilter) for prefilter in (False, True)]
+    for name, code in CORPUS:
+        results = []
+        for engine in engines:
+            scan_info = {}
+            results.append((engine.scan(code, scan_info=scan_info), scan_info))
+        assert results[0] == results[1], name
+
+
+def test_language_selection_only_drops_other_languages_rules():
+    engine = RuleEngine(server.SECURITY_RULES)
+    for name, code in CORPUS:
+        findings = engine.scan(code)
+        for language in ('python', 'javascript', 'java', 'go'):
+            expected = [
+                f for f in findings
+                if 'languages' not in server.SECURITY_RULES[f['type']] or language in server.SECURITY_RULES[f['type']]['languages']
+            ]
+            assert engine.scan(code, language=language) == expected, (name, language)
+
+
+def test_routes_without_auth_are_found_across_lines():
+    findings = RuleEngine(server.SECURITY_RULES).scan(route_source(30), language='python')
+    routes = [f['line_number'] for f in findings if f['type'] == 'MISSING_AUTH']
+    assert len(routes) == 20
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('max_line_length', [0, 40])
+def test_buffer_scan_matches_string_scan(backend, max_line_length):
+    engine = RuleEngine(server.SECURITY_RULES, backend=backend, max_line_length=max_line_length)
+    for name, code in CORPUS:
+        for language in (None, 'python'):
+            expected_info, scan_info = {}, {}
+            expected = engine.scan(code, scan_info=expected_info, language=language)
+            # Small windows so lines and matches straddle window boundaries
+            findings = engine.scan_buffer(code.encode('utf-8'), scan_info=scan_info, language=language, window_bytes=4096)
+            assert (findings, scan_info) == (expected, expected_info), (name, language)
+
+
+def types(engine, code):
+    return [f['type'] for f in engine.scan(code)]
+
+
+def test_auto_matches_unicode_case_folding_like_re():
+    assert types(RuleEngine(server.SECURITY_RULES, backend='auto'), TURKISH_I) == ['XSS']
+    assert types(RuleEngine(server.SECURITY_RULES, backend='re'), TURKISH_I) == ['XSS']
+
+
+@needs_re2
+def test_auto_uses_re2_for_the_built_in_rules():
+    engine = RuleEngine(server.SECURITY_RULES, backend='auto')
+    assert set(engine.entry_backends) == {'re2'} and not engine.incompatible
+    assert types(RuleEngine(server.SECURITY_RULES, backend='re2'), TURKISH_I) == ['XSS']
+
+
+@needs_re2
+@pytest.mark.parametrize('pattern', [
+    r'innerHTML\s*=', r'if\s*\(', r'[a-z]+_id', r'[^a-z]x', r'[]i]+', r'[\]x]i', r'(?i:pickle)', r'(?P<fn>eval)\(', r'[0-9]i',
+    r'[^\s@]+@', r'a\Sb', r'[\\s]',
+])
+def test_re2_matches_like_re(pattern):
+    texts = ['', 'x', 'ix', 'Ix', 'İx', 'ıx', ']x', 'x_id', 'İ_id', '9ı', 'innerhtml=', 'İnnerHTML =', 'ınnerhtml\u00a0=',
+             'innerHTML\v\u3000=', 'if (', 'İF\x85(', 'PİCKLE', 'evaI(', 'EVAL(', 'eval(', 'ёx', 'Kx', 'a\u2028b', 'a€b',
+             'x\u00a0y@', 'xy@', '\\', 's']
+    expected = [bool(re.search(pattern, text, re.IGNORECASE)) for text in texts]
+    assert [bool(compile_linear(pattern).search(text)) for text in texts] == expected
+    binary = compile_linear(pattern.encode('utf-8'))
+    assert [bool(binary.search(text.encode('utf-8'))) for text in texts] == expected
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_profiled_scans_keep_the_time_budget(backend):
+    engine = RuleEngine(server.SECURITY_RULES, backend=backend, time_budget=10)
+    code = route_source(30)
+    for profiled in (False, True):
+        pattern_times = [0.0] * len(engine.entries) if profiled else None
+        scan_info = {}
+        assert engine.scan(code, pattern_times=pattern_times, scan_info=scan_info, deadline=0.0) == []
+        assert scan_info['timed_out']
+        scan_info = {}
+        findings = engine.scan_buffer(code.encode('utf-8'), pattern_times=pattern_times, scan_info=scan_info)
+        assert findings == engine.scan(code) and not scan_info['timed_out']
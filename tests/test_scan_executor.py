@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+
+import server
+from rule_engine import RuleEngine
+from scan_executor import ScanExecutor
+
+
+def source(lines: int) -> str:
+    block = [
+        'query = "SELECT * FROM users WHERE id = " + user_id',
+        'cursor.execute(query)',
+        'el.innerHTML = params.get("q")',
+        'x = 1',
+    ]
+    return '\n'.join(block[n % len(block)] for n in range(lines))
+
+
+@pytest.fixture
+def engine():
+    return RuleEngine(server.SECURITY_RULES, time_budget=30)
+
+
+@pytest.mark.parametrize('mode', ['inline', 'thread', 'process'])
+def test_modes_agree_with_engine(engine, mode):
+    code = source(2000)
+    executor = ScanExecutor(server.SECURITY_RULES, engine, mode=mode, chunk_lines=300)
+    try:
+        scan_info = {}
+        findings = asyncio.run(executor.scan(code, scan_info))
+    finally:
+        executor.shutdown()
+    expected_info = {}
+    assert findings == engine.scan(code, scan_info=expected_info)
+    assert scan_info == expected_info == {'truncated_lines': 0, 'timed_out': False}
+
+
+def test_workers_are_not_forked_from_the_server(engine):
+    executor = ScanExecutor(server.SECURITY_RULES, engine, mode='process')
+    try:
+        assert executor.process_pool._mp_context.get_start_method() in ('forkserver', 'spawn')
+    finally:
+        executor.shutdown()
+
+
+def test_expired_deadline_stops_a_scan(engine):
+    lines = source(1000).split('\n')
+    scan_info = {}
+    assert engine.scan_lines(lines, scan_info=scan_info, deadline=time.time() - 1) == []
+    assert scan_info['timed_out'] is True
+
+
+@pytest.mark.parametrize('profiled', [False, True])
+def test_process_chunks_share_one_deadline(engine, monkeypatch, profiled):
+    # Every chunk, in every worker process, gets the deadline of the whole
+    # scan: one that has already passed stops all of them at once, profiled or not
+    monkeypatch.setattr(engine, 'new_deadline', lambda: time.time() - 1)
+    profiles = []
+    executor = ScanExecutor(
+        server.SECURITY_RULES, engine, mode='process', chunk_lines=100,
+        profile_rate=1.0 if profiled else 0.0, on_profile=profiles.append
+    )
+    try:
+        scan_info = {}
+        findings = asyncio.run(executor.scan(source(2000), scan_info))
+    finally:
+        executor.shutdown()
+    assert findings == []
+    assert scan_info['timed_out'] is True
+    assert len(profiles) == profiled
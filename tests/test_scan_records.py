@@ -0,0 +1,88 @@
+import json
+
+import pytest
+from pydantic import TypeAdapter
+
+import server
+from scan_records import encode_json, iter_json
+
+
+def synthetic_findings(count):
+    rules = list(server.SECURITY_RULES.items())
+    findings, analyses = [], []
+    for n in range(count):
+        rule_name, rule = rules[n % len(rules)]
+        findings.append({
+            'type': rule_name,
+            'severity': rule['severity'],
+            'title': rule['description'],
+            # Findings without a line or snippet, and text JSON must escape
+            'line_number': n + 1 if n % 7 else None,
+            'code_snippet': f'value_{n} = "naïve\\t{n}" + q  # </script>' if n % 5 else None,
+            'owasp': rule['owasp']
+        })
+        analyses.append({
+            'ai_explanation': f'Finding {n}: user input reaches a sensitive sink without validation.',
+            'confidence_score': 0.85 if n % 3 else 1,
+            'recommendation': 'Validate and encode untrusted input before use.'
+        })
+    return findings, analyses
+
+
+def pydantic_body(findings, analyses):
+    """The body FastAPI built from response_model=ScanResult before scan_records"""
+    issues = [
+        server.VulnerabilityIssue(
+            type=vuln['type'],
+            severity=vuln['severity'],
+            title=vuln['title'],
+            description=vuln.get('owasp', ''),
+            filename='test.py',
+            line_number=vuln.get('line_number'),
+            code_snippet=vuln.get('code_snippet'),
+            ai_explanation=ai_analysis['ai_explanation'],
+            confidence_score=ai_analysis['confidence_score'],
+            policy_mappings=[vuln.get('owasp', 'Security Issue')],
+            recommendation=ai_analysis['recommendation']
+        )
+        for vuln, ai_analysis in zip(findings, analyses)
+    ]
+    result = server.ScanResult(
+        scan_id='test', language='python', project_context='test', scan_profile='full',
+        vulnerabilities=issues, **server.summarize_vulnerabilities(issues)
+    )
+    adapter = TypeAdapter(server.ScanResult)
+    return json.dumps(adapter.dump_python(adapter.validate_python(result), mode='json'))
+
+
+def lean_result(findings, analyses):
+    vulnerabilities = [server.to_vulnerability(vuln, ai_analysis, 'test.py') for vuln, ai_analysis in zip(findings, analyses)]
+    return server.scan_result('test', 'python', 'test', 'full', vulnerabilities)
+
+
+def comparable(body):
+    # ids are random and the timestamp is formatted differently
+    doc = json.loads(body)
+    doc['id'] = doc['timestamp'] = None
+    for vuln in doc['vulnerabilities']:
+        vuln['id'] = None
+    return doc
+
+
+@pytest.mark.parametrize('count', [0, 1, 37, 1200])
+def test_lean_body_matches_the_pydantic_body(count):
+    findings, analyses = synthetic_findings(count)
+    expected = comparable(pydantic_body(findings, analyses))
+    result = lean_result(findings, analyses)
+    server.scan_document(result)
+    assert comparable(encode_json(result)) == expected
+    for chunk_items in (1, 500):
+        assert comparable(b''.join(iter_json(result, chunk_items))) == expected
+
+
+def test_stored_document_keeps_the_response_fields():
+    findings, analyses = synthetic_findings(20)
+    result = lean_result(findings, analyses)
+    doc = server.scan_document(result)
+    body = json.loads(encode_json(result))
+    assert {key: doc[key] for key in body} == body
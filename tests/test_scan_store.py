@@ -0,0 +1,174 @@
+import asyncio
+import random
+from collections import Counter
+
+import pytest
+
+from memory_db import MemoryCollection, MemoryDatabase
+from scan_store import LISTING_ORDER, SCAN_LISTING, ScanStore, decode_cursor, encode_cursor
+
+
+def scan_doc(scan_id, findings=2):
+    return {
+        'scan_id': scan_id,
+        'timestamp': '2026-01-01T00:00:00+00:00',
+        'language': 'python',
+        'vulnerabilities': [{'id': f'{scan_id}-{n}', 'type': 'XSS', 'line_number': n} for n in range(findings)]
+    }
+
+
+@pytest.fixture
+def indexes(monkeypatch):
+    """(collection, keys, options) of every create_index call"""
+    created = []
+
+    async def create_index(self, keys, **options):
+        name = next(name for name, collection in database._collections.items() if collection is self)
+        created.append((name, keys, options))
+
+    database = MemoryDatabase()
+    monkeypatch.setattr(MemoryCollection, 'create_index', create_index)
+    return database, created
+
+
+def test_retention_expires_every_document_of_a_scan(indexes):
+    database, created = indexes
+    asyncio.run(ScanStore(database, layout='split', retention_days=7).ensure_indexes())
+    ttl = {name: options['expireAfterSeconds'] for name, keys, options in created if 'expireAfterSeconds' in options}
+    assert ttl == {'scans': 7 * 24 * 3600, 'vulnerabilities': 7 * 24 * 3600, 'scan_sources': 7 * 24 * 3600}
+
+
+def test_no_ttl_without_retention(indexes):
+    database, created = indexes
+    asyncio.run(ScanStore(database).ensure_indexes())
+    assert not any('expireAfterSeconds' in options for _, _, options in created)
+
+
+def test_filtered_listings_have_keyset_indexes(indexes):
+    database, created = indexes
+    asyncio.run(ScanStore(database).ensure_indexes())
+    keys = [keys for name, keys, _ in created if name == 'scans']
+    for field in ('project_context', 'language', 'scan_profile', 'deployment_ready'):
+        assert [(field, 1), *LISTING_ORDER] in keys
+
+
+def test_split_layout_documents_are_stamped_but_not_returned():
+    database = MemoryDatabase()
+    store = ScanStore(database, layout='split')
+
+    async def run():
+        await store.insert_scan(scan_doc('a'))
+        await store.append_vulnerability('a', 2, {'id': 'a-2', 'type': 'XSS', 'line_number': 2}, {'$inc': {'total_issues': 1}})
+        await store.save_line_index('a', ['h1', 'h2'])
+        return await store.get_scan('a'), await store.get_line_index('a')
+
+    scan, line_index = asyncio.run(run())
+    created_at = database.scans.docs[0]['created_at']
+    assert [doc['created_at'] for doc in database.vulnerabilities.docs[:2]] == [created_at, created_at]
+    assert all('created_at' in doc for doc in database.vulnerabilities.docs + database.scan_sources.docs)
+    assert [v['id'] for v in scan['vulnerabilities']] == ['a-0', 'a-1', 'a-2']
+    assert not any('created_at' in v for v in scan['vulnerabilities'])
+    assert 'created_at' not in scan
+    assert line_index == ['h1', 'h2']
+
+
+SEVERITIES = ['critical', 'high', 'medium', 'low']
+TIMESTAMPS = [f'2026-0{month}-0{day}T1{hour}:00:00+00:00' for month in (1, 2) for day in (1, 2) for hour in (0, 5)]
+
+
+def random_scans(rng, count):
+    """Scans sharing a handful of timestamps, so keyset ties are common"""
+    docs = []
+    for n in range(count):
+        types = [rng.choice(['XSS', 'SQL_INJECTION', 'WEAK_CRYPTO', 'MISSING_AUTH']) for _ in range(rng.randrange(5))]
+        counts = {f'{severity}_count': rng.randrange(4) for severity in SEVERITIES}
+        docs.append({
+            'scan_id': f'scan-{rng.randrange(10 ** 6):06d}-{n}',
+            'timestamp': rng.choice(TIMESTAMPS),
+            'language': rng.choice(['python', 'java']),
+            'project_context': rng.choice(['api', 'web']),
+            'scan_profile': 'full',
+            'deployment_ready': rng.random() < 0.3,
+            'risk_score': float(rng.randrange(100)),
+            'total_issues': len(types),
+            **counts,
+            'vulnerabilities': [{'id': f'{n}-{i}', 'type': t, 'line_number': i} for i, t in enumerate(types)],
+            'rule_types': types
+        })
+    return docs
+
+
+def stored(layout, docs):
+    store = ScanStore(MemoryDatabase(), layout=layout)
+    for doc in docs:
+        asyncio.run(store.insert_scan(doc))
+    return store
+
+
+@pytest.mark.parametrize('layout', ['embedded', 'split'])
+@pytest.mark.parametrize('query', [{}, {'language': 'python'}, {'project_context': 'web', 'deployment_ready': False}])
+def test_keyset_pages_cover_the_listing_once(layout, query):
+    docs = random_scans(random.Random(3), 60)
+    store = stored(layout, docs)
+    expected = sorted(
+        (doc for doc in docs if all(doc[field] == value for field, value in query.items())),
+        key=lambda doc: (doc['timestamp'], doc['scan_id']),
+        reverse=True
+    )
+    for limit in (1, 7, 100):
+        rows, after = [], None
+        while True:
+            page = asyncio.run(store.list_scans(query, limit, after))
+            rows += page
+            if len(page) < limit:
+                break
+            after = decode_cursor(encode_cursor(page[-1]))
+        assert [row['scan_id'] for row in rows] == [doc['scan_id'] for doc in expected]
+    assert set(rows[0]) == set(SCAN_LISTING) - {'_id', 'status'}
+
+
+@pytest.mark.parametrize('layout', ['embedded', 'split'])
+def test_aggregates_match_the_documents(layout):
+    docs = random_scans(random.Random(4), 80)
+    if layout == 'embedded':
+        # Scans stored before rule_types existed
+        for doc in docs[::5]:
+            del doc['rule_types']
+    store = stored(layout, docs)
+    query = {'language': 'python', 'timestamp': {'$gte': TIMESTAMPS[1]}}
+    selected = [doc for doc in docs if doc['language'] == 'python' and doc['timestamp'] >= TIMESTAMPS[1]]
+    result = asyncio.run(store.aggregate_scans(query, 7, 3))
+
+    periods = sorted({doc['timestamp'][:7] for doc in selected})
+    assert [row['period'] for row in result['severity_trend']] == periods
+    for row in result['severity_trend']:
+        bucket = [doc for doc in selected if doc['timestamp'][:7] == row['period']]
+        assert row['scans'] == len(bucket)
+        for severity in SEVERITIES:
+            assert row[severity] == sum(doc[f'{severity}_count'] for doc in bucket)
+        assert row['mean_risk_score'] == pytest.approx(sum(doc['risk_score'] for doc in bucket) / len(bucket))
+
+    counts = Counter(v['type'] for doc in selected for v in doc['vulnerabilities'])
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:3]
+    assert [(row['type'], row['count']) for row in result['top_types']] == ranked
+
+    totals = result['totals']
+    assert totals['scans'] == len(selected)
+    assert totals['total_issues'] == sum(doc['total_issues'] for doc in selected)
+    assert totals['deployment_ready'] == sum(doc['deployment_ready'] for doc in selected)
+    assert totals['mean_risk_score'] == pytest.approx(sum(doc['risk_score'] for doc in selected) / len(selected))
+
+
+def test_aggregates_of_no_scans():
+    result = asyncio.run(ScanStore(MemoryDatabase()).aggregate_scans({}, 10, 5))
+    assert result == {
+        'severity_trend': [],
+        'top_types': [],
+        'totals': {'scans': 0, 'total_issues': 0, 'mean_risk_score': None, 'deployment_ready': 0}
+    }
+
+
+def test_malformed_cursors_are_refused():
+    for cursor in ('not base64!', encode_cursor({'timestamp': 1, 'scan_id': 'a'}), 'W10='):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
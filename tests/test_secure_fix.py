@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+import server
+from ai_cache import AnalysisCache
+from memory_db import MemoryCollection
+from secure_fix import FIX_TEMPLATES, SecureFixService, fix_key
+
+SNIPPET = 'query = "SELECT * FROM t WHERE id = " + request.args["id"]'
+
+
+def test_fix_key_ignores_formatting_only():
+    key = fix_key('SQL_INJECTION', SNIPPET, 'model')
+    assert fix_key('SQL_INJECTION', f'  {SNIPPET.replace(" ", "  ")}\n', 'model') == key
+    assert fix_key('SQL_INJECTION', SNIPPET + ' + x', 'model') != key
+    assert fix_key('XSS', SNIPPET, 'model') != key
+    assert fix_key('SQL_INJECTION', SNIPPET, 'other-model') != key
+    assert fix_key('SQL_INJECTION', SNIPPET, 'model', prompt_version='0') != key
+
+
+class Backend:
+    """Findings to load and an LLM to call, counting both"""
+
+    def __init__(self, findings, latency=0.01, fail=False):
+        self.findings = findings
+        self.latency = latency
+        self.fail = fail
+        self.loads = 0
+        self.calls = 0
+
+    async def load(self, vulnerability_id):
+        self.loads += 1
+        await asyncio.sleep(self.latency)
+        return self.findings.get(vulnerability_id)
+
+    async def complete(self, prompt, tenant):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError('LLM unavailable')
+        return json.dumps({'fixed_code': 'fixed()', 'explanation': 'Fixed.', 'prevents_attacks': ['SQL Injection']})
+
+    def service(self, cache=None, timeout=5):
+        return SecureFixService(cache or AnalysisCache(MemoryCollection()), self.load, self.complete, 'model', timeout=timeout)
+
+
+def finding(snippet=SNIPPET, profile='full', vuln_type='SQL_INJECTION'):
+    return {'type': vuln_type, 'severity': 'Critical', 'code_snippet': snippet}, {'scan_profile': profile}
+
+
+def test_concurrent_requests_share_one_load_and_generation():
+    backend = Backend({'a': finding()})
+    service = backend.service()
+
+    async def run():
+        return await asyncio.gather(*(service.get_fix('a') for _ in range(5)))
+
+    fixes = asyncio.run(run())
+    assert (backend.loads, backend.calls) == (1, 1)
+    assert all(fix == fixes[0] and not fix['fallback'] for fix in fixes)
+    assert service.counters == {'generated': 1, 'template': 0, 'coalesced': 4}
+
+
+def test_findings_with_the_same_snippet_share_one_generation():
+    backend = Backend({'a': finding(), 'b': finding(f'\t{SNIPPET}  '), 'c': finding('eval(x)')})
+    service = backend.service()
+
+    async def run():
+        return await asyncio.gather(*(service.get_fix(vulnerability_id) for vulnerability_id in 'abc'))
+
+    fixes = asyncio.run(run())
+    assert backend.calls == 2
+    assert [fix['vulnerability_id'] for fix in fixes] == ['a', 'b', 'c']
+    assert fixes[1]['original_code'] == f'\t{SNIPPET}  '
+
+
+def test_failed_generation_is_not_cached():
+    backend = Backend({'a': finding()}, fail=True)
+    service = backend.service()
+    fix = asyncio.run(service.get_fix('a'))
+    assert fix['fallback'] and fix['fixed_code'] == FIX_TEMPLATES['SQL_INJECTION']['fixed']
+    backend.fail = False
+    assert not asyncio.run(service.get_fix('a'))['fallback']
+    assert backend.calls == 2
+
+
+def test_slow_generation_gets_the_template_and_is_cached_later():
+    backend = Backend({'a': finding()}, latency=0.05)
+    service = backend.service(timeout=0.02)
+
+    async def run():
+        first = await service.get_fix('a')
+        await asyncio.sleep(0.1)
+        return first, await service.get_fix('a')
+
+    first, second = asyncio.run(run())
+    assert first['fallback'] and not second['fallback']
+    assert backend.calls == 1
+
+
+@pytest.mark.parametrize('found,expected', [
+    (None, 'XSS'),
+    (finding(profile='demo', vuln_type='HARDCODED_SECRET'), 'HARDCODED_SECRET'),
+    (finding(snippet='', vuln_type='XSS'), 'XSS'),
+])
+def test_templates_without_generation(found, expected):
+    backend = Backend({'XSS_1': found})
+    fix = asyncio.run(backend.service().get_fix('XSS_1'))
+    assert fix['fallback'] and fix['fixed_code'] == FIX_TEMPLATES[expected]['fixed']
+    assert backend.calls == 0
+
+
+def test_cached_fixes_survive_a_restart_and_an_open_breaker(memory_db, monkeypatch):
+    server.fix_cache.memory._data.clear()
+    vulnerabilities = [
+        server.to_vulnerability(
+            {'type': 'SQL_INJECTION', 'severity': 'Critical', 'title': 'SQL Injection', 'line_number': n + 1,
+             'code_snippet': SNIPPET, 'owasp': 'A03:2021 - Injection'},
+            server.fallback_analysis({'title': 'SQL Injection'}),
+            'app.py'
+        )
+        for n in range(3)
+    ]
+    result = server.scan_result('fixes', 'python', 'tests', 'full', vulnerabilities)
+    asyncio.run(server.scan_store.insert_scan(server.scan_document(result)))
+    ids = [v['id'] for v in result['vulnerabilities']]
+    client = TestClient(server.app)
+
+    def fixes():
+        return [client.get(f'/api/secure-fix/{vulnerability_id}').json() for vulnerability_id in ids]
+
+    calls = server.llm_client.calls
+    generated = fixes()
+    assert server.llm_client.calls == calls + 1
+    assert not any(fix['fallback'] for fix in generated)
+
+    # A new process: the in-process tier is empty and the LLM is refused
+    server.fix_cache.memory._data.clear()
+    monkeypatch.setattr(server.llm_scheduler.breaker, 'allow', lambda: False)
+    assert fixes() == generated
+    assert server.llm_client.calls == calls + 1
@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from starlette.testclient import TestClient
+
+import server
+
+
+def test_app_runs_the_lifespan(memory_db, monkeypatch):
+    events = []
+    monkeypatch.setattr(server, 'report_match_backend', lambda: events.append('startup'))
+    monkeypatch.setattr(server.scan_executor, 'shutdown', lambda: events.append('shutdown'))
+    with TestClient(server.app) as client:
+        assert events == ['startup']
+        assert client.get('/api/').status_code == 200
+    assert events == ['startup', 'shutdown']
+
+
+def upload_app(max_bytes):
+    app = FastAPI()
+    app.state.parsed = 0
+
+    @app.post('/upload')
+    async def upload(file: UploadFile = File(...)):
+        app.state.parsed += 1
+        return {'size': file.size}
+
+    app.add_middleware(server.RequestBodyLimit, path='/upload', max_bytes=max_bytes)
+    return app
+
+
+def multipart(content: bytes):
+    boundary = 'limit-test'
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="a.py"\r\n\r\n'.encode()
+        + content + f'\r\n--{boundary}--\r\n'.encode()
+    )
+    return body, {'content-type': f'multipart/form-data; boundary={boundary}'}
+
+
+def test_body_within_the_limit_is_accepted():
+    app = upload_app(1024)
+    response = TestClient(app).post('/upload', files={'file': ('a.py', b'x' * 500)})
+    assert response.status_code == 200
+    assert response.json() == {'size': 500}
+
+
+def test_oversized_content_length_is_refused_before_parsing():
+    app = upload_app(1024)
+    response = TestClient(app).post('/upload', files={'file': ('a.py', b'x' * 2000)})
+    assert response.status_code == 413
+    assert app.state.parsed == 0
+
+
+def test_oversized_chunked_body_is_cut_off():
+    app = upload_app(1024)
+    body, headers = multipart(b'x' * 4000)
+    chunks = (body[i:i + 256] for i in range(0, len(body), 256))
+    response = TestClient(app).post('/upload', content=chunks, headers=headers)
+    assert response.status_code == 413
+    assert app.state.parsed == 0
+
+
+def test_upload_scan(memory_db):
+    code = b'query = "SELECT * FROM users WHERE id = " + user_id\n'
+    response = TestClient(server.app).post(
+        '/api/scan/upload',
+        files={'file': ('app.py', code)},
+        data={'project_context': 'tests', 'scan_profile': 'full'}
+    )
+    assert response.status_code == 200
+    assert {v['type'] for v in response.json()['vulnerabilities']} == {'SQL_INJECTION'}
+
+
+def test_scan_listing_pages_and_filters(memory_db):
+    for n in range(25):
+        asyncio.run(server.scan_store.insert_scan({
+            'scan_id': f'scan-{n:02d}',
+            'timestamp': f'2026-01-0{n % 3 + 1}T00:00:00+00:00',
+            'language': 'python' if n % 2 else 'java',
+            'risk_score': float(n),
+            'vulnerabilities': []
+        }))
+    client = TestClient(server.app)
+    pages, cursor = [], None
+    while True:
+        body = client.get('/api/scans', params={'language': 'python', 'limit': 4, **({'cursor': cursor} if cursor else {})}).json()
+        pages.append([row['scan_id'] for row in body['scans']])
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    expected = sorted((f'2026-01-0{n % 3 + 1}', f'scan-{n:02d}') for n in range(1, 25, 2))[::-1]
+    assert [scan_id for page in pages for scan_id in page] == [scan_id for _, scan_id in expected]
+    assert [len(page) for page in pages] == [4, 4, 4]
+    assert client.get('/api/scans', params={'cursor': 'bad'}).status_code == 400
+
+    aggregates = client.get('/api/scans/aggregates', params={'bucket': 'day', 'since': '2026-01-02T00:00:00Z'}).json()
+    assert [(row['period'], row['scans']) for row in aggregates['severity_trend']] == [('2026-01-02', 8), ('2026-01-03', 8)]
+    assert client.get('/api/scans/aggregates', params={'bucket': 'week'}).status_code == 400
+
+
+def memo_scan(client, code, **options):
+    response = client.post('/api/scan/analyze', json={
+        'code': code, 'language': 'python', 'project_context': 'tests', 'scan_profile': 'full', **options
+    })
+    assert response.status_code == 200
+    return response.json()
+
+
+def stored_scan(database, scan_id):
+    return next(doc for doc in database.scans.docs if doc['scan_id'] == scan_id)
+
+
+def test_identical_scans_are_replayed_under_a_new_scan_id(memory_db):
+    client = TestClient(server.app)
+    code = 'query = "SELECT * FROM memo WHERE id = " + user_id\n'
+    first = memo_scan(client, code)
+    calls = server.llm_client.calls
+    second = memo_scan(client, code, filename='other.py')
+    assert server.llm_client.calls == calls
+    assert second['scan_id'] != first['scan_id']
+    assert stored_scan(memory_db, second['scan_id'])['memoized_from'] == first['scan_id']
+    assert [v['ai_explanation'] for v in second['vulnerabilities']] == [v['ai_explanation'] for v in first['vulnerabilities']]
+    assert {v['filename'] for v in second['vulnerabilities']} == {'other.py'}
+    assert not {v['id'] for v in second['vulnerabilities']} & {v['id'] for v in first['vulnerabilities']}
+
+    bypassed = memo_scan(client, code, use_cache=False)
+    assert 'memoized_from' not in stored_scan(memory_db, bypassed['scan_id'])
+
+
+def test_fallback_and_truncated_scans_are_not_memoized(memory_db, monkeypatch):
+    client = TestClient(server.app)
+
+    def unavailable(prompt):
+        raise RuntimeError('LLM unavailable')
+
+    code = 'query = "SELECT * FROM fallback WHERE id = " + user_id\n'
+    monkeypatch.setattr(server.llm_client, 'responder', unavailable)
+    failed = memo_scan(client, code)
+    assert failed['vulnerabilities'][0]['recommendation'] == 'Manual review recommended.'
+    monkeypatch.setattr(server.llm_client, 'responder', None)
+    retried = memo_scan(client, code)
+    assert 'memoized_from' not in stored_scan(memory_db, retried['scan_id'])
+    assert retried['vulnerabilities'][0]['recommendation'] != 'Manual review recommended.'
+
+    code = 'query = "SELECT * FROM long WHERE id = " + user_id  # ' + 'x' * server.SCAN_MAX_LINE_LENGTH + '\n'
+    assert memo_scan(client, code)['truncated']
+    again = memo_scan(client, code)
+    assert 'memoized_from' not in stored_scan(memory_db, again['scan_id'])
+
+
+@pytest.mark.parametrize('setting,value', [
+    ('ANALYSIS_PROMPT_TEMPLATE', 'Explain {type} ({severity}): {code}\n{context}'),
+    ('ANALYSIS_SYSTEM_MESSAGE', 'You are a terse reviewer.'),
+    ('BATCH_PROMPT_TEMPLATE', 'Findings: {count}\n{context}\n{marker}\n{findings}'),
+    ('AI_BATCH_SIZE', 1),
+])
+def test_prompt_and_batching_changes_invalidate_memoized_scans(monkeypatch, setting, value):
+    assert server.ruleset_version() == server.RULESET_VERSION
+    monkeypatch.setattr(server, setting, value)
+    assert server.ruleset_version() != server.RULESET_VERSION
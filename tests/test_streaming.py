@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+import server
+
+CODE = '''query = "SELECT * FROM stream WHERE id = " + user_id
+DATABASE_PASSWORD = "stream123"
+os.system('ping ' + host)
+'''
+
+
+def request(code=CODE):
+    return server.ScanRequest(code=code, language='python', project_context='tests', scan_profile='full')
+
+
+def parse(body: str, sse: bool):
+    if not sse:
+        return [(frame['event'], frame['data']) for frame in map(json.loads, body.splitlines())]
+    frames = []
+    for block in body.strip().split('\n\n'):
+        event, data = block.split('\n')
+        assert event.startswith('event: ') and data.startswith('data: ')
+        frames.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return frames
+
+
+@pytest.mark.parametrize('params,headers,sse', [
+    ({}, {}, False),
+    ({'format': 'ndjson'}, {'accept': 'text/event-stream'}, False),
+    ({}, {'accept': 'text/event-stream'}, True),
+    ({'format': 'sse'}, {}, True),
+])
+def test_frames_arrive_in_order(memory_db, params, headers, sse):
+    client = TestClient(server.app)
+    response = client.post('/api/scan/analyze/stream', params=params, headers=headers, json=request().model_dump())
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream' if sse else 'application/x-ndjson')
+    frames = parse(response.text, sse)
+    events = [event for event, _ in frames]
+    detected = frames[0][1]['detected']
+    assert detected >= 3
+    assert events == ['scan'] + ['finding'] * detected + ['vulnerability'] * detected + ['summary']
+    assert [data['index'] for event, data in frames if event == 'finding'] == list(range(detected))
+
+    scan_id = response.headers['X-Scan-Id']
+    summary = frames[-1][1]
+    assert summary['scan_id'] == scan_id and summary['status'] == 'complete'
+    stored = client.get(f'/api/scan/{scan_id}').json()
+    assert stored['status'] == 'complete'
+    assert {key: stored[key] for key in summary} == summary
+    enriched = sorted((data['index'], data['vulnerability']) for event, data in frames if event == 'vulnerability')
+    assert stored['vulnerabilities'] == [vuln for _, vuln in enriched]
+
+
+def test_unknown_format_is_refused(memory_db):
+    response = TestClient(server.app).post('/api/scan/analyze/stream', params={'format': 'xml'}, json=request().model_dump())
+    assert response.status_code == 400
+
+
+class RecordingQueue(asyncio.Queue):
+    """Notes the stored scan's status and progress as each frame is sent"""
+
+    def __init__(self, database):
+        super().__init__()
+        self.database = database
+        self.sent = []
+
+    async def put(self, item):
+        if item is not None:
+            event, _ = item
+            doc = next((doc for doc in self.database.scans.docs if doc['scan_id'] == 'stream'), {})
+            self.sent.append((event, doc.get('status'), doc.get('progress', {}).get('enriched')))
+        await super().put(item)
+
+
+def test_progress_is_persisted_before_each_frame(memory_db, monkeypatch):
+    # One call per finding, so each enrichment is its own step
+    monkeypatch.setattr(server, 'AI_BATCH_SIZE', 1)
+    queue = RecordingQueue(memory_db)
+    asyncio.run(server.run_streaming_scan('stream', request(), queue))
+    detected = sum(event == 'finding' for event, _, _ in queue.sent)
+    assert detected >= 3
+    assert queue.sent == (
+        [('scan', 'running', 0)]
+        + [('finding', 'running', 0)] * detected
+        + [('vulnerability', 'running', n) for n in range(1, detected + 1)]
+        + [('summary', 'complete', detected)]
+    )
+
+
+@pytest.mark.parametrize('store_fails', [False, True])
+def test_failed_scan_sends_an_error_frame(memory_db, monkeypatch, store_fails):
+    async def broken(*args, **kwargs):
+        raise RuntimeError('enrichment broke')
+
+    monkeypatch.setattr(server, 'enrich_vulnerabilities', broken)
+    if store_fails:
+        async def update_failed(*args, **kwargs):
+            raise ConnectionError('database unavailable')
+
+        monkeypatch.setattr(server.scan_store, 'update_scan', update_failed)
+    client = TestClient(server.app)
+    response = client.post('/api/scan/analyze/stream', json=request().model_dump())
+    frames = parse(response.text, False)
+    scan_id = response.headers['X-Scan-Id']
+    assert frames[-1] == ('error', {'scan_id': scan_id, 'detail': 'enrichment broke'})
+    assert client.get(f'/api/scan/{scan_id}').json()['status'] == ('running' if store_fails else 'failed')